@@ -1,229 +1,111 @@
+"""
+Tokens/sec and peak RSS per cache type, for the PC and the Raspberry Pi,
+read from the sweep results store (scripts/sweep.py):
+
+  python scripts/sweep.py --prompt_lengths 128 --new_tokens 64
+  python plot.py --prompt_len 128 --new_tokens 64
+
+One point of the sweep grid is plotted per host (default: the longest
+prompt, and the longest generation at it, that the host measured),
+averaged over repetitions.
+
+data/sweeps/results.csv ships with the earlier PC and Pi measurements
+(hosts legacy-{pc,pi}-fixed, legacy-{pc,pi}-interactive and
+legacy-{pc,pi}-length; prompt and generation lengths were not recorded
+for the first two), so the plots work before any sweep is run:
+
+  python plot.py --cpu_host legacy-pc-fixed --pi_host legacy-pi-fixed
+"""
+
+import os, sys
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, "src"))
+
+import argparse
+
 import matplotlib.pyplot as plt
 
-cache_types = ["None", "Sliding", "Paged", "Quantized"]
-tokens_sec = [42.99, 45.86, 43.30, 39.98]
-
-plt.figure(figsize=(6,4))
-plt.bar(cache_types, tokens_sec)
-plt.title("Tokens/sec vs Cache Type (Baseline CPU)")
-plt.xlabel("Cache Type")
-plt.ylabel("Tokens/sec")
-plt.tight_layout()
-plt.show()
-
-cache_types = ["None", "Sliding", "Paged", "Quantized"]
-rss = [648.05, 693.80, 693.84, 653.15]
-
-plt.figure(figsize=(6,4))
-plt.bar(cache_types, rss)
-plt.title("Peak RSS (MB) vs Cache Type (Baseline CPU)")
-plt.xlabel("Cache Type")
-plt.ylabel("Peak RSS (MB)")
-plt.tight_layout()
-plt.show()
-
-# Data from CPU interactive benchmark
-cache_types = ["None", "Sliding", "Paged", "Quantized"]
-tokens_sec = [108.49, 132.83, 117.38, 38.88]
-
-plt.figure(figsize=(6, 4))
-bars = plt.bar(cache_types, tokens_sec)
-
-plt.title("Tokens/sec vs Cache Type (CPU Interactive)", fontsize=12)
-plt.xlabel("Cache Type")
-plt.ylabel("Tokens/sec")
-plt.grid(axis="y", linestyle="--", alpha=0.5)
-
-# Annotate values above bars
-for bar in bars:
-    height = bar.get_height()
-    plt.text(
-        bar.get_x() + bar.get_width() / 2,
-        height + 2,
-        f"{height:.2f}",
-        ha="center",
-        va="bottom",
-        fontsize=9,
-    )
-
-plt.tight_layout()
-plt.savefig("tokens_sec_vs_cache_cpu_interactive.png", dpi=300)
-plt.show()
-
-# Data from CPU interactive benchmark
-cache_types = ["None", "Sliding", "Paged", "Quantized"]
-rss_values = [1577.8, 1578.4, 1576.9, 1289.0]
-
-plt.figure(figsize=(6, 4))
-bars = plt.bar(cache_types, rss_values)
-
-plt.title("Peak RSS vs Cache Type (CPU Interactive)", fontsize=12)
-plt.xlabel("Cache Type")
-plt.ylabel("Peak RSS (MB)")
-plt.grid(axis="y", linestyle="--", alpha=0.5)
-
-# Annotate values above bars
-for bar in bars:
-    height = bar.get_height()
-    plt.text(
-        bar.get_x() + bar.get_width() / 2,
-        height + 5,
-        f"{height:.1f}",
-        ha="center",
-        va="bottom",
-        fontsize=9,
-    )
-
-plt.tight_layout()
-plt.savefig("peak_rss_vs_cache_cpu_interactive.png", dpi=300)
-plt.show()
-
-# Raspberry Pi interactive tokens/sec results
-cache_types = ["None", "Sliding", "Paged", "Quantized"]
-tokens_sec = [8.77, 8.80, 8.85, 8.71]
-
-plt.figure(figsize=(6, 4))
-bars = plt.bar(cache_types, tokens_sec, color=["#4C72B0"])
-
-plt.title("Raspberry Pi: Tokens/sec vs Cache Type", fontsize=12)
-plt.xlabel("Cache Type", fontsize=11)
-plt.ylabel("Tokens/sec", fontsize=11)
-plt.grid(axis="y", linestyle="--", alpha=0.5)
-
-# Annotate bars with numeric values
-for bar in bars:
-    height = bar.get_height()
-    plt.text(
-        bar.get_x() + bar.get_width() / 2,
-        height + 0.05,
-        f"{height:.2f}",
-        ha="center",
-        va="bottom",
-        fontsize=9,
-    )
-
-plt.tight_layout()
-plt.savefig("tokens_sec_vs_cache_pi.png", dpi=300)
-plt.show()
-
-# Raspberry Pi interactive RSS results
-cache_types = ["None", "Sliding", "Paged", "Quantized"]
-rss_mb = [685.1, 684.8, 685.1, 686.1]
-
-plt.figure(figsize=(6, 4))
-bars = plt.bar(cache_types, rss_mb, color=["#DD8452"])
-
-plt.title("Raspberry Pi: Peak RSS vs Cache Type", fontsize=12)
-plt.xlabel("Cache Type", fontsize=11)
-plt.ylabel("Peak RSS (MB)", fontsize=11)
-plt.grid(axis="y", linestyle="--", alpha=0.5)
-
-# Annotate bars with numeric values
-for bar in bars:
-    height = bar.get_height()
-    plt.text(
-        bar.get_x() + bar.get_width() / 2,
-        height + 0.2,
-        f"{height:.1f}",
-        ha="center",
-        va="bottom",
-        fontsize=9,
-    )
-
-plt.tight_layout()
-plt.savefig("peak_rss_vs_cache_pi.png", dpi=300)
-plt.show()
-
-# Raspberry Pi interactive results
-cache_types = ["None", "Sliding", "Paged", "Quantized"]
-
-rss_mb = [685.1, 684.8, 685.1, 686.1]
-tokens_sec = [8.77, 8.80, 8.85, 8.71]
-
-fig, axes = plt.subplots(1, 2, figsize=(10, 4))
-
-# --- Subplot 1: Peak RSS ---
-ax = axes[0]
-bars = ax.bar(cache_types, rss_mb, color="#DD8452")
-ax.set_title("Peak RSS vs Cache Type (Pi)", fontsize=12)
-ax.set_ylabel("Peak RSS (MB)", fontsize=11)
-ax.grid(axis="y", linestyle="--", alpha=0.5)
-
-# Annotate values
-for bar in bars:
-    height = bar.get_height()
-    ax.text(
-        bar.get_x() + bar.get_width()/2,
-        height + 0.2,
-        f"{height:.1f}",
-        ha="center",
-        va="bottom",
-        fontsize=9
-    )
-
-# --- Subplot 2: Tokens/sec ---
-ax = axes[1]
-bars = ax.bar(cache_types, tokens_sec, color="#4C72B0")
-ax.set_title("Tokens/sec vs Cache Type (Pi)", fontsize=12)
-ax.set_ylabel("Tokens/sec", fontsize=11)
-ax.grid(axis="y", linestyle="--", alpha=0.5)
-
-# Annotate values
-for bar in bars:
-    height = bar.get_height()
-    ax.text(
-        bar.get_x() + bar.get_width()/2,
-        height + 0.05,
-        f"{height:.2f}",
-        ha="center",
-        va="bottom",
-        fontsize=9
-    )
-
-plt.tight_layout()
-plt.savefig("pi_memory_and_speed.png", dpi=300)
-plt.show()
-
-cache_types = ["None", "Sliding", "Paged", "Quantized"]
-rss_mb = [685.38, 701.83, 701.72, 691.58]
-
-plt.figure(figsize=(6,4))
-bars = plt.bar(cache_types, rss_mb, color="#DD8452")
-
-plt.title("Raspberry Pi (Fixed Prompt): Peak RSS vs Cache Type", fontsize=12)
-plt.xlabel("Cache Type")
-plt.ylabel("Peak RSS (MB)")
-plt.grid(axis="y", linestyle="--", alpha=0.4)
-
-for bar in bars:
-    height = bar.get_height()
-    plt.text(bar.get_x() + bar.get_width()/2,
-             height + 0.5,
-             f"{height:.2f}",
-             ha="center", fontsize=9)
-
-plt.tight_layout()
-plt.savefig("peak_rss_vs_cache_pi_fixed.png", dpi=300)
-plt.show()
-
-cache_types = ["None", "Sliding", "Paged", "Quantized"]
-tokens_sec = [8.74, 8.51, 8.70, 8.48]
-
-plt.figure(figsize=(6,4))
-bars = plt.bar(cache_types, tokens_sec, color="#4C72B0")
-
-plt.title("Raspberry Pi (Fixed Prompt): Tokens/sec vs Cache Type", fontsize=12)
-plt.xlabel("Cache Type")
-plt.ylabel("Tokens/sec")
-plt.grid(axis="y", linestyle="--", alpha=0.4)
-
-for bar in bars:
-    height = bar.get_height()
-    plt.text(bar.get_x() + bar.get_width()/2,
-             height + 0.05,
-             f"{height:.2f}",
-             ha="center", fontsize=9)
-
-plt.tight_layout()
-plt.savefig("tokens_sec_vs_cache_pi_fixed.png", dpi=300)
-plt.show()
\ No newline at end of file
+from utils.results_store import DEFAULT_RESULTS_PATH, by_cache, longest, pick_host, read_results, select
+
+
+def annotate(ax, bars, fmt: str) -> None:
+    # Value above each bar
+    for bar in bars:
+        height = bar.get_height()
+        ax.text(
+            bar.get_x() + bar.get_width() / 2,
+            height,
+            format(height, fmt),
+            ha="center",
+            va="bottom",
+            fontsize=9,
+        )
+
+
+def bar_chart(ax, rows, value: str, title: str, ylabel: str, color: str, fmt: str) -> None:
+    caches, values = by_cache(rows, value)
+    bars = ax.bar([c.capitalize() for c in caches], values, color=color)
+    ax.set_title(title, fontsize=12)
+    ax.set_xlabel("Cache Type")
+    ax.set_ylabel(ylabel)
+    ax.grid(axis="y", linestyle="--", alpha=0.5)
+    annotate(ax, bars, fmt)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Tokens/sec and peak RSS vs cache type, from sweep results")
+    parser.add_argument("--results", default=os.path.join(ROOT, DEFAULT_RESULTS_PATH), help="Sweep results (.csv / .parquet)")
+    parser.add_argument("--prompt_len", type=int, default=None, help="Sweep point to plot (default: longest on each host)")
+    parser.add_argument("--new_tokens", type=int, default=None, help="Sweep point to plot (default: longest on each host)")
+    parser.add_argument("--dtype", default="float32")
+    parser.add_argument("--threads", type=int, default=None, help="Thread count to plot (default: all rows)")
+    parser.add_argument("--cpu_host", default=None, help="Host column of the PC rows (default: latest non-ARM host)")
+    parser.add_argument("--pi_host", default=None, help="Host column of the Pi rows (default: latest ARM host)")
+    parser.add_argument("--out_dir", default=".", help="Where the PNGs are written")
+    parser.add_argument("--show", action="store_true", help="Also open the figures")
+    args = parser.parse_args()
+
+    rows = select(read_results(args.results), dtype=args.dtype, threads=args.threads)
+    if not rows:
+        sys.exit(f"No {args.dtype} results in {args.results}; run scripts/sweep.py first")
+    measured = [r for r in rows if r.get("tokens_per_s") is not None]
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    for tag, name, host in [
+        ("cpu", "CPU", pick_host(measured, pi=False, host=args.cpu_host)),
+        ("pi", "Raspberry Pi", pick_host(measured, pi=True, host=args.pi_host)),
+    ]:
+        host_rows = select(rows, host=host) if host else []
+        prompt_len = args.prompt_len or longest(host_rows, "prompt_len")
+        new_tokens = args.new_tokens or longest(select(host_rows, prompt_len=prompt_len), "new_tokens")
+        host_rows = select(host_rows, prompt_len=prompt_len, new_tokens=new_tokens)
+        point = f"prompt {prompt_len or 'n/a'}, {new_tokens or 'n/a'} new tokens"
+        if not host_rows:
+            print(f"No {name} rows for {point}; skipped")
+            continue
+
+        fig, ax = plt.subplots(figsize=(6, 4))
+        bar_chart(ax, host_rows, "tokens_per_s", f"{name}: Tokens/sec vs Cache Type", "Tokens/sec", "#4C72B0", ".2f")
+        fig.tight_layout()
+        fig.savefig(os.path.join(args.out_dir, f"tokens_sec_vs_cache_{tag}.png"), dpi=300)
+
+        fig, ax = plt.subplots(figsize=(6, 4))
+        bar_chart(ax, host_rows, "rss_peak_mb", f"{name}: Peak RSS vs Cache Type", "Peak RSS (MB)", "#DD8452", ".1f")
+        fig.tight_layout()
+        fig.savefig(os.path.join(args.out_dir, f"peak_rss_vs_cache_{tag}.png"), dpi=300)
+
+        # Memory and speed side by side
+        fig, axes = plt.subplots(1, 2, figsize=(10, 4))
+        bar_chart(axes[0], host_rows, "rss_peak_mb", f"Peak RSS vs Cache Type ({name})", "Peak RSS (MB)", "#DD8452", ".1f")
+        bar_chart(axes[1], host_rows, "tokens_per_s", f"Tokens/sec vs Cache Type ({name})", "Tokens/sec", "#4C72B0", ".2f")
+        fig.suptitle(f"{host} - {point}", fontsize=9)
+        fig.tight_layout()
+        fig.savefig(os.path.join(args.out_dir, f"{tag}_memory_and_speed.png"), dpi=300)
+        print(f"{name} ({host}): figures written to {args.out_dir}")
+
+    if args.show:
+        plt.show()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,78 +1,98 @@
+"""
+Tokens/sec and peak RSS per cache type, PC next to Raspberry Pi, read from
+the sweep results store (scripts/sweep.py run on both machines into the
+same file):
+
+  python plot_cpu_pi_comparison.py --prompt_len 128 --new_tokens 64
+
+Without a sweep it plots the earlier measurements committed in
+data/sweeps/results.csv (see plot.py).
+"""
+
+import os, sys
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, "src"))
+
+import argparse
+
 import matplotlib.pyplot as plt
 import numpy as np
 
-# Cache types (x-axis groups)
-cache_types = ["None", "Sliding", "Paged", "Quantized"]
-x = np.arange(len(cache_types))
-width = 0.35  # width of each bar
-
-# CPU results (fixed prompt)
-cpu_tokens = [42.99, 45.86, 43.30, 39.98]
-cpu_rss =    [648.05, 693.80, 693.84, 653.15]
-
-# Pi results (fixed prompt)
-pi_tokens =  [8.74, 8.51, 8.70, 8.48]
-pi_rss =     [685.38, 701.83, 701.72, 691.58]
-
-# --- Create figure with two subplots ---
-fig, axes = plt.subplots(1, 2, figsize=(12, 4))
-
-# -----------------------------
-# Subplot 1: Tokens/sec
-# -----------------------------
-ax = axes[0]
-bars1 = ax.bar(x - width/2, cpu_tokens, width, label="CPU", color="#4C72B0")
-bars2 = ax.bar(x + width/2, pi_tokens,  width, label="Pi",  color="#DD8452")
-
-ax.set_title("Tokens/sec: CPU vs Raspberry Pi", fontsize=12)
-ax.set_xlabel("Cache Type")
-ax.set_ylabel("Tokens/sec")
-ax.set_xticks(x)
-ax.set_xticklabels(cache_types)
-ax.grid(axis="y", linestyle="--", alpha=0.4)
-ax.legend()
-
-# Annotate bars
-for bars in [bars1, bars2]:
-    for bar in bars:
-        y = bar.get_height()
-        ax.text(
-            bar.get_x() + bar.get_width()/2,
-            y + 0.5,
-            f"{y:.1f}",
-            ha="center",
-            va="bottom",
-            fontsize=8
-        )
-
-# -----------------------------
-# Subplot 2: Peak RSS (MB)
-# -----------------------------
-ax = axes[1]
-bars3 = ax.bar(x - width/2, cpu_rss, width, label="CPU", color="#4C72B0")
-bars4 = ax.bar(x + width/2, pi_rss,  width, label="Pi",  color="#DD8452")
-
-ax.set_title("Peak RSS (MB): CPU vs Raspberry Pi", fontsize=12)
-ax.set_xlabel("Cache Type")
-ax.set_ylabel("Peak RSS (MB)")
-ax.set_xticks(x)
-ax.set_xticklabels(cache_types)
-ax.grid(axis="y", linestyle="--", alpha=0.4)
-ax.legend()
-
-# Annotate bars
-for bars in [bars3, bars4]:
-    for bar in bars:
-        y = bar.get_height()
-        ax.text(
-            bar.get_x() + bar.get_width()/2,
-            y + 3,
-            f"{y:.1f}",
-            ha="center",
-            va="bottom",
-            fontsize=8
-        )
-
-plt.tight_layout()
-plt.savefig("cpu_vs_pi_comparison.png", dpi=300)
-plt.show()
+from utils.results_store import DEFAULT_RESULTS_PATH, by_cache, longest, pick_host, read_results, select
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="CPU vs Raspberry Pi per cache type, from sweep results")
+    parser.add_argument("--results", default=os.path.join(ROOT, DEFAULT_RESULTS_PATH), help="Sweep results (.csv / .parquet)")
+    parser.add_argument("--prompt_len", type=int, default=None, help="Sweep point to plot (default: longest on the hosts)")
+    parser.add_argument("--new_tokens", type=int, default=None, help="Sweep point to plot (default: longest on the hosts)")
+    parser.add_argument("--dtype", default="float32")
+    parser.add_argument("--threads", type=int, default=None, help="Thread count to plot (default: all rows)")
+    parser.add_argument("--cpu_host", default=None, help="Host column of the PC rows (default: latest non-ARM host)")
+    parser.add_argument("--pi_host", default=None, help="Host column of the Pi rows (default: latest ARM host)")
+    parser.add_argument("--out", default="cpu_vs_pi_comparison.png")
+    parser.add_argument("--show", action="store_true", help="Also open the figure")
+    args = parser.parse_args()
+
+    rows = select(read_results(args.results), dtype=args.dtype, threads=args.threads)
+    if not rows:
+        sys.exit(f"No {args.dtype} results in {args.results}; run scripts/sweep.py first")
+    measured = [r for r in rows if r.get("tokens_per_s") is not None]
+    hosts = {
+        "CPU": pick_host(measured, pi=False, host=args.cpu_host),
+        "Pi": pick_host(measured, pi=True, host=args.pi_host),
+    }
+    rows = [r for r in rows if r.get("host") in hosts.values()]
+    prompt_len = args.prompt_len or longest(rows, "prompt_len")
+    new_tokens = args.new_tokens or longest(select(rows, prompt_len=prompt_len), "new_tokens")
+    rows = select(rows, prompt_len=prompt_len, new_tokens=new_tokens)
+
+    series = {name: select(rows, host=host) for name, host in hosts.items() if host}
+    series = {name: host_rows for name, host_rows in series.items() if host_rows}
+    if not series:
+        sys.exit(f"No results for prompt {prompt_len}, {new_tokens} new tokens")
+
+    # Cache types measured on any of the hosts (x-axis groups)
+    cache_types = []
+    for host_rows in series.values():
+        cache_types += [c for c in by_cache(host_rows, "tokens_per_s")[0] if c not in cache_types]
+    x = np.arange(len(cache_types))
+    width = 0.8 / len(series)  # width of each bar
+    colors = {"CPU": "#4C72B0", "Pi": "#DD8452"}
+
+    # --- Create figure with two subplots ---
+    fig, axes = plt.subplots(1, 2, figsize=(12, 4))
+    for ax, value, title, ylabel, fmt in [
+        (axes[0], "tokens_per_s", "Tokens/sec: CPU vs Raspberry Pi", "Tokens/sec", ".1f"),
+        (axes[1], "rss_peak_mb", "Peak RSS (MB): CPU vs Raspberry Pi", "Peak RSS (MB)", ".1f"),
+    ]:
+        for i, (name, host_rows) in enumerate(series.items()):
+            caches, values = by_cache(host_rows, value)
+            means = dict(zip(caches, values))
+            offset = (i - (len(series) - 1) / 2) * width
+            bars = ax.bar(
+                x + offset, [means.get(c, 0.0) for c in cache_types], width, label=name, color=colors[name]
+            )
+            # Annotate bars
+            for bar in bars:
+                y = bar.get_height()
+                ax.text(bar.get_x() + bar.get_width() / 2, y, format(y, fmt), ha="center", va="bottom", fontsize=8)
+
+        ax.set_title(title, fontsize=12)
+        ax.set_xlabel("Cache Type")
+        ax.set_ylabel(ylabel)
+        ax.set_xticks(x)
+        ax.set_xticklabels([c.capitalize() for c in cache_types])
+        ax.grid(axis="y", linestyle="--", alpha=0.4)
+        ax.legend()
+
+    fig.suptitle(f"prompt {prompt_len or 'n/a'}, {new_tokens or 'n/a'} new tokens, {args.dtype}", fontsize=9)
+    fig.tight_layout()
+    fig.savefig(args.out, dpi=300)
+    print(f"Written to {args.out} ({', '.join(f'{n}: {h}' for n, h in hosts.items() if h)})")
+    if args.show:
+        plt.show()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,78 @@
+"""
+Peak RSS vs sequence length, one line per cache type, read from the sweep
+results store (scripts/sweep.py). Each point is its own fresh process, so
+the lines show what a reply of that length costs, not what earlier points
+left behind:
+
+  python scripts/sweep.py --prompt_lengths 16 --new_tokens 16,32,64,128,256
+  python plot_mem_vs_length_all.py                 # PC rows
+  python plot_mem_vs_length_pi.py                  # Raspberry Pi rows
+
+--x new_tokens (default) plots generated length at the shortest prompt
+measured; --x prompt_len plots prompt length at the shortest generation.
+The default host is the latest one that measured more than one length;
+without a sweep that is the earlier legacy-{pc,pi}-length series
+committed in data/sweeps/results.csv.
+"""
+
+import os, sys
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, "src"))
+
+import argparse
+from typing import Dict
+
 import matplotlib.pyplot as plt
 
-# Data from your sweeps
-lengths = [16, 32, 64, 128, 256]
+from utils.results_store import CACHE_TYPES, DEFAULT_RESULTS_PATH, mean_by, pick_host, read_results, select
+
+
+def main(pi: bool = False) -> None:
+    name = "Raspberry Pi" if pi else "CPU"
+    parser = argparse.ArgumentParser(description=f"{name}: peak RSS vs sequence length, from sweep results")
+    parser.add_argument("--results", default=os.path.join(ROOT, DEFAULT_RESULTS_PATH), help="Sweep results (.csv / .parquet)")
+    parser.add_argument("--x", default="new_tokens", choices=["new_tokens", "prompt_len"], help="Length on the x-axis")
+    parser.add_argument("--fixed", type=int, default=None, help="Value of the other length (default: shortest)")
+    parser.add_argument("--metric", default="rss_peak_mb", help="Column to plot (e.g. rss_peak_decode_mb, kv_bytes)")
+    parser.add_argument("--dtype", default="float32")
+    parser.add_argument("--threads", type=int, default=None, help="Thread count to plot (default: all rows)")
+    parser.add_argument("--host", default=None, help="Host column to plot (default: latest ARM / non-ARM host with several lengths)")
+    parser.add_argument("--out", default="memory_vs_length_pi_all.png" if pi else "memory_vs_length_cpu_all.png")
+    parser.add_argument("--show", action="store_true", help="Also open the figure")
+    args = parser.parse_args()
+
+    rows = select(read_results(args.results), dtype=args.dtype, threads=args.threads)
+    lengths: Dict[str, set] = {}
+    for r in rows:
+        if r.get(args.x) is not None:
+            lengths.setdefault(r.get("host"), set()).add(r[args.x])
+    host = pick_host([r for r in rows if len(lengths.get(r.get("host"), ())) > 1], pi=pi, host=args.host)
+    rows = select(rows, host=host) if host else []
+    if not rows:
+        sys.exit(f"No {name} {args.dtype} results in {args.results}; run scripts/sweep.py first")
+    other = "prompt_len" if args.x == "new_tokens" else "new_tokens"
+    fixed = args.fixed or min((r[other] for r in rows if r.get(other) is not None), default=None)
+    means = mean_by(select(rows, **{other: fixed}), ["cache", args.x], args.metric)
 
-none_rss =      [1283.33, 1284.20, 1284.81, 1287.25, 1294.93]
-sliding_rss =   [1284.80, 1285.67, 1286.19, 1288.28, 1296.33]
-paged_rss =     [1282.28, 1283.28, 1283.98, 1285.95, 1293.99]
-quantized_rss = [1286.64, 1287.71, 1291.50, 1301.15, 1321.29]
+    plt.figure(figsize=(7, 5))
+    caches = sorted({c for c, _ in means}, key=lambda c: CACHE_TYPES.index(c) if c in CACHE_TYPES else len(CACHE_TYPES))
+    for cache in caches:
+        points = sorted((x, v) for (c, x), v in means.items() if c == cache)
+        plt.plot([x for x, _ in points], [v for _, v in points], marker="o", label=cache.capitalize())
 
-plt.figure(figsize=(7,5))
+    xlabel = "Generated Length (tokens)" if args.x == "new_tokens" else "Prompt Length (tokens)"
+    plt.title(f"{name}: Memory Consumption vs Sequence Length", fontsize=12)
+    plt.xlabel(f"{xlabel}, {other} = {fixed}", fontsize=11)
+    plt.ylabel("Peak RSS (MB)" if args.metric == "rss_peak_mb" else args.metric, fontsize=11)
+    plt.grid(True, linestyle="--", alpha=0.5)
+    plt.legend()
+    plt.tight_layout()
 
-plt.plot(lengths, none_rss,      marker='o', label='None')
-plt.plot(lengths, sliding_rss,   marker='o', label='Sliding')
-plt.plot(lengths, paged_rss,     marker='o', label='Paged')
-plt.plot(lengths, quantized_rss, marker='o', label='Quantized')
+    plt.savefig(args.out, dpi=300)
+    print(f"{name} ({host}): written to {args.out}")
+    if args.show:
+        plt.show()
 
-plt.title("Memory Consumption vs Sequence Length (CPU)")
-plt.xlabel("Sequence Length (tokens)")
-plt.ylabel("Peak RSS (MB)")
-plt.grid(True, linestyle="--", alpha=0.5)
-plt.legend()
-plt.tight_layout()
 
-plt.savefig("memory_vs_length_cpu_all.png", dpi=300)
-plt.show()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Aggregate decode throughput vs number of concurrent sessions.
+
+For each session count N, N requests are generated one after another with
+HFBackend (the current single-sequence path) and then together through the
+continuous-batching BatchScheduler; the requests arrive staggered so rows
+join and leave the batch mid-flight:
+
+  python scripts/batch_throughput.py --model_name distilgpt2 --sessions 1,2,4,8
+"""
+import os, sys
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "src"))
+
+import argparse
+import json
+import time
+
+import torch
+
+from inference.transformers_backend import HFBackend
+from inference.batch_scheduler import BatchScheduler
+
+PROMPTS = [
+    "What is a Raspberry Pi?",
+    "Explain Transformer architecture in neural network.",
+    "Describe sliding-window vs paged cache vs quantized Cache.",
+    "Why does a KV cache make decoding faster?",
+]
+
+
+def run_sequential(backend: HFBackend, prompts: list, max_new_tokens: int) -> float:
+    t0 = time.time()
+    tokens = 0
+    for ids in prompts:
+        out, _ = backend.generate_ids(
+            torch.tensor([ids], device=backend.device), max_new_tokens=max_new_tokens, temperature=0.0
+        )
+        tokens += len(out)
+    return tokens / (time.time() - t0)
+
+
+def run_batched(backend: HFBackend, prompts: list, max_new_tokens: int, stagger: int) -> float:
+    scheduler = BatchScheduler(backend, max_batch=len(prompts))
+    t0 = time.time()
+    for i, ids in enumerate(prompts):
+        scheduler.submit(ids, max_new_tokens=max_new_tokens, temperature=0.0)
+        for _ in range(stagger if i < len(prompts) - 1 else 0):
+            scheduler.step()
+    scheduler.run()
+    return scheduler.tokens_out / (time.time() - t0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_name", default="distilgpt2")
+    parser.add_argument("--sessions", default="1,2,4,8", help="Comma-separated session counts")
+    parser.add_argument("--max_new_tokens", type=int, default=64)
+    parser.add_argument("--stagger", type=int, default=4, help="Decode steps between arrivals")
+    parser.add_argument("--out", type=str, default=None, help="Optional JSON output path")
+    args = parser.parse_args()
+
+    backend = HFBackend(model_name=args.model_name, max_ctx=512)
+    print(f"threads={torch.get_num_threads()} max_new_tokens={args.max_new_tokens}")
+
+    # warmup
+    run_sequential(backend, [backend.encode(PROMPTS[0])], 4)
+
+    rows = []
+    print(f"{'sessions':>8} {'sequential tok/s':>17} {'batched tok/s':>14} {'speedup':>8}")
+    for n in [int(x) for x in args.sessions.split(",") if x.strip()]:
+        prompts = [backend.encode(PROMPTS[i % len(PROMPTS)]) for i in range(n)]
+        seq = run_sequential(backend, prompts, args.max_new_tokens)
+        bat = run_batched(backend, prompts, args.max_new_tokens, args.stagger)
+        rows.append({"sessions": n, "sequential_tok_s": round(seq, 2), "batched_tok_s": round(bat, 2)})
+        print(f"{n:>8} {seq:>17.2f} {bat:>14.2f} {bat / seq:>7.2f}x")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"model_name": args.model_name, "results": rows}, f, indent=2)
+        print(f"Saved {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+Benchmark harness: fixed prompts x context-length grid x cache strategy.
+
+Every measured reply reports
+  - ttft_s:    request start (prompt building + tokenization) -> first token
+  - prefill_s: the prompt forward pass (+ sampling the first token)
+  - per-token decode latency (gaps between later tokens), p50/p95/p99
+  - generated tokens, counted as sampled ids (not by re-tokenizing text)
+after --warmup unmeasured replies per configuration. Decoding is greedy
+with no stop criteria, so every reply has exactly --max_new_tokens tokens
+and runs are comparable. Results go to a JSON file (--out, default
+data/bench/results-<time>.json) with the environment they were taken in.
+
+The context grid is the prompt token budget: sliding / paged caches are
+filled with conversation turns and cut to it by their own policy; none /
+quantized get one prompt of that many tokens.
+
+--model_name tiny-random builds a 2-layer GPT-2 with random weights and a
+small BPE tokenizer trained on the prompts (seeded, no download), so the
+suite runs offline in CI:
+
+  python scripts/bench_suite.py --model_name tiny-random --contexts 64,128 --runs 2
+  python scripts/bench_suite.py --model_name distilgpt2 --caches none,sliding,paged,quantized
+"""
+import os, sys
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "src"))
+
+import argparse
+import json
+import math
+import platform
+import statistics
+import time
+from typing import Any, Dict, List
+
+import psutil
+import torch
+
+PROMPTS = [
+    "What is a Raspberry Pi?",
+    "Explain Transformer architecture in neural network.",
+    "Describe sliding-window vs paged cache vs quantized Cache.",
+    "Why does a KV cache make decoding faster?",
+]
+
+# Earlier conversation used to fill the context up to each grid length
+FILLER_TURNS = [
+    ("How much memory does a Raspberry Pi 4 have?",
+     "The Raspberry Pi 4 comes with 1, 2, 4 or 8 GB of LPDDR4 memory."),
+    ("Can it run a language model?",
+     "Small models such as distilgpt2 or a 4-bit TinyLlama run on its CPU, slowly but usably."),
+    ("What limits the speed?",
+     "Memory bandwidth and the four Cortex-A72 cores; every generated token reads all weights once."),
+    ("And what limits the context length?",
+     "The KV cache grows with every token, so long chats need a window, paging or quantization."),
+]
+
+TINY_GPT2 = {"n_layer": 2, "n_head": 4, "n_embd": 64, "n_positions": 1024}
+TINY_VOCAB = 512
+
+
+def build_tiny_gpt2(out_dir: str, seed: int = 0) -> str:
+    """Random-weight GPT-2 + BPE tokenizer in out_dir (reused if already there)."""
+    if os.path.isfile(os.path.join(out_dir, "config.json")):
+        return out_dir
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import GPT2Config, GPT2LMHeadModel, PreTrainedTokenizerFast
+
+    tok = Tokenizer(models.BPE())
+    tok.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tok.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(
+        vocab_size=TINY_VOCAB,
+        special_tokens=["<|endoftext|>"],
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet(),
+    )
+    corpus = PROMPTS + [f"User: {u}\nAssistant: {a}" for u, a in FILLER_TURNS]
+    tok.train_from_iterator(corpus, trainer)
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=tok, bos_token="<|endoftext|>", eos_token="<|endoftext|>", unk_token="<|endoftext|>"
+    )
+
+    torch.manual_seed(seed)
+    eos = tok.token_to_id("<|endoftext|>")
+    config = GPT2Config(vocab_size=tok.get_vocab_size(), bos_token_id=eos, eos_token_id=eos, **TINY_GPT2)
+    os.makedirs(out_dir, exist_ok=True)
+    GPT2LMHeadModel(config).save_pretrained(out_dir)
+    tokenizer.save_pretrained(out_dir)
+    return out_dir
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0}
+    s = sorted(values)
+
+    def pct(p: float) -> float:
+        return s[max(0, math.ceil(p / 100 * len(s)) - 1)]   # nearest rank
+
+    return {"p50": pct(50), "p95": pct(95), "p99": pct(99), "mean": statistics.mean(s)}
+
+
+def make_cache(kind: str, ctx: int) -> Any:
+    from kv_cache.paged_cache import PagedCache
+    from kv_cache.quantized_cache import QuantizedKVCache
+    from kv_cache.sliding_window import SlidingWindowCache
+
+    if kind == "none":
+        return None
+    if kind == "sliding":
+        cache = SlidingWindowCache(max_tokens=ctx)
+    elif kind == "paged":
+        cache = PagedCache(max_turns=len(FILLER_TURNS) * 64, max_tokens=ctx)
+    elif kind == "quantized":
+        return QuantizedKVCache()
+    else:
+        raise ValueError(f"Unknown cache: {kind}")
+    # Enough history to fill any context length of the grid
+    for i in range(ctx // 16 + 1):
+        cache.add_turn(*FILLER_TURNS[i % len(FILLER_TURNS)])
+    return cache
+
+
+def history_text(ctx: int) -> str:
+    return "".join(f"User: {u}\nAssistant: {a}\n" for u, a in FILLER_TURNS * (ctx // 16 + 1))
+
+
+def run_reply(
+    backend: Any, kind: str, cache: Any, ctx: int, prompt: str, max_new_tokens: int, sampler: Any = None
+) -> Dict[str, Any]:
+    if sampler is not None:
+        sampler.phase("prefill")
+    t_start = time.perf_counter()
+    if kind in ("sliding", "paged"):
+        ids = cache.build_prompt_ids(backend, prompt)
+    else:
+        # One prompt of ctx tokens: most recent history + the question
+        question = backend.encode(f"User: {prompt}\nAssistant:")
+        ids = (backend.encode(history_text(ctx)) + question)[-ctx:]
+    input_ids, attention_mask, past_kv = backend.prepare(ids, max_new_tokens, cache)
+    loop = backend.iter_ids(
+        input_ids,
+        max_new_tokens=max_new_tokens,
+        temperature=0.0,
+        kv_cache=cache,
+        past_kv=past_kv,
+        attention_mask=attention_mask,
+    )
+    t0 = time.perf_counter()
+    stamps = []
+    for _ in loop:
+        stamps.append(time.perf_counter())
+        if sampler is not None and len(stamps) == 1:
+            sampler.phase("decode")
+    return {
+        "prompt_tokens": int(input_ids.shape[1]),
+        "tokens": len(stamps),
+        "ttft_s": stamps[0] - t_start if stamps else 0.0,
+        "prefill_s": stamps[0] - t0 if stamps else 0.0,
+        "decode_s": stamps[-1] - stamps[0] if stamps else 0.0,
+        "token_latencies_s": [b - a for a, b in zip(stamps, stamps[1:])],
+    }
+
+
+def run_config(
+    backend: Any, kind: str, ctx: int, runs: int, warmup: int, max_new_tokens: int
+) -> Dict[str, Any]:
+    """All prompts x runs for one (cache, context length); summary row."""
+    from utils.mem_accounting import RssSampler, kv_bytes
+
+    proc = psutil.Process()
+    cache = make_cache(kind, ctx)
+    for i in range(warmup):
+        run_reply(backend, kind, cache, ctx, PROMPTS[i % len(PROMPTS)], max_new_tokens)
+
+    # Peak RSS of the measured replies, by phase (sampled in the background)
+    sampler = RssSampler().start("prefill")
+    replies = []
+    for _ in range(runs):
+        for prompt in PROMPTS:
+            replies.append(run_reply(backend, kind, cache, ctx, prompt, max_new_tokens, sampler))
+    sampler.stop()
+    # KV of the last reply, where it outlives the loop (quantized store / static buffer)
+    holder = cache if kind == "quantized" else backend.static_kv
+    kv = kv_bytes(holder) if holder is not None else None
+
+    latencies = [x for r in replies for x in r["token_latencies_s"]]
+    tokens = sum(r["tokens"] for r in replies)
+    decode_s = sum(r["decode_s"] for r in replies)
+    decode_tokens = sum(max(r["tokens"] - 1, 0) for r in replies)
+    wall_s = sum(r["ttft_s"] + r["decode_s"] for r in replies)
+    ttft = percentiles([r["ttft_s"] for r in replies])
+    prefill = percentiles([r["prefill_s"] for r in replies])
+    tok = percentiles(latencies)
+    return {
+        "cache": kind,
+        "context": ctx,
+        "replies": len(replies),
+        "prompt_tokens_mean": round(statistics.mean(r["prompt_tokens"] for r in replies), 1),
+        "tokens": tokens,
+        "prefill_s_p50": round(prefill["p50"], 5),
+        "prefill_s_mean": round(prefill["mean"], 5),
+        "prefill_tokens_per_s": round(
+            sum(r["prompt_tokens"] for r in replies) / max(sum(r["prefill_s"] for r in replies), 1e-9), 1
+        ),
+        "ttft_s_p50": round(ttft["p50"], 5),
+        "ttft_s_p95": round(ttft["p95"], 5),
+        "ttft_s_p99": round(ttft["p99"], 5),
+        "token_latency_s_p50": round(tok["p50"], 6),
+        "token_latency_s_p95": round(tok["p95"], 6),
+        "token_latency_s_p99": round(tok["p99"], 6),
+        "decode_tokens_per_s": round(decode_tokens / max(decode_s, 1e-9), 2),
+        "end_to_end_tokens_per_s": round(tokens / max(wall_s, 1e-9), 2),
+        "rss_mb": round(proc.memory_info().rss / 1024**2, 1),
+        "rss_peak_prefill_mb": round(sampler.peaks.get("prefill", 0) / 1024**2, 1),
+        "rss_peak_decode_mb": round(sampler.peaks.get("decode", 0) / 1024**2, 1),
+        "rss_peak_mb": round(sampler.peak / 1024**2, 1),
+        "kv_bytes": kv["bytes"] if kv else None,
+        "kv_allocated_bytes": kv["allocated"] if kv else None,
+    }
+
+
+def environment(backend: Any, args: argparse.Namespace) -> Dict[str, Any]:
+    import transformers
+
+    cfg = backend.model.config
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "host": platform.node(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "transformers": transformers.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "cpu_profile": backend.cpu_profile is not None,
+        "prefill_chunk": backend.prefill_chunk,
+        "model_name": args.model_name,
+        "model_layers": cfg.num_hidden_layers,
+        "model_hidden": cfg.hidden_size,
+        "vocab_size": cfg.vocab_size,
+        "args": {k: v for k, v in vars(args).items() if k != "out"},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_name", default="distilgpt2", help="HF model, path, or 'tiny-random'")
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16", "int8"])
+    parser.add_argument("--caches", default="none,sliding,paged,quantized", help="Comma-separated cache strategies")
+    parser.add_argument("--contexts", default="64,128,256", help="Comma-separated prompt token budgets")
+    parser.add_argument("--max_new_tokens", type=int, default=32)
+    parser.add_argument("--runs", type=int, default=3, help="Measured passes over the prompt set per configuration")
+    parser.add_argument("--warmup", type=int, default=2, help="Unmeasured replies per configuration")
+    parser.add_argument("--static_kv", action="store_true", help="Preallocated KV buffer (HFBackend static_cache)")
+    parser.add_argument("--threads", type=int, default=0, help="torch threads (0 = default / CPU profile)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=str, default=None, help="Results JSON (default data/bench/results-<time>.json)")
+    args = parser.parse_args()
+
+    from inference.transformers_backend import HFBackend
+
+    torch.manual_seed(args.seed)
+    model_name = args.model_name
+    if model_name == "tiny-random":
+        model_name = build_tiny_gpt2(os.path.join(ROOT, "data", "bench", "tiny-gpt2"), args.seed)
+
+    contexts = [int(c) for c in args.contexts.split(",") if c]
+    backend = HFBackend(
+        model_name=model_name, max_ctx=max(contexts), dtype=args.dtype, static_cache=args.static_kv
+    )
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+
+    rows = []
+    print(f"{'cache':<10} {'ctx':>5} {'prompt':>6} {'prefill s':>10} {'ttft p50':>9} {'ttft p95':>9} "
+          f"{'tok p50 ms':>10} {'p95':>7} {'p99':>7} {'decode t/s':>10} {'peak MB':>8}")
+    for kind in [c for c in args.caches.split(",") if c]:
+        for ctx in contexts:
+            row = run_config(backend, kind, ctx, args.runs, args.warmup, args.max_new_tokens)
+            rows.append(row)
+            print(f"{kind:<10} {ctx:>5} {row['prompt_tokens_mean']:>6.0f} {row['prefill_s_p50']:>10.4f} "
+                  f"{row['ttft_s_p50']:>9.4f} {row['ttft_s_p95']:>9.4f} "
+                  f"{row['token_latency_s_p50'] * 1e3:>10.2f} {row['token_latency_s_p95'] * 1e3:>7.2f} "
+                  f"{row['token_latency_s_p99'] * 1e3:>7.2f} {row['decode_tokens_per_s']:>10.2f} {row['rss_peak_mb']:>8.1f}")
+
+    out = args.out or os.path.join(ROOT, "data", "bench", f"results-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({"environment": environment(backend, args), "results": rows}, f, indent=2)
+    print(f"Results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+"""
+Build a single-file model snapshot for a fast cold start.
+
+The snapshot holds the tokenizer files, the config and the weights; the
+backends memory-map it and build the model on the meta device, so later
+starts skip from_pretrained() and read weight pages only as they are used:
+
+  python scripts/build_snapshot.py --model_name distilgpt2 --out models/distilgpt2.snapshot
+  python src/app_cli.py --model_name models/distilgpt2.snapshot --benchmark
+"""
+import os, sys
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "src"))
+
+import argparse
+
+from inference.snapshot import save_snapshot
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_name", default="distilgpt2")
+    parser.add_argument("--out", default="models/distilgpt2.snapshot", help="Snapshot file (*.snapshot)")
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16"])
+    args = parser.parse_args()
+
+    path = save_snapshot(args.model_name, args.out, args.dtype)
+    print(f"Saved {path} ({os.path.getsize(path) / 1024**2:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
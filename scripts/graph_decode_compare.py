@@ -0,0 +1,116 @@
+"""
+Decode tokens/sec of the eager HF step vs the captured fixed-shape step
+(HFBackend graph_decode=True), at several CPU thread counts.
+
+Both modes use the same static KV buffer and greedy decoding on the
+app_cli benchmark prompts, so the generated ids must match; each
+(mode, threads) pair runs in its own subprocess. --threads 4 is the core
+count of a Raspberry Pi 4/5; on a bigger x86 host it also shows how much
+of the gain is per-token Python dispatch (which extra cores don't help).
+
+  python scripts/graph_decode_compare.py --model_name distilgpt2 --threads 1,4 --dtype int8
+"""
+import os, sys
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "src"))
+
+import argparse
+import json
+import subprocess
+import time
+
+PROMPTS = [
+    "What is a Raspberry Pi?",
+    "Explain Transformer architecture in neural network.",
+    "Describe sliding-window vs paged cache vs quantized Cache.",
+]
+
+
+def run_child(model_name: str, dtype: str, mode: str, threads: int, max_new_tokens: int) -> dict:
+    import torch
+    from inference.transformers_backend import HFBackend
+
+    torch.set_num_threads(threads)
+    backend = HFBackend(
+        model_name=model_name, dtype=dtype, static_cache=True, graph_decode=(mode == "graph")
+    )
+
+    def run(prompt: str, n: int) -> list:
+        input_ids, mask, past_kv = backend.prepare(prompt, n, None)
+        ids, _ = backend.generate_ids(
+            input_ids, max_new_tokens=n, temperature=0.0, past_kv=past_kv, attention_mask=mask
+        )
+        return ids
+
+    t0 = time.time()
+    run(PROMPTS[-1], max_new_tokens)   # warmup (captures every window used below, for graph)
+    warmup_s = time.time() - t0
+
+    outputs = []
+    t0 = time.time()
+    for prompt in PROMPTS:
+        outputs.append(run(prompt, max_new_tokens))
+    decode_s = time.time() - t0
+    tokens = sum(len(ids) for ids in outputs)
+    return {
+        "tokens_per_s": round(tokens / decode_s, 2),
+        "warmup_s": round(warmup_s, 3),
+        "captured": mode == "graph" and backend.graph_error is None,
+        "graph_error": backend.graph_error,
+        "ids": outputs,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_name", default="distilgpt2")
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16", "int8"])
+    parser.add_argument("--threads", default="1,4", help="Comma-separated torch thread counts")
+    parser.add_argument("--max_new_tokens", type=int, default=64)
+    parser.add_argument("--out", type=str, default=None, help="Optional JSON output path")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--child_threads", type=int, default=1, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        row = run_child(args.model_name, args.dtype, args.child, args.child_threads, args.max_new_tokens)
+        print(json.dumps(row))
+        return
+
+    print(f"host cores: {os.cpu_count()}")
+    rows = []
+    print(f"{'threads':>7} {'eager tok/s':>12} {'graph tok/s':>12} {'speedup':>8} {'same ids':>9}")
+    for threads in [int(t) for t in args.threads.split(",")]:
+        res = {}
+        for mode in ("eager", "graph"):
+            cmd = [sys.executable, os.path.abspath(__file__), "--child", mode,
+                   "--child_threads", str(threads), "--model_name", args.model_name,
+                   "--dtype", args.dtype, "--max_new_tokens", str(args.max_new_tokens)]
+            out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+            res[mode] = json.loads(out.strip().splitlines()[-1])
+        if res["graph"]["graph_error"]:
+            print(f"  capture failed, graph row ran eager: {res['graph']['graph_error']}")
+        eager, graph = res["eager"]["tokens_per_s"], res["graph"]["tokens_per_s"]
+        same = res["eager"]["ids"] == res["graph"]["ids"]
+        rows.append({
+            "threads": threads,
+            "eager_tokens_per_s": eager,
+            "graph_tokens_per_s": graph,
+            "speedup": round(graph / eager, 3) if eager else None,
+            "captured": res["graph"]["captured"],
+            "capture_warmup_s": res["graph"]["warmup_s"],
+            "same_ids": same,
+        })
+        print(f"{threads:>7} {eager:>12.2f} {graph:>12.2f} {graph / max(eager, 1e-9):>7.2f}x {str(same):>9}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(
+                {"model": args.model_name, "dtype": args.dtype, "host_cores": os.cpu_count(), "rows": rows},
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Accuracy / perplexity vs bytes for the KV-cache quantization schemes.
+
+Teacher-forces a text through the model one token at a time, with the
+past KV held in QuantizedKVCache (re-quantized after every step, or
+appended through as_cache() for the append-only schemes), and compares
+against the unquantized fp32 cache. "KV bytes" counts the codes, scales
+and float tail; "resident" is what is allocated at the last step,
+including spare capacity and the dequantized scratch, and the ratio to
+fp32 is taken from it:
+
+  python scripts/kv_quant_report.py --model_name distilgpt2 --tokens 256
+"""
+import os, sys
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "src"))
+
+import argparse
+import json
+import math
+
+import torch
+
+from inference.transformers_backend import HFBackend
+from kv_cache.hf_compat import to_layers, to_model_cache
+from kv_cache.quantized_cache import QuantizedKVCache
+
+SCHEMES = {
+    "fp32": None,
+    "tensor-int8": dict(scheme="tensor"),
+    "tensor-int8-append": dict(scheme="tensor", append_only=True),
+    "group-int8": dict(scheme="group", bits=8),
+    "group-int4": dict(scheme="group", bits=4),
+}
+
+
+def kv_bytes_fp32(past) -> int:
+    return sum(k.numel() * k.element_size() + v.numel() * v.element_size()
+               for k, v in to_layers(past))
+
+
+def run(backend: HFBackend, ids: list, prefix: int, cache_kwargs) -> dict:
+    model = backend.model
+    cache = QuantizedKVCache(**cache_kwargs) if cache_kwargs is not None else None
+    append = cache is not None and cache.append_only
+    requant = cache is not None and not append
+
+    nll = 0.0
+    preds = []
+    with torch.inference_mode():
+        past = cache.as_cache(model.config.num_hidden_layers) if append else None
+        out = model(input_ids=torch.tensor([ids[:prefix]]), past_key_values=past, use_cache=True)
+        past = out.past_key_values
+        if requant:
+            cache.store(past)
+
+        for pos in range(prefix, len(ids)):
+            logits = out.logits[0, -1].float()
+            nll -= torch.log_softmax(logits, dim=-1)[ids[pos]].item()
+            preds.append(int(torch.argmax(logits)))
+
+            if requant:
+                past = to_model_cache(cache.get())
+            out = model(
+                input_ids=torch.tensor([[ids[pos]]]),
+                past_key_values=past,
+                use_cache=True,
+            )
+            past = out.past_key_values
+            if requant:
+                cache.store(past)
+
+    n = len(ids) - prefix
+    if cache is None:
+        kv_bytes = resident = kv_bytes_fp32(past)
+    else:
+        # Before `past` goes away: its scratch is part of what is resident
+        kv_bytes, resident = cache.nbytes(), cache.resident_nbytes()
+    return {
+        "ppl": math.exp(nll / n),
+        "kv_bytes": kv_bytes,
+        "resident_bytes": resident,
+        "bytes_per_token": resident / len(ids),
+        "preds": preds,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="KV quantization accuracy vs bytes report")
+    parser.add_argument("--model_name", default="distilgpt2")
+    parser.add_argument("--text_file", default=os.path.join(ROOT, "final report.txt"))
+    parser.add_argument("--tokens", type=int, default=256, help="Tokens to evaluate")
+    parser.add_argument("--prefix", type=int, default=32, help="Tokens prefilled in one pass")
+    parser.add_argument("--group_size", type=int, default=32)
+    parser.add_argument("--out", type=str, default=None, help="Optional JSON output path")
+    args = parser.parse_args()
+
+    backend = HFBackend(model_name=args.model_name, max_ctx=args.tokens)
+    with open(args.text_file, encoding="utf-8", errors="ignore") as f:
+        ids = backend.encode(f.read())[: args.tokens]
+    if len(ids) <= args.prefix:
+        raise SystemExit("Text is shorter than --prefix")
+
+    results = {}
+    for name, kwargs in SCHEMES.items():
+        if kwargs is not None and kwargs.get("scheme") == "group":
+            kwargs = dict(kwargs, group_size=args.group_size)
+        results[name] = run(backend, ids, args.prefix, kwargs)
+
+    ref = results["fp32"]
+    print(
+        f"{'scheme':<20} {'ppl':>9} {'d_ppl':>8} {'top1_agree':>10} {'KV bytes':>10} "
+        f"{'resident':>10} {'B/token':>9} {'ratio':>6}"
+    )
+    rows = []
+    for name, r in results.items():
+        agree = sum(a == b for a, b in zip(r["preds"], ref["preds"])) / len(ref["preds"])
+        ratio = r["resident_bytes"] / ref["resident_bytes"]
+        print(
+            f"{name:<20} {r['ppl']:>9.3f} {r['ppl'] - ref['ppl']:>+8.3f} {agree:>10.3f} "
+            f"{r['kv_bytes']:>10d} {r['resident_bytes']:>10d} {r['bytes_per_token']:>9.1f} {ratio:>6.3f}"
+        )
+        rows.append({
+            "scheme": name,
+            "ppl": round(r["ppl"], 4),
+            "top1_agreement": round(agree, 4),
+            "kv_bytes": r["kv_bytes"],
+            "resident_bytes": r["resident_bytes"],
+            "bytes_per_token": round(r["bytes_per_token"], 2),
+            "bytes_ratio_vs_fp32": round(ratio, 4),
+        })
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"model_name": args.model_name, "tokens": len(ids), "results": rows}, f, indent=2)
+        print(f"Saved {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""
+Write a pre-quantized (dynamic INT8) copy of a HF causal LM.
+
+The output directory holds the int8 state dict plus tokenizer and config;
+HFBackend / HFBackendPi load it directly, without materializing the fp32
+weights first:
+
+  python scripts/quantize_model.py --model_name distilgpt2 --out models/distilgpt2-int8
+  python src/app_cli.py --model_name models/distilgpt2-int8
+"""
+import os, sys
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "src"))
+
+import argparse
+
+from inference.weight_quant import save_int8
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_name", default="distilgpt2")
+    parser.add_argument("--out", default="models/distilgpt2-int8", help="Output directory")
+    args = parser.parse_args()
+
+    path = save_int8(args.model_name, args.out)
+    print(f"Saved {path} ({os.path.getsize(path) / 1024**2:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
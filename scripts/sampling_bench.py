@@ -0,0 +1,94 @@
+"""
+Per-token sampling cost next to the decode forward pass.
+
+Compares the old sampler (softmax + full sort + cumsum over the whole
+vocabulary) with the top-k prefiltered one in inference/sampler.py, on
+logits of the model's vocabulary size (or --vocab), and times a one-token
+decode step of the model for scale:
+
+  python scripts/sampling_bench.py --model_name distilgpt2
+"""
+import os, sys
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "src"))
+
+import argparse
+import time
+
+import torch
+
+from inference.transformers_backend import HFBackend
+from inference.sampler import Sampler, sample_logits
+
+
+def full_sort_sample(logits: torch.Tensor, temperature: float, top_p: float) -> int:
+    """The sampler HFBackend used before (kept here as the baseline)."""
+    logits = logits / temperature
+    probs = torch.softmax(logits, dim=-1)
+    sorted_probs, sorted_idx = torch.sort(probs, descending=True)
+    cumsum = torch.cumsum(sorted_probs, dim=-1)
+    mask = cumsum <= top_p
+    mask[..., 0] = True
+    filtered = sorted_probs * mask
+    filtered = filtered / filtered.sum()
+    choice = torch.multinomial(filtered, 1).item()
+    return int(sorted_idx[choice].item())
+
+
+def time_per_call(fn, rows: torch.Tensor, iters: int) -> float:
+    for i in range(min(10, iters)):   # warmup
+        fn(rows[i % rows.shape[0]])
+    t0 = time.perf_counter()
+    for i in range(iters):
+        fn(rows[i % rows.shape[0]])
+    return (time.perf_counter() - t0) / iters
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_name", default="distilgpt2")
+    parser.add_argument("--vocab", type=int, default=0, help="Logit width (0 = model vocab size)")
+    parser.add_argument("--iters", type=int, default=300)
+    parser.add_argument("--context", type=int, default=128, help="Cached positions for the decode step")
+    args = parser.parse_args()
+
+    backend = HFBackend(model_name=args.model_name, max_ctx=args.context)
+    vocab = args.vocab or backend.model.config.vocab_size
+
+    # Realistic-ish logits: peaked, with a long flat tail
+    torch.manual_seed(0)
+    rows = torch.randn(16, vocab) * 3.0
+
+    penalized = Sampler(temperature=0.8, top_p=0.95, repetition_penalty=1.2)
+    penalized.reset(vocab, torch.randint(0, vocab, (args.context,)).tolist())
+
+    cases = [
+        ("full sort, top_p=0.95", lambda l: full_sort_sample(l, 0.8, 0.95)),
+        ("prefilter, top_p=0.95", lambda l: sample_logits(l, 0.8, 0.95)),
+        ("prefilter, top_k=50 min_p=0.05", lambda l: sample_logits(l, 0.8, 0.95, top_k=50, min_p=0.05)),
+        ("Sampler + repetition penalty", penalized),
+        ("greedy", lambda l: sample_logits(l, 0.0)),
+    ]
+
+    # One decode step of the model on top of `context` cached positions
+    ids = torch.randint(0, backend.model.config.vocab_size, (1, args.context))
+    with torch.inference_mode():
+        past = backend.model(input_ids=ids, use_cache=True).past_key_values
+        step_ids = ids[:, -1:]
+        n = 20
+        t0 = time.perf_counter()
+        for _ in range(n):
+            backend.model(input_ids=step_ids, past_key_values=past, use_cache=True)
+            past.crop(args.context)
+        forward = (time.perf_counter() - t0) / n
+
+    print(f"vocab={vocab} threads={torch.get_num_threads()}")
+    print(f"{'case':<34} {'ms/token':>9} {'% of forward':>13}")
+    print(f"{'decode forward pass':<34} {forward * 1e3:>9.3f} {100.0:>12.1f}%")
+    for name, fn in cases:
+        t = time_per_call(fn, rows, args.iters)
+        print(f"{name:<34} {t * 1e3:>9.3f} {100 * t / forward:>12.1f}%")
+
+
+if __name__ == "__main__":
+    main()
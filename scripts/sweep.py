@@ -0,0 +1,204 @@
+"""
+Memory / throughput sweep: every (cache, prompt length, new tokens, dtype,
+threads) point x --reps runs in a fresh subprocess, so a point's RSS is not
+inflated by the allocator garbage or KV of earlier points, and nothing is
+warm that would not be warm in a real start.
+
+Each child loads the model, runs --warmup unmeasured replies, then one
+measured greedy reply of exactly new_tokens tokens (prompt built as in
+scripts/bench_suite.py), while a background thread samples RSS. Rows are
+appended to a results store with the host they were measured on:
+
+  python scripts/sweep.py --caches none,quantized --prompt_lengths 64,256 --new_tokens 16,64
+  python scripts/sweep.py --model_name tiny-random --reps 1 --out data/sweeps/ci.parquet
+
+The store (CSV, or Parquet with pandas + pyarrow) is what the plot
+scripts in the repo root read; sweep on the PC and on the Pi into the same
+file and re-run them to regenerate the figures.
+"""
+
+import os, sys
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "src"))
+
+import argparse
+import itertools
+import json
+import platform
+import subprocess
+import time
+from importlib import metadata
+from typing import Any, Dict, List
+
+
+def run_point(point: Dict[str, Any]) -> Dict[str, Any]:
+    """Child process: one measured reply for one sweep point."""
+    import torch
+
+    if point["threads"] > 0:
+        torch.set_num_threads(point["threads"])
+
+    from bench_suite import make_cache, run_reply, PROMPTS
+    from inference.transformers_backend import HFBackend
+    from utils.cpu_tuning import DEFAULT_PROFILE_PATH
+    from utils.mem_accounting import RssSampler, current_rss, kv_bytes, weight_bytes
+
+    torch.manual_seed(point["seed"])
+    t0 = time.perf_counter()
+    backend = HFBackend(
+        model_name=point["model_path"],
+        max_ctx=point["prompt_len"] + point["new_tokens"],
+        dtype=point["dtype"],
+        static_cache=point["static_kv"],
+        cpu_profile=None if point["threads"] > 0 else DEFAULT_PROFILE_PATH,
+    )
+    load_s = time.perf_counter() - t0
+    rss_loaded = current_rss()
+
+    kind, ctx, n = point["cache"], point["prompt_len"], point["new_tokens"]
+    cache = make_cache(kind, ctx)
+    for i in range(point["warmup"]):
+        run_reply(backend, kind, cache, ctx, PROMPTS[(i + 1) % len(PROMPTS)], n)
+
+    sampler = RssSampler().start("prefill")
+    r = run_reply(backend, kind, cache, ctx, PROMPTS[0], n, sampler)
+    sampler.stop()
+    holder = cache if kind == "quantized" else backend.static_kv
+    kv = kv_bytes(holder) if holder is not None else None
+
+    mb = 1024**2
+    return {
+        "prompt_tokens": r["prompt_tokens"],
+        "tokens": r["tokens"],
+        "load_s": round(load_s, 3),
+        "ttft_s": round(r["ttft_s"], 5),
+        "prefill_s": round(r["prefill_s"], 5),
+        "decode_tokens_per_s": round(max(r["tokens"] - 1, 0) / max(r["decode_s"], 1e-9), 2),
+        "tokens_per_s": round(r["tokens"] / max(r["ttft_s"] + r["decode_s"], 1e-9), 2),
+        "rss_loaded_mb": round(rss_loaded / mb, 2),
+        "rss_peak_prefill_mb": round(sampler.peaks.get("prefill", 0) / mb, 2),
+        "rss_peak_decode_mb": round(sampler.peaks.get("decode", 0) / mb, 2),
+        "rss_peak_mb": round(sampler.peak / mb, 2),
+        "rss_end_mb": round(current_rss() / mb, 2),
+        "weight_bytes": weight_bytes(backend.model)["total"],
+        "kv_bytes": kv["bytes"] if kv else None,
+        "kv_allocated_bytes": kv["allocated"] if kv else None,
+        "torch_threads": torch.get_num_threads(),
+    }
+
+
+def host_metadata() -> Dict[str, Any]:
+    """Columns identifying where a row was measured."""
+    from utils.cpu_tuning import host_key
+
+    def version(pkg: str) -> str:
+        try:
+            return metadata.version(pkg)
+        except metadata.PackageNotFoundError:
+            return ""
+
+    return {
+        "host": host_key(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "torch": version("torch"),
+        "transformers": version("transformers"),
+    }
+
+
+def run_sweep(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """Parent: one subprocess per point and repetition; rows go to the store as they finish."""
+    from utils.results_store import append_results
+
+    model_path = args.model_name
+    if model_path == "tiny-random":
+        from bench_suite import build_tiny_gpt2
+
+        model_path = build_tiny_gpt2(os.path.join(ROOT, "data", "bench", "tiny-gpt2"), args.seed)
+
+    grid = list(itertools.product(
+        [c for c in args.caches.split(",") if c],
+        [int(x) for x in args.prompt_lengths.split(",") if x],
+        [int(x) for x in args.new_tokens.split(",") if x],
+        [d for d in args.dtypes.split(",") if d],
+        [int(x) for x in args.threads.split(",") if x],
+    ))
+    sweep_id = time.strftime("%Y%m%d-%H%M%S")
+    meta = host_metadata()
+    rows: List[Dict[str, Any]] = []
+    print(f"Sweep {sweep_id}: {len(grid)} points x {args.reps} reps -> {args.out}")
+    print(f"{'cache':<10} {'prompt':>6} {'new':>5} {'dtype':>8} {'thr':>3} {'rep':>3} "
+          f"{'tok/s':>8} {'ttft s':>8} {'peak MB':>8}")
+
+    for cache, prompt_len, new_tokens, dtype, threads in grid:
+        for rep in range(args.reps):
+            point = {
+                "cache": cache,
+                "prompt_len": prompt_len,
+                "new_tokens": new_tokens,
+                "dtype": dtype,
+                "threads": threads,
+                "model_path": model_path,
+                "static_kv": args.static_kv,
+                "warmup": args.warmup,
+                "seed": args.seed,
+            }
+            cmd = [sys.executable, os.path.abspath(__file__), "--child", json.dumps(point)]
+            proc = subprocess.run(cmd, capture_output=True, text=True, timeout=args.timeout)
+            if proc.returncode != 0:
+                tail = proc.stderr.strip().splitlines()[-1:] or ["(no output)"]
+                print(f"[sweep] {cache} prompt={prompt_len} new={new_tokens} {dtype} failed: {tail[0]}")
+                continue
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            row = {
+                "sweep_id": sweep_id,
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                **meta,
+                "model_name": args.model_name,
+                "cache": cache,
+                "prompt_len": prompt_len,
+                "new_tokens": new_tokens,
+                "dtype": dtype,
+                "threads": threads,
+                "static_kv": args.static_kv,
+                "rep": rep,
+                **result,
+            }
+            append_results(args.out, [row])
+            rows.append(row)
+            print(f"{cache:<10} {prompt_len:>6} {new_tokens:>5} {dtype:>8} {threads:>3} {rep:>3} "
+                  f"{row['tokens_per_s']:>8.2f} {row['ttft_s']:>8.4f} {row['rss_peak_mb']:>8.1f}")
+    print(f"{len(rows)} rows appended to {args.out}")
+    return rows
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Isolated memory / throughput sweep (one process per point)")
+    parser.add_argument("--model_name", default="distilgpt2", help="HF model, path, or 'tiny-random'")
+    parser.add_argument("--caches", default="none,sliding,paged,quantized", help="Comma-separated cache strategies")
+    parser.add_argument("--prompt_lengths", default="64,128,256", help="Comma-separated prompt token budgets")
+    parser.add_argument("--new_tokens", default="16,32,64,128,256", help="Comma-separated generated lengths")
+    parser.add_argument("--dtypes", default="float32", help="Comma-separated: float32,float16,int8")
+    parser.add_argument("--threads", default="0", help="Comma-separated torch thread counts (0 = default / CPU profile)")
+    parser.add_argument("--reps", type=int, default=3, help="Fresh-process repetitions per point")
+    parser.add_argument("--warmup", type=int, default=1, help="Unmeasured replies in each child before the measured one")
+    parser.add_argument("--static_kv", action="store_true", help="Preallocated KV buffer (HFBackend static_cache)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=1800, help="Seconds per child before it is killed")
+    parser.add_argument("--out", default=os.path.join(ROOT, "data", "sweeps", "results.csv"),
+                        help="Results store to append to (.csv or .parquet)")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    if args.child is not None:
+        print(json.dumps(run_point(json.loads(args.child))))
+        return
+    run_sweep(args)
+
+
+if __name__ == "__main__":
+    main()
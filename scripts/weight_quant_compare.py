@@ -0,0 +1,91 @@
+"""
+RSS, load time and tokens/sec of the fp32 / fp16 / int8 weight formats.
+
+Each format runs in its own subprocess so RSS is not polluted by the
+previous one. The int8 rows load the pre-quantized directory (--int8_dir,
+written by scripts/quantize_model.py) if given, else quantize at load time.
+Decoding is greedy on the app_cli benchmark prompts:
+
+  python scripts/quantize_model.py --model_name distilgpt2 --out models/distilgpt2-int8
+  python scripts/weight_quant_compare.py --model_name distilgpt2 --int8_dir models/distilgpt2-int8
+"""
+import os, sys
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "src"))
+
+import argparse
+import json
+import subprocess
+import time
+
+PROMPTS = [
+    "What is a Raspberry Pi?",
+    "Explain Transformer architecture in neural network.",
+    "Describe sliding-window vs paged cache vs quantized Cache.",
+]
+
+
+def run_child(model_name: str, dtype: str, max_new_tokens: int) -> dict:
+    import psutil
+    from inference.hf_backend_pi import HFBackendPi
+
+    # Imports (torch, transformers) are not part of the model's cost
+    proc = psutil.Process()
+    rss0 = proc.memory_info().rss
+    t0 = time.time()
+    backend = HFBackendPi(model_name=model_name, dtype=dtype)
+    load_s = time.time() - t0
+    rss_loaded = proc.memory_info().rss
+
+    backend.generate(PROMPTS[0], max_new_tokens=4, temperature=0.0)   # warmup
+    tokens = 0
+    t0 = time.time()
+    for prompt in PROMPTS:
+        ids = list(backend._iter_tokens(prompt, max_new_tokens, 0.0, 1.0, None))
+        tokens += len(ids)
+    decode_s = time.time() - t0
+    return {
+        "load_s": round(load_s, 3),
+        "rss_after_load_mb": round(rss_loaded / 1024**2, 1),
+        # safetensors are mmapped: fp32 pages only count once decode touches them
+        "load_rss_delta_mb": round((rss_loaded - rss0) / 1024**2, 1),
+        "peak_rss_mb": round(proc.memory_info().rss / 1024**2, 1),
+        "tokens_per_s": round(tokens / decode_s, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_name", default="distilgpt2")
+    parser.add_argument("--int8_dir", default=None, help="Pre-quantized directory from quantize_model.py")
+    parser.add_argument("--modes", default="float32,float16,int8")
+    parser.add_argument("--max_new_tokens", type=int, default=64)
+    parser.add_argument("--out", type=str, default=None, help="Optional JSON output path")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        model = args.int8_dir if args.child == "int8" and args.int8_dir else args.model_name
+        print(json.dumps(run_child(model, args.child, args.max_new_tokens)))
+        return
+
+    rows = []
+    print(f"{'dtype':<9} {'load s':>7} {'loaded MB':>10} {'peak MB':>8} {'tok/s':>7}")
+    for mode in args.modes.split(","):
+        cmd = [sys.executable, os.path.abspath(__file__), "--child", mode,
+               "--model_name", args.model_name, "--max_new_tokens", str(args.max_new_tokens)]
+        if args.int8_dir:
+            cmd += ["--int8_dir", args.int8_dir]
+        out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+        row = {"dtype": mode, **json.loads(out.strip().splitlines()[-1])}
+        rows.append(row)
+        print(f"{mode:<9} {row['load_s']:>7.2f} {row['rss_after_load_mb']:>10.1f} "
+              f"{row['peak_rss_mb']:>8.1f} {row['tokens_per_s']:>7.2f}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"model": args.model_name, "int8_dir": args.int8_dir, "rows": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,33 +5,49 @@ import os
 import sys
 import time
 import statistics
-from typing import Optional
+from typing import Any, Dict, Optional
 
-import psutil
+T_MODULE = time.time()
 
 # Make "src" imports work when run from repo root
 CURRENT_DIR = os.path.dirname(__file__)
 if CURRENT_DIR not in sys.path:
     sys.path.append(CURRENT_DIR)
 
-from inference.transformers_backend import HFBackend
-from kv_cache.sliding_window import SlidingWindowCache
-from kv_cache.paged_cache import PagedCache
-from kv_cache.quantized_cache import QuantizedKVCache   # <-- NEW
-from utils.logger import JsonlLogger
-from utils.metrics import snapshot as metrics_snapshot
+# torch / transformers / psutil are imported in main() after the arguments
+# are parsed: --help and usage errors return at once, and the import cost
+# shows up in the --benchmark startup breakdown.
 
 
-def build_cache(cache_type: str, max_ctx: int) -> Optional[object]:
+def build_cache(
+    cache_type: str,
+    max_ctx: int,
+    kv_append_only: bool = False,
+    kv_scheme: str = "tensor",
+    kv_bits: int = 8,
+    kv_group_size: int = 32,
+    kv_pool: Optional[Any] = None,
+) -> Optional[object]:
     cache_type = cache_type.lower()
     if cache_type == "none":
         return None
     if cache_type == "sliding":
+        from kv_cache.sliding_window import SlidingWindowCache
+
         return SlidingWindowCache(max_tokens=max_ctx)
     if cache_type == "paged":
-        return PagedCache(max_turns=6, max_tokens=max_ctx)
+        from kv_cache.paged_cache import PagedCache
+
+        return PagedCache(max_turns=6, max_tokens=max_ctx, kv_pool=kv_pool)
     if cache_type == "quantized":
-        return QuantizedKVCache()   # <-- NEW
+        from kv_cache.quantized_cache import QuantizedKVCache
+
+        return QuantizedKVCache(
+            append_only=kv_append_only,
+            scheme=kv_scheme,
+            bits=kv_bits,
+            group_size=kv_group_size,
+        )
     raise ValueError(f"Unknown cache type: {cache_type}")
 
 
@@ -45,15 +61,154 @@ def main() -> None:
         choices=["none", "sliding", "paged", "quantized"],  # <-- UPDATED
         help="Cache strategy",
     )
+    parser.add_argument(
+        "--kv_append_only",
+        action="store_true",
+        help="Quantized cache: quantize only new positions each step instead of the whole past",
+    )
+    parser.add_argument(
+        "--kv_scheme",
+        default="tensor",
+        choices=["tensor", "group"],
+        help="Quantized cache: one scale per tensor, or per-channel keys / per-token values",
+    )
+    parser.add_argument(
+        "--kv_bits", type=int, default=8, choices=[8, 4], help="Quantized cache bit width (4 needs group)"
+    )
+    parser.add_argument(
+        "--kv_group_size", type=int, default=32, help="Quantized cache group size for --kv_scheme group"
+    )
+
+    parser.add_argument(
+        "--dtype",
+        default="float32",
+        choices=["float32", "float16", "int8"],
+        help="Weight format (int8 = dynamic INT8 projections + LM head; "
+        "directories from scripts/quantize_model.py are always int8)",
+    )
+    parser.add_argument(
+        "--static_kv",
+        action="store_true",
+        help="Preallocate the KV buffer and write it in place during decode",
+    )
+    parser.add_argument(
+        "--graph_decode",
+        action="store_true",
+        help="Decode with a captured fixed-shape step over the static KV buffer "
+        "(GPT-2 models; falls back to eager if capture fails)",
+    )
+    parser.add_argument(
+        "--cpu_profile",
+        default="data/cpu_profiles.json",
+        help="Thread/affinity profiles from src/autotune.py; this host+model's entry is applied ('' = off)",
+    )
+    parser.add_argument(
+        "--prefill_chunk",
+        type=int,
+        default=None,
+        help="Prompt tokens per prefill forward (default: from the CPU profile, else whole prompt)",
+    )
+
+    parser.add_argument(
+        "--kv_offload_mb",
+        type=int,
+        default=0,
+        help="Keep the KV in a memory-mapped file with only this many MB resident (0 = off)",
+    )
+    parser.add_argument(
+        "--kv_offload_dir", default="data/kv_offload", help="Directory for the --kv_offload_mb file"
+    )
+
+    parser.add_argument(
+        "--session_kv",
+        default="off",
+        choices=["off", "float", "quantized", "paged"],
+        help="sliding/paged: keep KV between turns and prefill only the new turn "
+        "(quantized uses the --kv_* options; paged needs --cache paged)",
+    )
+    parser.add_argument(
+        "--kv_blocks",
+        type=int,
+        default=0,
+        help="Paged session KV: blocks in the pool (0 = enough for max_ctx + max_new_tokens)",
+    )
+    parser.add_argument(
+        "--kv_block_size", type=int, default=16, help="Paged session KV: positions per block"
+    )
 
     parser.add_argument(
         "--max_new_tokens", type=int, default=64, help="Tokens to generate per reply"
     )
+    parser.add_argument(
+        "--draft_model", default=None, help="Speculative decoding: small model with the same tokenizer"
+    )
+    parser.add_argument(
+        "--draft_layers",
+        type=int,
+        default=0,
+        help="Speculative decoding: use the first N layers of the model as draft (0 = off)",
+    )
+    parser.add_argument(
+        "--prompt_lookup",
+        action="store_true",
+        help="Speculative decoding without a draft model: propose n-grams seen in the prompt/reply",
+    )
+    parser.add_argument("--spec_k", type=int, default=4, help="Speculative decoding: tokens proposed per round")
+    parser.add_argument("--top_k", type=int, default=0, help="Sample only from the k best tokens (0 = off)")
+    parser.add_argument(
+        "--min_p", type=float, default=0.0, help="Drop tokens below min_p x the top probability (0 = off)"
+    )
+    parser.add_argument(
+        "--repetition_penalty", type=float, default=1.0, help="Penalty for already seen tokens (1.0 = off)"
+    )
+    parser.add_argument(
+        "--mem_soft_mb",
+        type=float,
+        default=0,
+        help="Memory governor: RSS (MB) at which to start stepping down (0 = governor off)",
+    )
+    parser.add_argument(
+        "--mem_hard_mb", type=float, default=0, help="Memory governor: RSS (MB) at which to stop replies early"
+    )
+    parser.add_argument(
+        "--mem_min_available_mb", type=float, default=128, help="Memory governor: system memory floor (MB)"
+    )
+    parser.add_argument(
+        "--stop",
+        action="append",
+        default=None,
+        help="Stop string, escapes like \\n allowed; repeatable "
+        "(default: role markers '\\nUser:' and '\\nAssistant:')",
+    )
+    parser.add_argument("--no_stop", action="store_true", help="Don't end replies on stop strings")
+    parser.add_argument("--ignore_eos", action="store_true", help="Keep generating past the EOS token")
+    parser.add_argument(
+        "--max_time", type=float, default=0, help="Seconds per reply before generation stops (0 = no limit)"
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="Time each decode phase; totals go to the log and a Chrome trace per reply to --trace_dir",
+    )
+    parser.add_argument("--trace_dir", default="data/traces", help="Where --trace writes trace-*.json")
+    parser.add_argument(
+        "--trace_torch", action="store_true", help="With --trace: record torch.profiler ops into the traces"
+    )
+    parser.add_argument("--log_max_mb", type=float, default=8, help="Rotate the JSONL log at this size")
+    parser.add_argument(
+        "--log_compress", default="gzip", choices=["none", "gzip", "zstd"], help="Compression of rotated log segments"
+    )
+    parser.add_argument(
+        "--log_max_total_mb", type=float, default=256, help="Delete the oldest CLI log segments above this (0 = keep all)"
+    )
     parser.add_argument(
         "--benchmark",
         action="store_true",
         help="Run benchmark instead of interactive chat",
     )
+    parser.add_argument(
+        "--warmup", type=int, default=1, help="Benchmark: unmeasured replies before the prompts (0 = none)"
+    )
     parser.add_argument(
         "--prompts",
         type=str,
@@ -61,29 +216,170 @@ def main() -> None:
         help="Benchmark prompts separated by '|'",
     )
     args = parser.parse_args()
+    if args.session_kv == "paged" and args.cache != "paged":
+        parser.error("--session_kv paged needs --cache paged")
+    if args.kv_bits == 4 and args.kv_scheme != "group":
+        parser.error("--kv_bits 4 needs --kv_scheme group")
+    if args.draft_model or args.draft_layers > 0 or args.prompt_lookup:
+        # Speculation runs on a fresh float KV with plain temperature/top-p
+        unsupported = [
+            flag for flag, used in [
+                ("--cache quantized", args.cache == "quantized"),
+                ("--session_kv", args.session_kv != "off"),
+                ("--static_kv", args.static_kv),
+                ("--graph_decode", args.graph_decode),
+                ("--kv_offload_mb", args.kv_offload_mb > 0),
+                ("--top_k", args.top_k > 0),
+                ("--min_p", args.min_p > 0),
+                ("--repetition_penalty", args.repetition_penalty != 1.0),
+            ] if used
+        ]
+        if unsupported:
+            parser.error(f"speculative decoding does not work with {', '.join(unsupported)}")
 
-    print(f"Loading model {args.model_name} ...")
-    backend = HFBackend(model_name=args.model_name, max_ctx=args.max_ctx)
-    cache = build_cache(args.cache, args.max_ctx)
-    logger = JsonlLogger()
+    startup: Dict[str, float] = {}
+    t0 = time.perf_counter()
+    import psutil
+
+    from inference.transformers_backend import HFBackend
+    from inference.chat_session import ChatSession
+    from inference.sampler import Sampler
+    from inference.stopping import DEFAULT_STOP_STRINGS, StopCriteria
+    from kv_cache.sliding_window import SlidingWindowCache
+    from kv_cache.paged_cache import PagedCache
+    from kv_cache.paged_kv import KVBlockPool
+    from kv_cache.quantized_cache import QuantizedKVCache
+    from utils.logger import JsonlLogger, flush_on_sigterm
+    from utils.mem_accounting import RssSampler, kv_bytes, tokenizer_bytes, weight_bytes
+    from utils.memory_governor import MemoryGovernor
+    from utils.tracing import PhaseTracer
+    from utils.metrics import snapshot as metrics_snapshot
 
     proc = psutil.Process()
+    startup["imports_s"] = time.perf_counter() - t0
+
+    print(f"Loading model {args.model_name} ...")
+    t0 = time.perf_counter()
+    backend = HFBackend(
+        model_name=args.model_name,
+        max_ctx=args.max_ctx,
+        static_cache=args.static_kv,
+        kv_offload_mb=args.kv_offload_mb,
+        kv_offload_dir=args.kv_offload_dir,
+        draft_model=args.draft_model,
+        draft_layers=args.draft_layers,
+        spec_k=args.spec_k,
+        prompt_lookup=args.prompt_lookup,
+        dtype=args.dtype,
+        graph_decode=args.graph_decode,
+        cpu_profile=args.cpu_profile,
+        prefill_chunk=args.prefill_chunk,
+        tracer=PhaseTracer(args.trace_dir, args.trace_torch) if args.trace else None,
+    )
+    startup["backend_s"] = time.perf_counter() - t0
+    if backend.cpu_profile is not None:
+        p = backend.cpu_profile
+        print(
+            f"CPU profile: threads={p.num_threads or 'default'} interop={p.interop_threads or 'default'} "
+            f"cpus={p.affinity or 'all'} prefill_chunk={backend.prefill_chunk or 'off'}"
+        )
+    t0 = time.perf_counter()
+    stop_strings = [] if args.no_stop else DEFAULT_STOP_STRINGS
+    if args.stop and not args.no_stop:
+        stop_strings = [s.encode("latin-1", "backslashreplace").decode("unicode_escape") for s in args.stop]
+    stop = StopCriteria.for_backend(backend, stop_strings, args.max_time, use_eos=not args.ignore_eos)
+
+    kv_pool = None
+    if args.session_kv == "paged":
+        num_blocks = args.kv_blocks or -(-(args.max_ctx + args.max_new_tokens) // args.kv_block_size) + 1
+        kv_pool = KVBlockPool.for_model(backend.model, num_blocks, args.kv_block_size)
+        print(f"KV block pool: {num_blocks} x {args.kv_block_size} positions, {kv_pool.nbytes / 1024**2:.1f} MB")
+    cache = build_cache(
+        args.cache,
+        args.max_ctx,
+        args.kv_append_only,
+        args.kv_scheme,
+        args.kv_bits,
+        args.kv_group_size,
+        kv_pool,
+    )
+    logger = JsonlLogger(max_mb=args.log_max_mb, compress=args.log_compress, max_total_mb=args.log_max_total_mb)
+    flush_on_sigterm()
+
+    session: Optional[ChatSession] = None
+    if args.session_kv != "off" and isinstance(cache, (SlidingWindowCache, PagedCache)):
+        session_kv = None
+        if args.session_kv == "quantized":
+            session_kv = QuantizedKVCache(
+                append_only=True,
+                scheme=args.kv_scheme,
+                bits=args.kv_bits,
+                group_size=args.kv_group_size,
+            )
+        session = ChatSession(backend, history=cache, kv_cache=session_kv)
+
+    governor: Optional[MemoryGovernor] = None
+    if args.mem_soft_mb > 0:
+        governor = MemoryGovernor(
+            soft_rss_mb=args.mem_soft_mb,
+            hard_rss_mb=args.mem_hard_mb or args.mem_soft_mb * 1.25,
+            min_available_mb=args.mem_min_available_mb,
+            logger=logger,
+            make_kv_cache=lambda: QuantizedKVCache(
+                append_only=True,
+                scheme=args.kv_scheme,
+                bits=args.kv_bits,
+                group_size=args.kv_group_size,
+            ),
+        )
+
+    startup["setup_s"] = time.perf_counter() - t0
+    startup["ready_s"] = time.time() - T_MODULE
     peak_rss = 0.0
     latencies_per_token: list[float] = []
     total_tokens = 0
     total_latency = 0.0
+    spec_totals: Dict[str, float] = {}   # speculator stats summed over replies
+
+    turn_no = 0
+
+    def kv_holder() -> Any:
+        """Whatever holds the KV after a reply, for kv_bytes()."""
+        if session is not None:
+            return session.kv_cache or session.seq or session.past
+        if isinstance(cache, QuantizedKVCache):
+            return cache
+        return backend.static_kv
 
     def run_one_turn(user_text: str) -> str:
-        nonlocal peak_rss, total_tokens, total_latency
+        nonlocal peak_rss, total_tokens, total_latency, turn_no
+
+        # React to memory pressure before building the prompt
+        max_new_tokens = args.max_new_tokens
+        should_stop = None
+        if governor is not None:
+            text_cache = cache if isinstance(cache, (SlidingWindowCache, PagedCache)) else None
+            max_new_tokens = governor.check(text_cache, session, args.max_new_tokens)
+            should_stop = governor.should_stop
+
+        sampler = None
+        if args.top_k > 0 or args.min_p > 0 or args.repetition_penalty != 1.0:
+            sampler = Sampler(
+                top_k=args.top_k, min_p=args.min_p, repetition_penalty=args.repetition_penalty
+            )
 
         # Build prompt depending on cache type
-        if cache is None:
+        if session is not None:
+            # KV reused across turns → the session builds its own input
+            prompt = None
+
+        elif cache is None:
             # No cache → simple 1-turn prompt
             prompt = f"User: {user_text}\nAssistant:"
 
         elif isinstance(cache, SlidingWindowCache) or isinstance(cache, PagedCache):
-            # Text-based caches → build textual context
-            prompt = cache.build_prompt(backend, user_text)
+            # Text-based caches → prompt token ids straight from the cached turns
+            prompt = cache.build_prompt_ids(backend, user_text)
 
         elif isinstance(cache, QuantizedKVCache):
             # Quantized KV-cache does NOT manage text history → use 1-turn prompt
@@ -92,27 +388,73 @@ def main() -> None:
         else:
             raise RuntimeError(f"Unexpected cache type: {type(cache)}")
 
+        if backend.speculator is not None:
+            backend.speculator.reset_stats()   # [spec] line is per reply
         t0 = time.time()
-        reply = backend.generate(
-            prompt,
-            max_new_tokens=args.max_new_tokens,
-            kv_cache=cache     # <-- NEW, integrates quantized KV-cache
-        )
+        if backend.tracer is not None:
+            turn_no += 1
+            backend.tracer.begin(f"{time.strftime('%Y%m%d-%H%M%S')}-{turn_no}")
+        if session is not None:
+            stream = session.reply_stream(
+                user_text,
+                max_new_tokens=max_new_tokens,
+                should_stop=should_stop,
+                sampler=sampler,
+                stop=stop,
+            )
+        else:
+            stream = backend.generate_stream(
+                prompt,
+                max_new_tokens=max_new_tokens,
+                kv_cache=cache,     # <-- NEW, integrates quantized KV-cache
+                should_stop=should_stop,
+                sampler=sampler,
+                stop=stop,
+            )
+
+        # Print the reply as it is generated; RSS is sampled in the background
+        # (prefill = until the first text arrives)
+        rss_sampler = RssSampler().start("prefill")
+        print("\nAssistant: ", end="", flush=True)
+        pieces: list[str] = []
+        ttft: Optional[float] = None
+        started = False  # leading whitespace is not printed (was reply.strip())
+        for delta in stream:
+            if ttft is None:
+                ttft = time.time() - t0
+                rss_sampler.phase("decode")
+            pieces.append(delta)
+            if not started:
+                delta = delta.lstrip()
+                started = bool(delta)
+            print(delta, end="", flush=True)
+        print()
+        reply = "".join(pieces)
+        rss_sampler.stop()
 
         latency = time.time() - t0
+        ttft = ttft if ttft is not None else latency
+        trace = backend.tracer.end() if backend.tracer is not None else None
+        # Cold start includes the first forward pass (lazy weight pages, kernels)
+        startup.setdefault("first_token_s", startup["ready_s"] + ttft)
 
         # metrics
-        toks = backend.token_count(reply)
+        # Sampled ids (every reply path feeds them to stop), not a re-tokenized reply
+        toks = len(stop.ids)
         total_tokens += toks
         total_latency += latency
         latency_per_token = latency / max(toks, 1)
         latencies_per_token.append(latency_per_token)
         rss_mb = proc.memory_info().rss / (1024**2)
-        peak_rss = max(peak_rss, rss_mb)
+        turn_peak_mb = rss_sampler.peak / 1024**2
+        peak_rss = max(peak_rss, turn_peak_mb, rss_mb)
+        phase_peaks_mb = {k: round(v / 1024**2, 2) for k, v in rss_sampler.peaks.items()}
+        kv = kv_bytes(kv_holder())
 
         # update cache conversation state
         # Update cache state only for text-based caches
-        if isinstance(cache, (SlidingWindowCache, PagedCache)):
+        # (a ChatSession already recorded the turn)
+        if isinstance(cache, (SlidingWindowCache, PagedCache)) and session is None:
             cache.add_turn(user_text, reply)
 # QuantizedKVCache does NOT maintain text history → skip
 
@@ -124,10 +466,19 @@ def main() -> None:
                 "user": user_text,
                 "assistant": reply,
                 "latency_s": round(latency, 4),
+                "ttft_s": round(ttft, 4),
                 "tokens": toks,
+                "stop_reason": stop.reason or "max_new_tokens",
                 "latency_per_token_s": round(latency_per_token, 5),
                 "rss_mb": round(rss_mb, 2),
+                "rss_peak_mb": round(turn_peak_mb, 2),
+                "rss_peak_by_phase_mb": phase_peaks_mb,
+                "kv_bytes": kv["bytes"],
+                "kv_allocated_bytes": kv["allocated"],
                 "cache_type": args.cache,
+                "session_kv": args.session_kv,
+                "prefill_tokens": session.last_prefill_tokens if session else None,
+                "trace": trace,
                 "model_name": args.model_name,
                 "proc_metrics": metrics_snapshot(),
             }
@@ -135,16 +486,44 @@ def main() -> None:
 
         # print stats to console
         tps = toks / latency if latency > 0 else 0.0
-        print(f"\nAssistant: {reply.strip()}")
         print(
-            f"\n[stats] latency={latency:.3f}s | tokens={toks} | tokens/s={tps:.2f} | rss={rss_mb:.1f} MB"
+            f"\n[stats] ttft={ttft:.3f}s | latency={latency:.3f}s | tokens={toks} | tokens/s={tps:.2f} | rss={rss_mb:.1f} MB"
+            f" | stop={stop.reason or 'max_new_tokens'}"
         )
+        print(
+            "[mem] peak "
+            + " ".join(f"{phase}={mb:.1f}" for phase, mb in phase_peaks_mb.items())
+            + f" MB (turn {turn_peak_mb:.1f} MB) | KV {kv['kind']} {kv['bytes'] / 1024**2:.2f} MB"
+            f" live / {kv['allocated'] / 1024**2:.2f} MB reserved"
+        )
+        if trace is not None:
+            phases = sorted(trace["phases_s"].items(), key=lambda kv: -kv[1])
+            print(
+                "[trace] " + " | ".join(f"{name}={secs * 1e3:.1f}ms" for name, secs in phases)
+                + f" | other={trace['untraced_s'] * 1e3:.1f}ms"
+                + (f" -> {trace['trace_file']}" if "trace_file" in trace else "")
+            )
+        if backend.speculator is not None:
+            st = backend.speculator.stats
+            for key, value in st.items():
+                spec_totals[key] = spec_totals.get(key, 0) + value
+            print(
+                f"[spec] acceptance={backend.speculator.acceptance_rate:.2f} "
+                f"({st['accepted']}/{st['proposed']}) | target forwards={st['target_forwards']} "
+                f"| effective tokens/s={backend.speculator.tokens_per_s:.2f}"
+            )
         print("-" * 60)
         return reply
 
     if args.benchmark:
         prompts = [p.strip() for p in args.prompts.split("|") if p.strip()]
         print(f"Running benchmark with {len(prompts)} prompts, cache={args.cache} ...")
+        # Warm up kernels / weight pages outside the conversation and the stats
+        for _ in range(args.warmup):
+            t0 = time.time()
+            for _delta in backend.generate_stream(prompts[0], max_new_tokens=8, temperature=0.0):
+                startup.setdefault("first_token_s", startup["ready_s"] + time.time() - t0)
+        print("(per-phase numbers: scripts/bench_suite.py)")
         for p in prompts:
             print(f"\n=== Prompt: {p} ===")
             run_one_turn(p)
@@ -157,6 +536,53 @@ def main() -> None:
         print(f"Peak RSS (MB):      {peak_rss:.2f}")
         print(f"Avg latency/token:  {avg_lat_per_tok:.4f} s")
         print(f"Avg tokens/sec:     {overall_tps:.2f}")
+        if spec_totals:
+            accepted, proposed = spec_totals["accepted"], spec_totals["proposed"]
+            print(f"Spec acceptance:    {accepted / max(proposed, 1):.2f} ({accepted}/{proposed})")
+        if args.graph_decode:
+            if backend.graph_error is not None:
+                mode = f"eager ({backend.graph_error})"
+            elif backend.graph_step is None:
+                mode = "eager (KV was not in the static buffer, e.g. --session_kv)"
+            else:
+                mode = "captured"
+            print(f"Decode step:        {mode}")
+
+        print("\n=== Memory accounting ===")
+        weights = weight_bytes(backend.model)
+        by_dtype = ", ".join(f"{k} {v / 1024**2:.1f}" for k, v in weights["by_dtype"].items())
+        print(f"Weights:            {weights['total'] / 1024**2:.1f} MB ({by_dtype})")
+        tok_mem = tokenizer_bytes(backend.tokenizer)
+        print(f"Tokenizer:          {tok_mem['serialized_bytes'] / 1024**2:.2f} MB serialized, "
+              f"{tok_mem['vocab_size']} tokens")
+        kv = kv_bytes(kv_holder())
+        print(f"KV ({kv['kind']}):  {kv['bytes'] / 1024**2:.2f} MB live, {kv['allocated'] / 1024**2:.2f} MB reserved")
+        if kv["per_layer"]:
+            print("  per layer (KB):   " + " ".join(f"{b / 1024:.0f}" for b in kv["per_layer"]))
+        if kv_pool is not None:
+            print(f"KV block pool:      {kv_pool.nbytes / 1024**2:.2f} MB")
+        logger.log(
+            {
+                "role": "memory",
+                "model_name": args.model_name,
+                "weight_bytes": weights["total"],
+                "weight_bytes_by_dtype": weights["by_dtype"],
+                "tokenizer_bytes": tok_mem["serialized_bytes"],
+                "kv": kv,
+                "peak_rss_mb": round(peak_rss, 2),
+            }
+        )
+
+        print("\n=== Startup breakdown ===")
+        print(f"Imports:            {startup['imports_s']:.3f} s  (torch, transformers, ...)")
+        for name, secs in backend.load_times.items():
+            label = name[:-2].replace("_", " ").capitalize() + ":"
+            print(f"  {label:<18}{secs:.3f} s")
+        print(f"Backend total:      {startup['backend_s']:.3f} s")
+        print(f"Caches / session:   {startup['setup_s']:.3f} s")
+        print(f"Ready for input:    {startup['ready_s']:.3f} s after app_cli started")
+        print(f"First reply token:  {startup['first_token_s']:.3f} s after app_cli started")
+        logger.log({"role": "startup", "model_name": args.model_name, **{k: round(v, 4) for k, v in startup.items()}})
         return
 
     # Interactive mode
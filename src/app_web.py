@@ -1,25 +1,450 @@
-from fastapi import FastAPI
+# src/app_web.py
+#
+# Web chat API. Generation runs on one inference worker fed by a bounded
+# asyncio queue, so the event loop never blocks and overload is answered
+# with 429 instead of piling up threads on the Pi. With web_batch > 1
+# (hf) the worker decodes the replies of several sessions together.
+
+import asyncio
+import os
+import sys
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, Optional
+
+from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from src.utils.logger import Logger
-from src.inference.llama_backend import LlamaBackend
-from src.kv_cache.sliding_window import SlidingWindowCache
 
-app = FastAPI()
-logger = Logger()
-backend = LlamaBackend("models/tinyllama-q4_0.gguf", max_ctx=512)
-cache = SlidingWindowCache(max_ctx=512)
-history = "You are a helpful assistant."
+# Make "src" imports work when started as `uvicorn src.app_web:app`
+CURRENT_DIR = os.path.dirname(__file__)
+if CURRENT_DIR not in sys.path:
+    sys.path.append(CURRENT_DIR)
+
+from config import settings
+from kv_cache.sliding_window import SlidingWindowCache
+from kv_cache.paged_cache import PagedCache
+from kv_cache.quantized_cache import QuantizedKVCache
+from utils.logger import JsonlLogger
+from utils.memory_governor import MemoryGovernor
+from utils.metrics import snapshot as metrics_snapshot
+
 
 class Msg(BaseModel):
     text: str
+    session_id: Optional[str] = None
+
+
+@dataclass
+class Job:
+    session_id: str
+    text: str
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.time)
+
+
+def new_history() -> Any:
+    if settings.cache_type == "paged":
+        return PagedCache(max_tokens=settings.max_ctx)
+    return SlidingWindowCache(max_tokens=settings.max_ctx)
+
+
+class WebSession:
+    """
+    Conversation state of one client (history, plus reused KV on the HF
+    backend unless reuse_kv=False, e.g. for batched decoding).
+    """
+
+    def __init__(self, backend: Any, reuse_kv: bool = True) -> None:
+        self.backend = backend
+        self.history = new_history()
+
+        self.chat = None
+        if settings.backend == "hf" and reuse_kv:
+            from inference.chat_session import ChatSession
+
+            self.chat = ChatSession(backend, history=self.history)
+
+    def reply(
+        self,
+        text: str,
+        max_new_tokens: int,
+        should_stop: Optional[Callable[[], bool]] = None,
+        stop: Optional[Any] = None,
+    ) -> str:
+        if self.chat is not None:
+            return self.chat.reply(
+                text, max_new_tokens=max_new_tokens, should_stop=should_stop, stop=stop
+            )
+        prompt = self.history.build_prompt(self.backend, text)
+        out = self.backend.generate(prompt, max_tokens=max_new_tokens, stop=settings.stop_strings)
+        self.history.add_turn(text, out)
+        return out
+
+    def close(self) -> None:
+        if self.chat is not None:
+            self.chat.reset()   # returns paged KV blocks, drops float past
+
+
+def load_backend() -> Any:
+    if settings.backend == "hf":
+        from inference.transformers_backend import HFBackend
+
+        return HFBackend(
+            model_name=settings.model_path, max_ctx=settings.max_ctx, cpu_profile=settings.cpu_profile_path
+        )
+    if settings.backend == "llama":
+        from inference.llama_backend import LlamaBackend
+
+        return LlamaBackend(settings.model_path, max_ctx=settings.max_ctx)
+    raise ValueError(f"Unknown backend: {settings.backend}")
+
+
+class InferenceWorker:
+    """
+    Owns the backend and every session. Jobs are taken from the queue one
+    at a time and run on a single thread: the model is not thread-safe and
+    a Pi has no spare cores for a second forward pass anyway.
+
+    web_batch > 1 (hf): jobs of different sessions are decoded together by
+    a BatchScheduler instead. Between two batched steps, queued jobs join
+    the batch and finished replies leave it. Prompts are rebuilt from the
+    text history (no session KV reuse); a session's next job waits until
+    its previous reply is done. The memory governor still caps
+    max_new_tokens but cannot stop a batched reply early.
+    """
+
+    def __init__(self, backend: Any, queue_size: int, max_sessions: int) -> None:
+        self.backend = backend
+        self.queue: "asyncio.Queue[Job]" = asyncio.Queue(maxsize=queue_size)
+        self.max_sessions = max_sessions
+        self.sessions: "OrderedDict[str, WebSession]" = OrderedDict()
+        # hf + KV budget: quantized session KV, idle sessions spilled to disk
+        self.store = None
+        if settings.backend == "hf" and settings.web_kv_budget_mb > 0:
+            from inference.session_store import SessionStore
+
+            self.store = SessionStore(
+                backend,
+                new_history,
+                budget_bytes=settings.web_kv_budget_mb * 1024**2,
+                spill_dir=settings.web_kv_spill_dir,
+                max_sessions=max_sessions,
+            )
+        self.batcher = None
+        if settings.backend == "hf" and settings.web_batch > 1:
+            if self.store is not None:
+                raise ValueError("web_batch does not work with web_kv_budget_mb (no session KV reuse)")
+            from inference.batch_scheduler import BatchScheduler
+
+            self.batcher = BatchScheduler(backend, max_batch=settings.web_batch)
+        self.deferred: Deque[Job] = deque()   # batched: jobs of sessions with a reply in flight
+        self.in_flight: Dict[str, Job] = {}   # batched: session id -> job being decoded
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self.logger = JsonlLogger(
+            settings.log_dir,
+            name="web",
+            max_mb=settings.log_max_mb,
+            max_age_s=settings.log_max_age_s,
+            compress=settings.log_compress,
+            max_total_mb=settings.log_max_total_mb,
+        )
+
+        self.governor: Optional[MemoryGovernor] = None
+        if settings.mem_soft_mb > 0:
+            self.governor = MemoryGovernor(
+                soft_rss_mb=settings.mem_soft_mb,
+                hard_rss_mb=settings.mem_hard_mb or settings.mem_soft_mb * 1.25,
+                min_available_mb=settings.mem_min_available_mb,
+                logger=self.logger,
+                make_kv_cache=lambda: QuantizedKVCache(append_only=True),
+            )
+        # hf: EOS / stop strings / time limit end replies early (llama.cpp does its own)
+        self.stop = None
+        if settings.backend == "hf":
+            from inference.stopping import StopCriteria
+
+            self.stop = StopCriteria.for_backend(backend, settings.stop_strings, settings.max_time_s)
+        # hf: per-phase timers (PhaseTracer) for every request
+        self.tracer = None
+        if settings.backend == "hf" and settings.trace_dir:
+            from utils.tracing import PhaseTracer
+
+            self.tracer = backend.tracer = PhaseTracer(settings.trace_dir)
+        self.busy = False
+
+    def _session(self, session_id: str) -> WebSession:
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = WebSession(self.backend, reuse_kv=self.batcher is None)
+            self.sessions[session_id] = session
+            while len(self.sessions) > self.max_sessions:
+                _, old = self.sessions.popitem(last=False)
+                old.close()
+        self.sessions.move_to_end(session_id)
+        return session
+
+    def _run(self, job: Job) -> Dict[str, Any]:
+        """Runs on the inference thread."""
+        t0 = time.time()
+        if self.tracer is not None:
+            self.tracer.begin(f"{job.session_id}-{int(t0 * 1000)}")
+        try:
+            reply = self._reply(job)
+        finally:
+            # Also when the reply raises, so the next request starts a clean trace
+            trace = self.tracer.end() if self.tracer is not None else None
+        stop_reason = self.stop.reason if self.stop is not None else None
+        return self._result(job, reply, t0, stop_reason, trace)
+
+    def _result(
+        self,
+        job: Job,
+        reply: str,
+        t0: float,
+        stop_reason: Optional[str],
+        trace: Optional[Any] = None,
+    ) -> Dict[str, Any]:
+        """Log a finished reply (started at t0) and build the /chat result."""
+        latency = time.time() - t0
+        queue_wait = t0 - job.enqueued_at
+
+        self.logger.log(
+            {
+                "role": "interaction",
+                "session_id": job.session_id,
+                "user": job.text,
+                "assistant": reply,
+                "latency_s": round(latency, 4),
+                "queue_wait_s": round(queue_wait, 4),
+                "stop_reason": stop_reason,
+                "cache_type": settings.cache_type,
+                "backend": settings.backend,
+                "batch": settings.web_batch if self.batcher is not None else None,
+                "trace": trace,
+                "proc_metrics": metrics_snapshot(),
+            }
+        )
+        return {
+            "reply": reply.strip(),
+            "latency_s": round(latency, 4),
+            "queue_wait_s": round(queue_wait, 4),
+        }
+
+    def _reply(self, job: Job) -> str:
+        max_new_tokens = settings.max_new_tokens
+        should_stop = None
+        if self.store is not None:
+            if self.governor is not None:
+                # Store sessions already use quantized KV
+                session = self.store.get(job.session_id)
+                max_new_tokens = self.governor.check(session.history, None, max_new_tokens)
+                should_stop = self.governor.should_stop
+            return self.store.reply(
+                job.session_id,
+                job.text,
+                max_new_tokens=max_new_tokens,
+                should_stop=should_stop,
+                stop=self.stop,
+            )
+        session = self._session(job.session_id)
+        if self.governor is not None:
+            max_new_tokens = self.governor.check(session.history, session.chat, max_new_tokens)
+            should_stop = self.governor.should_stop
+        return session.reply(job.text, max_new_tokens, should_stop, self.stop)
+
+    async def run_forever(self) -> None:
+        if self.batcher is not None:
+            await self._run_batched()
+            return
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.queue.get()
+            try:
+                if job.future.cancelled():
+                    continue   # client went away while queued: skip the work
+                self.busy = True
+                result = await loop.run_in_executor(self.executor, self._run, job)
+                if not job.future.done():
+                    job.future.set_result(result)
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                self.busy = False
+                self.queue.task_done()
+
+    # --- batched decoding (web_batch > 1) ----------------------------------------
+
+    async def _run_batched(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            # Jobs held back while their session had a reply in flight
+            for _ in range(len(self.deferred)):
+                self._admit(self.deferred.popleft(), loop)
+            if not self.batcher.has_work():
+                self._admit(await self.queue.get(), loop)
+            # Queued jobs join before the next step, up to a full batch; the
+            # rest stay queued, so a full queue still answers 429
+            while self._batch_room() > 0:
+                try:
+                    self._admit(self.queue.get_nowait(), loop)
+                except asyncio.QueueEmpty:
+                    break
+            if not self.batcher.has_work():
+                continue
+
+            self.busy = True
+            try:
+                await loop.run_in_executor(self.executor, self.batcher.step)
+            except Exception as e:
+                self._fail_batch(e)
+            finally:
+                self.busy = False
+
+    def _batch_room(self) -> int:
+        b = self.batcher
+        return b.max_batch - len(b.active) - len(b.pending) - len(self.deferred)
+
+    def _admit(self, job: Job, loop: asyncio.AbstractEventLoop) -> None:
+        """Build the prompt of job and submit it to the batch (event loop thread)."""
+        if job.future.cancelled():
+            self.queue.task_done()   # client went away while queued: skip the work
+            return
+        if job.session_id in self.in_flight:
+            self.deferred.append(job)
+            return
+        from inference.stopping import StopCriteria
+
+        t0 = time.time()
+        try:
+            session = self._session(job.session_id)
+            max_new_tokens = settings.max_new_tokens
+            if self.governor is not None:
+                max_new_tokens = self.governor.check(session.history, None, max_new_tokens)
+            prompt_ids = session.history.build_prompt_ids(self.backend, job.text)
+        except Exception as e:
+            self._settle(job, loop, error=e)
+            return
+        # One StopCriteria per row: each keeps its own reason and held-back text
+        stop = StopCriteria.for_backend(self.backend, settings.stop_strings, settings.max_time_s)
+        self.in_flight[job.session_id] = job
+        self.batcher.submit(
+            prompt_ids,
+            max_new_tokens=max_new_tokens,
+            on_done=lambda req: self._finish_batched(job, session, stop, t0, req, loop),
+            stop=stop,
+        )
+
+    def _finish_batched(
+        self,
+        job: Job,
+        session: WebSession,
+        stop: Any,
+        t0: float,
+        req: Any,
+        loop: asyncio.AbstractEventLoop,
+    ) -> None:
+        """on_done of a batched reply (inference thread)."""
+        self.in_flight.pop(job.session_id, None)
+        try:
+            reply = self.backend.decode(req.generated)
+            session.history.add_turn(job.text, reply, reply_ids=req.generated)
+            result = self._result(job, reply, t0, stop.reason)
+        except Exception as e:
+            self._settle(job, loop, error=e)
+            return
+        self._settle(job, loop, result=result)
+
+    def _fail_batch(self, error: Exception) -> None:
+        """A batched step raised: fail every reply in the batch and start over."""
+        from inference.batch_scheduler import BatchScheduler
+
+        loop = asyncio.get_running_loop()
+        for job in self.in_flight.values():
+            self._settle(job, loop, error=error)
+        self.in_flight.clear()
+        self.batcher = BatchScheduler(self.backend, max_batch=settings.web_batch)
+
+    def _settle(
+        self,
+        job: Job,
+        loop: asyncio.AbstractEventLoop,
+        result: Optional[Dict[str, Any]] = None,
+        error: Optional[Exception] = None,
+    ) -> None:
+        """Complete job's future and mark it done in the queue, from any thread."""
+
+        def settle() -> None:
+            if not job.future.done():
+                if error is not None:
+                    job.future.set_exception(error)
+                else:
+                    job.future.set_result(result)
+            self.queue.task_done()
+
+        loop.call_soon_threadsafe(settle)
+
+    def submit(self, session_id: str, text: str) -> asyncio.Future:
+        """Enqueue a job; returns the future of its result. Raises 429 when full."""
+        known = session_id in (self.store if self.store is not None else self.sessions)
+        if not known and self.governor is not None and not self.governor.accept_new_session():
+            raise HTTPException(
+                status_code=503,
+                detail={"error": "low memory, not accepting new sessions"},
+                headers={"Retry-After": "30"},
+            )
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait(Job(session_id, text, future))
+        except asyncio.QueueFull:
+            raise HTTPException(
+                status_code=429,
+                detail={"error": "server busy", "queue_size": self.queue.maxsize},
+                headers={"Retry-After": "5"},
+            )
+        return future
+
+
+worker: Optional[InferenceWorker] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global worker
+    backend = load_backend()
+    worker = InferenceWorker(backend, settings.web_queue_size, settings.web_max_sessions)
+    task = asyncio.create_task(worker.run_forever())
+    try:
+        yield
+    finally:
+        task.cancel()
+        # Let a reply in progress finish and log before the logger closes
+        await asyncio.to_thread(worker.executor.shutdown, wait=True)
+        worker.logger.close()
+
+
+app = FastAPI(lifespan=lifespan)
+
 
 @app.post("/chat")
-def chat(m: Msg):
-    global history
-    prompt = cache.apply(backend, history, m.text)
-    out = backend.generate(prompt, max_tokens=128)
-    history = prompt + out
-    logger.log_interaction("user", m.text)
-    logger.log_interaction("assistant", out)
-    logger.log_metrics({})
-    return {"reply": out.strip()}
+async def chat(m: Msg) -> Dict[str, Any]:
+    session_id = m.session_id or uuid.uuid4().hex
+    result = await worker.submit(session_id, m.text)
+    return {"session_id": session_id, **result}
+
+
+@app.get("/health")
+async def health() -> Dict[str, Any]:
+    return {
+        "queued": worker.queue.qsize(),
+        "queue_size": worker.queue.maxsize,
+        "busy": worker.busy,
+        "batched": len(worker.batcher.active) if worker.batcher is not None else None,
+        "sessions": len(worker.store) if worker.store is not None else len(worker.sessions),
+        "kv_store": dict(worker.store.stats) if worker.store is not None else None,
+        "proc_metrics": metrics_snapshot(),
+    }
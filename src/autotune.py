@@ -0,0 +1,168 @@
+# src/autotune.py
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+# Make "src" imports work when run from repo root
+CURRENT_DIR = os.path.dirname(__file__)
+if CURRENT_DIR not in sys.path:
+    sys.path.append(CURRENT_DIR)
+
+# Finds the fastest torch threading / CPU affinity / prefill chunk settings
+# for this host and model, and saves them as a CpuProfile that HFBackend
+# and HFBackendPi apply at startup:
+#
+#   python src/autotune.py --model_name distilgpt2
+#   python src/app_cli.py --model_name distilgpt2      # picks the profile up
+#
+# Inter-op threads can only be set once per process, so every inter-op
+# value is measured in its own child process; inside a child, intra-op
+# threads x affinity masks are swept first (whole-prompt prefill), then
+# the prefill chunk size for the best of them. The score is the time of a
+# reference turn: prefill of --prompt_tokens + decode of --decode_tokens.
+
+TEXT = (
+    "The Raspberry Pi is a small single-board computer. It is used to learn "
+    "programming, to build robots and to run small servers at home. "
+)
+
+
+def affinity_masks(threads: int, cpus: List[int]) -> List[List[int]]:
+    """All allowed CPUs, plus the first and last `threads` of them (little/big
+    clusters on asymmetric SoCs are contiguous ranges)."""
+    masks = [cpus]
+    if hasattr(os, "sched_setaffinity") and threads < len(cpus):
+        masks += [cpus[:threads], cpus[-threads:]]
+    return masks
+
+
+def run_child(args: argparse.Namespace, interop: int) -> Dict[str, Any]:
+    import torch
+
+    if interop > 0:
+        torch.set_num_interop_threads(interop)   # before any parallel work
+
+    from inference.transformers_backend import HFBackend
+    from utils.cpu_tuning import allowed_cpus
+
+    backend = HFBackend(model_name=args.model_name, dtype=args.dtype, cpu_profile=None)
+    ids = backend.encode(TEXT * (args.prompt_tokens // 20 + 1))[: args.prompt_tokens]
+    input_ids = torch.tensor([ids])
+    cpus = allowed_cpus()
+
+    def measure(threads: int, mask: List[int], chunk: int) -> Dict[str, Any]:
+        if hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(0, mask)
+        torch.set_num_threads(threads)
+        backend.prefill_chunk = chunk
+        prefill_s, decode_tps = [], []
+        for rep in range(args.reps + 1):
+            loop = backend.iter_ids(input_ids, max_new_tokens=args.decode_tokens, temperature=0.0)
+            t0 = time.perf_counter()
+            next(loop)
+            t1 = time.perf_counter()
+            n = 1 + sum(1 for _ in loop)
+            t2 = time.perf_counter()
+            if rep > 0:   # first run is warmup
+                prefill_s.append(t1 - t0)
+                decode_tps.append((n - 1) / max(t2 - t1, 1e-9))
+        p, d = statistics.median(prefill_s), statistics.median(decode_tps)
+        return {
+            "interop_threads": interop,
+            "num_threads": threads,
+            "affinity": [] if mask == cpus else mask,
+            "prefill_chunk": chunk,
+            "prefill_s": round(p, 4),
+            "decode_tokens_per_s": round(d, 2),
+            "turn_s": round(p + args.decode_tokens / d, 4),
+        }
+
+    if interop == 0:
+        # Baseline: torch defaults
+        return {"rows": [measure(torch.get_num_threads(), cpus, 0)]}
+
+    rows = []
+    for threads in args.threads:
+        for mask in affinity_masks(threads, cpus):
+            rows.append(measure(threads, mask, 0))
+            print(json.dumps(rows[-1]), file=sys.stderr, flush=True)
+    best = min(rows, key=lambda r: r["turn_s"])
+    mask = best["affinity"] or cpus
+    for chunk in args.chunks:
+        if 0 < chunk < args.prompt_tokens:
+            rows.append(measure(best["num_threads"], mask, chunk))
+            print(json.dumps(rows[-1]), file=sys.stderr, flush=True)
+    return {"rows": rows}
+
+
+def main() -> None:
+    ncpu = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description="Tune CPU threads / affinity / prefill chunk for a model")
+    parser.add_argument("--model_name", type=str, default="distilgpt2", help="HF model name or local path")
+    parser.add_argument("--dtype", default="float32", choices=["float32", "float16", "int8"])
+    parser.add_argument(
+        "--threads",
+        default=",".join(str(t) for t in range(1, ncpu + 1)),
+        help="Intra-op thread counts to try (default: 1..cores)",
+    )
+    parser.add_argument(
+        "--interop",
+        default=",".join(str(t) for t in sorted({1, min(2, ncpu), ncpu})),
+        help="Inter-op thread counts to try, one child process each",
+    )
+    parser.add_argument("--chunks", default="32,64,128", help="Prefill chunk sizes to try (whole prompt is always tried)")
+    parser.add_argument("--prompt_tokens", type=int, default=256, help="Prompt length of the reference turn")
+    parser.add_argument("--decode_tokens", type=int, default=32, help="Generated tokens of the reference turn")
+    parser.add_argument("--reps", type=int, default=3, help="Measured runs per setting (plus one warmup)")
+    parser.add_argument("--profile", default="data/cpu_profiles.json", help="Profile file to update")
+    parser.add_argument("--child", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.threads = [int(t) for t in args.threads.split(",") if t]
+    args.chunks = [int(c) for c in args.chunks.split(",") if c]
+
+    if args.child is not None:
+        print(json.dumps(run_child(args, args.child)))
+        return
+
+    from config import CpuProfile
+    from utils.cpu_tuning import host_key, model_key, save_profile
+
+    print(f"Tuning {model_key(args.model_name, args.dtype)} on {host_key()} ...")
+    rows: List[Dict[str, Any]] = []
+    for interop in [0] + [int(i) for i in args.interop.split(",") if i]:
+        cmd = [sys.executable, os.path.abspath(__file__), "--child", str(interop)]
+        for name in ("model_name", "dtype", "prompt_tokens", "decode_tokens", "reps"):
+            cmd += [f"--{name}", str(getattr(args, name))]
+        cmd += ["--threads", ",".join(map(str, args.threads)), "--chunks", ",".join(map(str, args.chunks))]
+        out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+        rows += json.loads(out.strip().splitlines()[-1])["rows"]
+
+    print(f"\n{'interop':>7} {'threads':>7} {'cpus':>12} {'chunk':>6} {'prefill s':>10} {'decode tok/s':>13} {'turn s':>7}")
+    for r in rows:
+        interop = r["interop_threads"] or "dflt"
+        cpus = ",".join(map(str, r["affinity"])) or "all"
+        print(
+            f"{interop:>7} {r['num_threads']:>7} {cpus:>12} {r['prefill_chunk'] or '-':>6} "
+            f"{r['prefill_s']:>10.4f} {r['decode_tokens_per_s']:>13.2f} {r['turn_s']:>7.3f}"
+        )
+
+    baseline = rows[0]
+    best = min(rows[1:] or rows, key=lambda r: r["turn_s"])
+    profile = CpuProfile(**{k: v for k, v in best.items() if k != "turn_s"})
+    save_profile(args.profile, args.model_name, profile, args.dtype)
+    print(
+        f"\nBest: interop={profile.interop_threads} threads={profile.num_threads} "
+        f"cpus={profile.affinity or 'all'} prefill_chunk={profile.prefill_chunk or 'off'} "
+        f"-> turn {best['turn_s']:.3f} s vs {baseline['turn_s']:.3f} s with torch defaults"
+    )
+    print(f"Saved to {args.profile}")
+
+
+if __name__ == "__main__":
+    main()
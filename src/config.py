@@ -1,8 +1,34 @@
+from typing import List
 from pydantic import BaseModel
+class CpuProfile(BaseModel):
+    # Written by autotune.py per (host, model), applied by the HF backends
+    num_threads: int = 0          # torch intra-op threads (0 = torch default)
+    interop_threads: int = 0      # torch inter-op threads (0 = torch default)
+    affinity: List[int] = []      # CPU ids the process is pinned to ([] = all)
+    prefill_chunk: int = 0        # prompt tokens per prefill forward (0 = whole prompt)
+    prefill_s: float = 0          # autotune measurements for these settings
+    decode_tokens_per_s: float = 0
 class Settings(BaseModel):
     log_dir: str = "data/logs"
+    log_max_mb: float = 8         # rotate the JSONL log at this size
+    log_max_age_s: float = 0      # ... or after this long (0 = size only)
+    log_compress: str = "gzip"    # rotated segments: none | gzip | zstd
+    log_max_total_mb: float = 256 # oldest segments are deleted above this (0 = keep all)
     max_ctx: int = 512
     cache_type: str = "sliding"   # sliding | paged | quantized
     backend: str = "llama"        # llama | hf
     model_path: str = "models/tinyllama-q4_0.gguf"
+    max_new_tokens: int = 128
+    web_queue_size: int = 4       # pending requests before the server answers 429
+    web_max_sessions: int = 32    # conversations kept (in RAM + spilled); least recently used is dropped
+    web_kv_budget_mb: int = 0     # hf: quantized session KV kept in RAM, rest spilled (0 = off)
+    web_kv_spill_dir: str = "data/kv_spill"
+    web_batch: int = 0            # hf: decode up to this many replies in one batched forward (0 = one at a time)
+    mem_soft_mb: float = 0        # memory governor: step down above this RSS (0 = off)
+    mem_hard_mb: float = 0        # stop replies / refuse sessions (0 = 1.25 x soft)
+    mem_min_available_mb: float = 128
+    stop_strings: List[str] = ["\nUser:", "\nAssistant:"]   # reply ends before these
+    max_time_s: float = 0         # per-reply generation time limit (0 = none)
+    cpu_profile_path: str = "data/cpu_profiles.json"   # hf: autotune.py results ("" = torch defaults)
+    trace_dir: str = ""           # hf: per-phase timings in the log + a Chrome trace per request here ("" = off)
 settings = Settings()
@@ -0,0 +1,217 @@
+# src/inference/batch_scheduler.py
+
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, List, Optional, Sequence
+
+import torch
+
+from inference.stopping import StopCriteria
+from kv_cache.hf_compat import KVLayers, to_layers, to_model_cache
+
+
+@dataclass
+class BatchRequest:
+    """One sequence handled by BatchScheduler."""
+
+    prompt_ids: List[int]
+    max_new_tokens: int = 64
+    temperature: float = 0.8
+    top_p: float = 0.95
+    # Called with each sampled id, and once with the request when it finishes
+    on_token: Optional[Callable[[int], None]] = None
+    on_done: Optional[Callable[["BatchRequest"], None]] = None
+    # EOS / stop strings / time limit for this row (one instance per request)
+    stop: Optional[StopCriteria] = None
+
+    generated: List[int] = field(default_factory=list)   # cut at stop.keep when done
+    done: bool = False
+
+
+class BatchScheduler:
+    """
+    Iteration-level (continuous) batching on top of an HFBackend.
+
+    All active sequences share one decode forward pass per step: their KV
+    is kept left-padded to a common length in one [B, H, T, D] tensor per
+    layer, with a [B, T] attention mask marking the padding and explicit
+    position_ids per row. Between steps, queued requests are prefilled and
+    join the batch, and finished ones leave it (their rows are dropped and
+    padding columns that no row needs any more are trimmed). A row is
+    finished after max_new_tokens, or as soon as its StopCriteria fires.
+
+    app_web feeds its request queue into one when web_batch > 1 (the
+    prompts are rebuilt from the text history, no KV reuse between
+    turns); scripts/batch_throughput.py measures it against sequential
+    decoding.
+    """
+
+    def __init__(self, backend: Any, max_batch: int = 8) -> None:
+        self.backend = backend
+        self.max_batch = max_batch
+        self.pending: Deque[BatchRequest] = deque()
+        self.active: List[BatchRequest] = []
+
+        # Batched decode state, one row per active request. The KV is kept
+        # as the model's own cache object between steps and only unpacked
+        # into per-layer tensors when rows join or leave.
+        self.past: Optional[Any] = None
+        self.padded = False                        # any padding in mask?
+        self.mask: Optional[torch.Tensor] = None   # [B, T], 0 = padding
+        self.positions: List[int] = []             # absolute position of each row's next token
+        self.tokens_out = 0
+
+    def submit(
+        self,
+        prompt_ids: Sequence[int],
+        max_new_tokens: int = 64,
+        temperature: float = 0.8,
+        top_p: float = 0.95,
+        on_token: Optional[Callable[[int], None]] = None,
+        on_done: Optional[Callable[[BatchRequest], None]] = None,
+        stop: Optional[StopCriteria] = None,
+    ) -> BatchRequest:
+        """
+        Queue a request; it joins the batch at the start of the next step.
+        stop must not be shared with another request.
+        """
+        req = BatchRequest(
+            list(prompt_ids)[: self.backend.max_ctx],
+            max_new_tokens,
+            temperature,
+            top_p,
+            on_token,
+            on_done,
+            stop,
+        )
+        self.pending.append(req)
+        return req
+
+    def has_work(self) -> bool:
+        return bool(self.pending or self.active)
+
+    def run(self) -> None:
+        """Step until every submitted request has finished."""
+        while self.has_work():
+            self.step()
+
+    def step(self) -> None:
+        """Admit queued requests, then run one batched decode step."""
+        while self.pending and len(self.active) < self.max_batch:
+            self._prefill(self.pending.popleft())
+        if self.active:
+            self._decode()
+
+    # --- internals -------------------------------------------------------------
+
+    def _emit(self, req: BatchRequest, logits: torch.Tensor) -> bool:
+        """Sample one token for req; returns True when the request is finished."""
+        token_id = self.backend._sample_next(logits, req.temperature, req.top_p)
+        req.generated.append(token_id)
+        self.tokens_out += 1
+        if req.on_token is not None:
+            req.on_token(token_id)
+        stopped = req.stop is not None and req.stop.add(token_id)
+        if stopped or len(req.generated) >= req.max_new_tokens:
+            if stopped:
+                req.generated = req.generated[: req.stop.keep]
+            self._finish(req)
+        return req.done
+
+    @staticmethod
+    def _finish(req: BatchRequest) -> None:
+        req.done = True
+        if req.on_done is not None:
+            req.on_done(req)
+
+    def _prefill(self, req: BatchRequest) -> None:
+        if req.max_new_tokens <= 0 or not req.prompt_ids:
+            self._finish(req)
+            return
+        if req.stop is not None:
+            req.stop.reset()
+
+        input_ids = torch.tensor([req.prompt_ids], device=self.backend.device)
+        with torch.inference_mode():
+            out = self.backend.model(input_ids=input_ids, use_cache=True)
+        if self._emit(req, out.logits[0, -1]):
+            return
+        self._join(req, to_layers(out.past_key_values), len(req.prompt_ids))
+
+    def _join(self, req: BatchRequest, layers: KVLayers, length: int) -> None:
+        """Add a prefilled sequence as a new row, left-padding to a common length."""
+        row_mask = torch.ones((1, length), dtype=torch.long, device=self.backend.device)
+        if self.past is None:
+            self.past, self.mask = to_model_cache(layers), row_mask
+        else:
+            t = max(self.mask.shape[1], length)
+            merged = []
+            for (bk, bv), (k, v) in zip(to_layers(self.past), layers):
+                merged.append(
+                    (
+                        torch.cat([_left_pad(bk, t), _left_pad(k, t)], dim=0),
+                        torch.cat([_left_pad(bv, t), _left_pad(v, t)], dim=0),
+                    )
+                )
+            self.past = to_model_cache(merged)
+            self.mask = torch.cat([_left_pad(self.mask, t, dim=1), _left_pad(row_mask, t, dim=1)], dim=0)
+            self.padded = not bool(self.mask.all())
+        self.active.append(req)
+        self.positions.append(length)
+
+    def _decode(self) -> None:
+        dev = self.backend.device
+        input_ids = torch.tensor([[r.generated[-1]] for r in self.active], device=dev)
+        position_ids = torch.tensor([[p] for p in self.positions], device=dev)
+        ones = torch.ones((len(self.active), 1), dtype=self.mask.dtype, device=dev)
+        self.mask = torch.cat([self.mask, ones], dim=1)
+
+        with torch.inference_mode():
+            out = self.backend.model(
+                input_ids=input_ids,
+                # No padding -> let attention take its plain causal path
+                attention_mask=self.mask if self.padded else None,
+                position_ids=position_ids,
+                past_key_values=self.past,
+                use_cache=True,
+            )
+        self.past = out.past_key_values
+        self.positions = [p + 1 for p in self.positions]
+
+        logits = out.logits[:, -1]
+        keep = [i for i, req in enumerate(self.active) if not self._emit(req, logits[i])]
+        if len(keep) < len(self.active):
+            self._evict(keep)
+
+    def _evict(self, keep: List[int]) -> None:
+        """Drop finished rows and the padding columns no remaining row needs."""
+        if not keep:
+            self.active, self.positions = [], []
+            self.past = self.mask = None
+            self.padded = False
+            return
+
+        rows = torch.tensor(keep, device=self.mask.device)
+        mask = self.mask.index_select(0, rows)
+        # Leading columns that are padding in every remaining row
+        start = int((mask.sum(dim=0) > 0).nonzero()[0])
+        self.mask = mask[:, start:]
+        self.padded = not bool(self.mask.all())
+        self.past = to_model_cache(
+            [
+                (k.index_select(0, rows)[:, :, start:], v.index_select(0, rows)[:, :, start:])
+                for k, v in to_layers(self.past)
+            ]
+        )
+        self.active = [self.active[i] for i in keep]
+        self.positions = [self.positions[i] for i in keep]
+
+
+def _left_pad(t: torch.Tensor, length: int, dim: int = 2) -> torch.Tensor:
+    """Zero-pad t on the left along dim up to length."""
+    n = length - t.shape[dim]
+    if n == 0:
+        return t
+    shape = list(t.shape)
+    shape[dim] = n
+    return torch.cat([t.new_zeros(shape), t], dim=dim)
@@ -0,0 +1,331 @@
+# src/inference/chat_session.py
+
+from typing import Any, Callable, Generator, Iterator, List, Optional, Tuple
+
+import torch
+
+from inference.stopping import StopCriteria, stream_text
+from kv_cache.hf_compat import crop_back, to_layers, to_model_cache
+
+
+class ChatSession:
+    """
+    Multi-turn chat that keeps the KV state between replies.
+
+    Instead of re-rendering the whole history as text and prefilling it
+    from scratch every turn, only the new "User: ... Assistant:" tokens
+    are run through the model on top of the cached past. The token budget
+    of the text cache (SlidingWindowCache / PagedCache) still decides which
+    turns are kept; evicted turns are trimmed from the front of the KV.
+
+    kv_cache: optional QuantizedKVCache that holds the KV between (and
+    during) turns instead of the model's float past_key_values.
+    If the history has a kv_pool (PagedCache), the KV lives in blocks of
+    that pool instead; turns are evicted early when the pool runs short.
+
+    GPT-2 uses absolute position embeddings, so after a trim new tokens keep
+    their original absolute positions. Once those would run past the
+    model's position limit the kept turns are re-prefilled from position 0.
+
+    A reply that ends early (stop string, EOS, should_stop) leaves the KV
+    out of step with the kept reply tokens: the last sampled token was
+    never run, and a stop string's tokens were. Missing tokens are
+    prefilled with the next turn (unfed); extra ones are cropped, or the
+    kept turns are re-prefilled when the KV cannot be cropped.
+    """
+
+    def __init__(self, backend: Any, history: Any, kv_cache: Optional[Any] = None) -> None:
+        self.backend = backend
+        self.history = history
+        self.kv_cache = kv_cache
+        self.kv_pool = getattr(history, "kv_pool", None) if kv_cache is None else None
+        self.seq: Optional[Any] = None   # PagedSequence when kv_pool is used
+
+        self.past: Optional[Any] = None
+        self.turn_ids: List[List[int]] = []   # token ids held in KV, per turn
+        self.sep_lens: List[int] = []         # leading "\n" tokens of each turn
+        self.pos = 0                          # absolute position of the next token
+        self.unfed: List[int] = []            # kept reply ids not yet in the KV
+        self._held_before = 0
+        self._seen_ids: List[int] = []        # kept ids already in the KV, before new_ids
+        self.last_prefill_tokens = 0
+
+        cfg = backend.model.config
+        self.max_positions = getattr(cfg, "n_positions", None) or getattr(
+            cfg, "max_position_embeddings", None
+        )
+
+    # --- KV bookkeeping --------------------------------------------------------
+
+    def kv_length(self) -> int:
+        return sum(len(t) for t in self.turn_ids)
+
+    def reset(self) -> None:
+        if self.seq is not None:
+            self.seq.release()
+            self.seq = None
+        self.past = None
+        self.turn_ids = []
+        self.sep_lens = []
+        self.pos = 0
+        self.unfed = []
+        if self.kv_cache is not None:
+            self.kv_cache.reset()
+
+    def _trim_front(self, n: int) -> None:
+        if n == 0:
+            return
+        if self.kv_cache is not None:
+            self.kv_cache.trim_front(n)
+        elif self.seq is not None:
+            self.seq.trim_front(n)
+        elif self.past is not None:
+            self.past = to_model_cache(
+                [(k[:, :, n:], v[:, :, n:]) for k, v in to_layers(self.past)]
+            )
+
+    def _trim_back(self, n: int) -> None:
+        if n == 0:
+            return
+        if self.kv_cache is not None:
+            self.kv_cache.trim_back(n)
+        elif self.seq is not None:
+            self.seq.trim_back(n)
+        elif self.past is not None:
+            crop_back(self.past, n)
+
+    def _held(self, past: Any) -> int:
+        """Positions currently in the KV."""
+        if self.kv_cache is not None:
+            return self.kv_cache.seq_length()
+        return 0 if past is None else past.get_seq_length()
+
+    def _drop_turns(self, n_turns: int) -> None:
+        if n_turns == 0:
+            return
+        if n_turns >= len(self.turn_ids):
+            self.reset()
+            return
+
+        dropped = sum(len(t) for t in self.turn_ids[:n_turns])
+        del self.turn_ids[:n_turns]
+        del self.sep_lens[:n_turns]
+
+        # The new first turn should not start with a separator
+        sep = self.sep_lens[0]
+        self.turn_ids[0] = self.turn_ids[0][sep:]
+        self.sep_lens[0] = 0
+        self._trim_front(dropped + sep)
+
+    def _turns_to_drop(self, sep_len: int, body_len: int) -> int:
+        max_tokens = getattr(self.history, "max_tokens", None)
+        max_turns = getattr(self.history, "max_turns", None)
+
+        total = self.kv_length()
+        drop = 0
+        while drop < len(self.turn_ids):
+            kept_turns = len(self.turn_ids) - drop
+            # kept tokens, minus the first kept turn's separator, plus new turn
+            prompt_len = total - self.sep_lens[drop] + sep_len + body_len
+            over_turns = max_turns is not None and kept_turns > max_turns
+            over_tokens = max_tokens is not None and prompt_len > max_tokens
+            if not (over_turns or over_tokens):
+                break
+            total -= len(self.turn_ids[drop])
+            drop += 1
+        return drop
+
+    def _past_for_prefill(self) -> Optional[Any]:
+        if getattr(self.kv_cache, "append_only", False):
+            return self.kv_cache.as_cache(self.backend.model.config.num_hidden_layers)
+        if self.kv_cache is not None:
+            layers = self.kv_cache.get()
+            return to_model_cache(layers) if layers is not None else None
+        if self.kv_pool is not None:
+            if self.seq is None:
+                self.seq = self.kv_pool.new_sequence()
+            # A new cache object per reply: its gather scratch goes with it
+            return self.seq.as_cache()
+        return self.past
+
+    def use_kv_cache(self, kv_cache: Any) -> bool:
+        """
+        Move the float KV held between turns into kv_cache (e.g. an
+        append-only QuantizedKVCache) and keep using it from now on.
+        Returns False when the session already uses a KV cache or a pool.
+        """
+        if self.kv_cache is not None or self.kv_pool is not None:
+            return False
+        kv_cache.reset()
+        if self.past is not None:
+            kv_cache.store(self.past)
+        self.past = None
+        self.kv_cache = kv_cache
+        return True
+
+    def fork(self) -> "ChatSession":
+        """
+        New session that continues this conversation from the same KV,
+        e.g. several sessions on top of one shared preamble, or a second
+        answer to the same question. The history is copied; paged KV
+        blocks are shared and copied only when one session writes into a
+        shared block, and a float past is shared as-is (decode never
+        writes into its tensors). Not supported with a kv_cache.
+        """
+        if self.kv_cache is not None:
+            raise RuntimeError("ChatSession.fork() does not support a kv_cache")
+        other = ChatSession(self.backend, self.history.copy())
+        if self.seq is not None:
+            other.seq = self.seq.fork()
+        if self.past is not None:
+            other.past = to_model_cache(to_layers(self.past))
+        other.turn_ids = [list(ids) for ids in self.turn_ids]
+        other.sep_lens = list(self.sep_lens)
+        other.pos = self.pos
+        other.unfed = list(self.unfed)
+        return other
+
+    def _pool_short(self, n: int) -> bool:
+        if self.kv_pool is None:
+            return False
+        if self.seq is None:
+            needed = -(-n // self.kv_pool.block_size)
+        else:
+            needed = self.seq.blocks_needed(n)
+        return needed > self.kv_pool.num_free
+
+    # --- chat ------------------------------------------------------------------
+
+    def _prepare(self, user_text: str, max_new_tokens: int) -> Tuple[List[int], List[int], List[int]]:
+        """Evict turns as needed; returns (separator ids, turn body ids, ids to prefill)."""
+        b = self.backend
+        sep = b.encode("\n")
+        body = b.encode(f"User: {user_text}\nAssistant:")
+
+        self._drop_turns(self._turns_to_drop(len(sep), len(body)))
+        # Paged KV: evict more turns while the pool can't hold this one
+        while self.turn_ids and self._pool_short(
+            len(self.unfed) + len(sep) + len(body) + max_new_tokens
+        ):
+            self._drop_turns(1)
+        if not self.turn_ids:
+            sep = []
+            # Single huge message: keep its tail, like the text caches do
+            max_tokens = getattr(self.history, "max_tokens", None)
+            if max_tokens is not None and 0 < max_tokens < len(body):
+                body = body[-max_tokens:]
+        new_ids = self.unfed + sep + body
+        if self._pool_short(len(new_ids) + max_new_tokens):
+            raise RuntimeError("KV block pool too small for this turn")
+
+        # Out of absolute positions: re-prefill kept turns from position 0
+        if (
+            self.max_positions is not None
+            and self.pos + len(new_ids) + max_new_tokens > self.max_positions
+            and self.turn_ids
+        ):
+            kept = [t for ids in self.turn_ids for t in ids]
+            turn_ids, sep_lens = self.turn_ids, self.sep_lens
+            self.reset()
+            self.turn_ids, self.sep_lens = turn_ids, sep_lens
+            new_ids = kept + sep + body
+        kept = [t for ids in self.turn_ids for t in ids]
+        self._seen_ids = kept[: len(kept) - (len(new_ids) - len(sep) - len(body))]
+        self.unfed = []
+        return sep, body, new_ids
+
+    def _loop(
+        self,
+        new_ids: List[int],
+        max_new_tokens: int,
+        temperature: float,
+        top_p: float,
+        should_stop: Optional[Callable[[], bool]] = None,
+        sampler: Optional[Any] = None,
+        stop: Optional[StopCriteria] = None,
+    ) -> Generator[int, None, Any]:
+        b = self.backend
+        past = self._past_for_prefill()
+        self._held_before = self._held(past)
+        return b.iter_ids(
+            torch.tensor([new_ids], device=b.device),
+            max_new_tokens=max_new_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            kv_cache=self.kv_cache,
+            past_kv=past,
+            position_offset=self.pos,
+            should_stop=should_stop,
+            sampler=sampler,
+            stop=stop,
+            seen_ids=self._seen_ids,
+        )
+
+    def _finish(
+        self,
+        user_text: str,
+        sep: List[int],
+        body: List[int],
+        new_ids: List[int],
+        generated: List[int],
+        past: Any,
+    ) -> str:
+        self.last_prefill_tokens = len(new_ids)
+        held = self._held(past)
+        self.pos += held - self._held_before
+        self.past = None if self.kv_cache is not None or self.seq is not None else past
+
+        self.turn_ids.append(sep + body + generated)
+        self.sep_lens.append(len(sep))
+
+        # Line the KV up with the kept tokens (see class docstring)
+        extra = held - self.kv_length()
+        if extra > 0:
+            self._trim_back(extra)
+            self.pos -= extra
+        elif extra < 0:
+            self.unfed = [t for ids in self.turn_ids for t in ids][extra:]
+
+        reply = self.backend.decode(generated)
+        self.history.add_turn(user_text, reply, reply_ids=generated)
+        # Keep the history aligned with what the KV actually holds
+        self.history.keep_last(len(self.turn_ids))
+        return reply
+
+    def reply(
+        self,
+        user_text: str,
+        max_new_tokens: int = 64,
+        temperature: float = 0.8,
+        top_p: float = 0.95,
+        should_stop: Optional[Callable[[], bool]] = None,
+        sampler: Optional[Any] = None,
+        stop: Optional[StopCriteria] = None,
+    ) -> str:
+        sep, body, new_ids = self._prepare(user_text, max_new_tokens)
+        generated, past = self.backend.drain(
+            self._loop(new_ids, max_new_tokens, temperature, top_p, should_stop, sampler, stop)
+        )
+        if stop is not None:
+            generated = generated[: stop.keep]
+        return self._finish(user_text, sep, body, new_ids, generated, past)
+
+    def reply_stream(
+        self,
+        user_text: str,
+        max_new_tokens: int = 64,
+        temperature: float = 0.8,
+        top_p: float = 0.95,
+        should_stop: Optional[Callable[[], bool]] = None,
+        sampler: Optional[Any] = None,
+        stop: Optional[StopCriteria] = None,
+    ) -> Iterator[str]:
+        """Like reply(), but yields text deltas as tokens are sampled."""
+        sep, body, new_ids = self._prepare(user_text, max_new_tokens)
+        loop = self._loop(new_ids, max_new_tokens, temperature, top_p, should_stop, sampler, stop)
+
+        generated: List[int] = []
+        past = yield from stream_text(
+            loop, self.backend.tokenizer, stop, generated, tracer=getattr(self.backend, "tracer", None)
+        )
+        self._finish(user_text, sep, body, new_ids, generated, past)
@@ -0,0 +1,152 @@
+# src/inference/decode_loop.py
+
+from typing import Any, Callable, Generator, Optional, Sequence
+
+import torch
+
+from inference.prefill import prefill
+from inference.sampler import Sampler, sample_logits
+from inference.stopping import StopCriteria
+from kv_cache.hf_compat import to_model_cache
+from kv_cache.offload_cache import MmapKVBuffer
+from kv_cache.static_cache import StaticKVBuffer
+from utils.tracing import span_fn
+
+
+def static_past(backend: Any, max_new_tokens: int) -> Any:
+    """
+    Fresh cache object over backend.static_kv, the preallocated KV buffer
+    (an MmapKVBuffer when backend.kv_offload_mb > 0). The buffer is
+    (re)allocated only when a call needs more positions than it holds.
+    """
+    needed = backend.max_ctx + max_new_tokens
+    if backend.static_kv is None or backend.static_kv.max_ctx < needed:
+        backend.static_kv = None  # drop the old buffer before allocating
+        if backend.kv_offload_mb > 0:
+            backend.static_kv = MmapKVBuffer.for_model(
+                backend.model, needed, backend.kv_offload_mb * 1024**2, backend.kv_offload_dir
+            )
+        else:
+            backend.static_kv = StaticKVBuffer.for_model(backend.model, needed)
+    return backend.static_kv.new_cache()
+
+
+def decode_loop(
+    backend: Any,
+    input_ids: torch.Tensor,
+    max_new_tokens: int,
+    temperature: float,
+    top_p: float,
+    kv_cache: Optional[Any] = None,
+    past_kv: Optional[Any] = None,
+    attention_mask: Optional[torch.Tensor] = None,
+    position_offset: Optional[int] = None,
+    should_stop: Optional[Callable[[], bool]] = None,
+    sampler: Optional[Sampler] = None,
+    stop: Optional[StopCriteria] = None,
+    seen_ids: Optional[Sequence[int]] = None,
+    graph_step: Optional[Callable[[Optional[Any], Any], Any]] = None,
+) -> Generator[int, None, Any]:
+    """
+    Prefill + token-by-token decode for the HF backends (HFBackend.iter_ids
+    and HFBackendPi._iter_tokens); see HFBackend.iter_ids for the
+    arguments. backend supplies model, device, prefill_chunk and tracer.
+
+    kv_cache with store() / get() is re-quantized every step; an
+    append-only one is written by the model through as_cache().
+    graph_step(kv_cache, past_kv), called after the prefill, may return a
+    captured decode step (CapturedDecodeStep) to run instead of the eager
+    forward; None = eager.
+
+    Yields each token id right after it is sampled; the generator's
+    return value is the final past_key_values.
+    """
+    model = backend.model
+    device = backend.device
+
+    def positions(start: int, n: int) -> Optional[torch.Tensor]:
+        if position_offset is None:
+            return None
+        return torch.arange(start, start + n, device=device).unsqueeze(0)
+
+    pos = position_offset or 0
+    # Append-only quantized KV: the model writes into it directly and
+    # attention reads a one-layer dequantized scratch (no float past)
+    if getattr(kv_cache, "append_only", False):
+        past_kv = kv_cache.as_cache(model.config.num_hidden_layers)
+    requant = hasattr(kv_cache, "store") and not getattr(kv_cache, "append_only", False)
+    if stop is not None:
+        stop.reset()
+    if sampler is not None:
+        sampler.reset(model.config.vocab_size, list(seen_ids or ()) + input_ids[0].tolist())
+
+    span = span_fn(backend.tracer)
+
+    # 1) Initial forward pass (in prefill_chunk pieces if set)
+    with span("prefill"):
+        logits, past_kv = prefill(
+            model, input_ids, past_kv, attention_mask, positions, pos, backend.prefill_chunk
+        )
+    pos += input_ids.shape[1]
+    if requant:
+        with span("kv_store"):
+            kv_cache.store(past_kv)
+
+    graph = None
+    if graph_step is not None and position_offset is None:
+        with span("graph_capture"):
+            graph = graph_step(kv_cache, past_kv)
+    if graph is not None:
+        pos = past_kv.get_seq_length()
+
+    # 2) Token-by-token loop
+    for _ in range(max_new_tokens):
+
+        # Retrieve quantized KV if used
+        if requant:
+            with span("kv_get"):
+                past_kv = kv_cache.get()
+
+                if past_kv is None:
+                    break
+                past_kv = to_model_cache(past_kv)
+
+        # next token
+        with span("sample"):
+            if sampler is not None:
+                next_id = sampler(logits[0])
+            else:
+                next_id = sample_logits(logits[0], temperature, top_p)
+        with span("stop"):
+            done = stop is not None and stop.add(next_id)
+        yield next_id
+        if done or (should_stop is not None and should_stop()):
+            break
+
+        # feed next token
+        if graph is not None:
+            with span("forward"):
+                logits = graph(next_id, pos)
+            pos += 1
+            continue
+        next_input = torch.tensor([[next_id]], device=device)
+
+        with torch.inference_mode():
+            with span("forward"):
+                outputs = model(
+                    input_ids=next_input,
+                    past_key_values=past_kv,
+                    position_ids=positions(pos, 1),
+                    use_cache=True,
+                )
+            logits = outputs.logits[:, -1, :]
+            past_kv = outputs.past_key_values
+            pos += 1
+
+            if requant:
+                with span("kv_store"):
+                    kv_cache.store(past_kv)
+
+    if graph is not None:
+        graph.sync(past_kv, pos)
+    return past_kv
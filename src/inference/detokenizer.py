@@ -0,0 +1,52 @@
+# src/inference/detokenizer.py
+
+from typing import Any, List
+
+
+class IncrementalDetokenizer:
+    """
+    Turns a stream of token ids into text deltas.
+
+    Only a short window of recent ids is decoded per token (not the whole
+    reply), so the cost per token stays constant. Text ending in U+FFFD
+    (a multi-byte character split across BPE tokens) is held back until
+    the next token completes it.
+    """
+
+    # Give up waiting for a character to complete after this many tokens
+    # (the model can emit genuinely invalid byte sequences).
+    MAX_PENDING = 8
+
+    def __init__(self, tokenizer: Any, skip_special_tokens: bool = True) -> None:
+        self.tokenizer = tokenizer
+        self.skip_special_tokens = skip_special_tokens
+        self.ids: List[int] = []
+        self.prefix_offset = 0   # start of the context window
+        self.read_offset = 0     # ids before this have been emitted
+
+    def _decode(self, ids: List[int]) -> str:
+        return self.tokenizer.decode(ids, skip_special_tokens=self.skip_special_tokens)
+
+    def _advance(self, force: bool) -> str:
+        prefix_text = self._decode(self.ids[self.prefix_offset : self.read_offset])
+        new_text = self._decode(self.ids[self.prefix_offset :])
+
+        pending = len(self.ids) - self.read_offset
+        complete = not new_text.endswith("�")
+        if len(new_text) > len(prefix_text) and (complete or force or pending >= self.MAX_PENDING):
+            delta = new_text[len(prefix_text) :]
+            self.prefix_offset = self.read_offset
+            self.read_offset = len(self.ids)
+            return delta
+        return ""
+
+    def add(self, token_id: int) -> str:
+        """Feed one token id; returns the newly printable text (may be "")."""
+        self.ids.append(token_id)
+        return self._advance(force=False)
+
+    def flush(self) -> str:
+        """Emit whatever is still held back at the end of generation."""
+        if self.read_offset == len(self.ids):
+            return ""
+        return self._advance(force=True)
@@ -0,0 +1,203 @@
+# src/inference/graph_decode.py
+
+import math
+import warnings
+from typing import Any, Dict, List, Optional
+
+import torch
+from torch import nn
+
+from kv_cache.static_cache import StaticKVBuffer, _BufferLayer
+
+# GPT-2 config options _GPT2Step does not implement, with their plain values
+UNSUPPORTED_GPT2_OPTIONS = {
+    "scale_attn_weights": True,
+    "scale_attn_by_inverse_layer_idx": False,
+    "reorder_and_upcast_attn": False,
+}
+
+
+class _GPT2Step(nn.Module):
+    """
+    One GPT-2 decode step with fixed shapes: token id + position in,
+    logits out, K/V written in place into a [layers, 2, H, cap, D] buffer.
+    Attention runs over the first `window` positions (all of them if None)
+    with a position mask, so the shapes never change and the step can be
+    traced once per window.
+
+    The model's own LayerNorm / projection / activation modules are called,
+    so float, float16 and dynamic-int8 weights all work.
+    """
+
+    def __init__(self, model: Any) -> None:
+        super().__init__()
+        inner = model.transformer
+        self.wte = inner.wte
+        self.wpe = inner.wpe
+        self.blocks = inner.h
+        self.ln_f = inner.ln_f
+        self.lm_head = model.lm_head
+        cfg = model.config
+        self.num_heads = cfg.n_head
+        self.head_dim = cfg.n_embd // cfg.n_head
+        self.scale = 1.0 / math.sqrt(self.head_dim)
+        self.window: Optional[int] = None
+
+    def forward(self, input_ids: torch.Tensor, pos: torch.Tensor, kv: torch.Tensor) -> torch.Tensor:
+        h, d = self.num_heads, self.head_dim
+        cap = kv.shape[3] if self.window is None else self.window
+        x = self.wte(input_ids) + self.wpe(pos).unsqueeze(0)             # [1, 1, E]
+        # Positions after pos are not written yet
+        visible = torch.arange(cap, device=kv.device) <= pos              # [cap]
+
+        for i, block in enumerate(self.blocks):
+            attn = block.attn
+            q, k, v = attn.c_attn(block.ln_1(x)).split(h * d, dim=2)
+            q = q.view(h, 1, d)
+            kv[i, 0].index_copy_(1, pos, k.view(h, 1, d))
+            kv[i, 1].index_copy_(1, pos, v.view(h, 1, d))
+
+            keys, values = kv[i, 0, :, :cap], kv[i, 1, :, :cap]
+            scores = torch.matmul(q, keys.transpose(1, 2)) * self.scale       # [H, 1, cap]
+            scores = scores.masked_fill(~visible, float("-inf"))
+            probs = torch.softmax(scores.float(), dim=-1).to(q.dtype)
+            ctx = torch.matmul(probs, values).reshape(1, 1, h * d)
+            x = x + attn.c_proj(ctx)
+            x = x + block.mlp(block.ln_2(x))
+
+        return self.lm_head(self.ln_f(x))[:, -1, :]
+
+
+class CapturedDecodeStep:
+    """
+    Single-token decode for HFBackend with the per-token Python dispatch
+    of the HF module stack (cache objects, mask building, hooks) removed:
+    _GPT2Step is traced with torch.jit and frozen, once per attention
+    window. Windows are powers of two from min_window up to the buffer
+    capacity, so a short reply doesn't attend over the whole buffer; each
+    is captured the first time decode reaches it.
+
+    The eager step is first checked against the HF model's own logits on
+    a few tokens; GPT-2 options it does not implement are refused up
+    front, and any other mismatch leaves captured False, so HFBackend
+    decodes through the HF model. Every graph is then checked against the
+    eager step on a scratch copy of the buffer; if tracing fails or the
+    outputs differ, the eager _GPT2Step is used instead (still without
+    the HF cache plumbing), and any error while running a graph switches
+    to eager for good.
+    """
+
+    def __init__(self, model: Any, kv: StaticKVBuffer, min_window: int = 64) -> None:
+        if not hasattr(model, "transformer") or not hasattr(model.transformer, "h"):
+            raise ValueError("Captured decode needs a GPT-2 style model (model.transformer.h)")
+        cfg = model.config
+        unsupported = [
+            name for name, plain in UNSUPPORTED_GPT2_OPTIONS.items() if getattr(cfg, name, plain) != plain
+        ]
+        if unsupported:
+            raise ValueError(f"Captured decode does not implement GPT-2 {', '.join(unsupported)}")
+        self.kv = kv
+        self.eager = _GPT2Step(model).eval()
+        self.graphs: Dict[int, Any] = {}
+        self.error: Optional[str] = None
+        cap = kv.buf.shape[3]
+        self.windows: List[int] = []
+        w = min_window
+        while w < cap:
+            self.windows.append(w)
+            w *= 2
+        self.windows.append(cap)
+        try:
+            self._check_model(model)
+        except Exception as e:   # eager step is not this model: HF forward instead
+            self.error = f"{type(e).__name__}: {e}"
+        self._graph(self.windows[0])   # fail early if this model can't be captured
+
+    @property
+    def captured(self) -> bool:
+        return self.error is None
+
+    @torch.inference_mode()
+    def _check_model(self, model: Any, n: int = 4) -> None:
+        """The eager step must reproduce model(...) logits, position by position."""
+        buf = self.kv.buf
+        scratch = torch.zeros_like(buf[:, :, :, :n])
+        ids = (torch.arange(n, device=buf.device) * 7 + 1).remainder(model.config.vocab_size).unsqueeze(0)
+        ref = model(input_ids=ids, use_cache=False).logits[0]
+        tol = 1e-3 if ref.dtype == torch.float32 else 5e-2
+        for p in range(n):
+            out = self.eager(ids[:, p:p + 1], torch.tensor([p], device=buf.device), scratch)
+            if not torch.allclose(out[0].float(), ref[p].float(), atol=tol, rtol=tol):
+                raise RuntimeError(f"eager step does not match the model at position {p}")
+
+    def _window(self, pos: int) -> int:
+        return next(w for w in self.windows if w > pos)
+
+    @torch.inference_mode()
+    def _graph(self, window: int) -> Optional[Any]:
+        if self.error is not None:
+            return None
+        graph = self.graphs.get(window)
+        if graph is not None:
+            return graph
+
+        buf = self.kv.buf
+        probe = buf.clone()
+        ids = torch.zeros((1, 1), dtype=torch.long, device=buf.device)
+        pos = torch.zeros((1,), dtype=torch.long, device=buf.device)
+        self.eager.window = window
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")   # tracer warnings on python scalars
+                graph = torch.jit.freeze(torch.jit.trace(self.eager, (ids, pos, probe), check_trace=False))
+            # Same logits and cache writes as eager, at a later position too
+            for p in (0, min(3, window - 1)):
+                pos.fill_(p)
+                ref_kv = probe.clone()
+                ref = self.eager(ids, pos, ref_kv)
+                out = graph(ids, pos, probe)
+                if not (torch.allclose(ref, out, atol=1e-4, rtol=1e-4) and torch.equal(ref_kv, probe)):
+                    raise RuntimeError("captured step does not match eager")
+        except Exception as e:   # any tracing problem: stay eager
+            self.error = f"{type(e).__name__}: {e}"
+            self.graphs.clear()
+            return None
+        finally:
+            self.eager.window = None
+        self.graphs[window] = graph
+        return graph
+
+    def owns(self, cache: Any) -> bool:
+        """True if cache is a new_cache() of this step's buffer (so K/V already sit in it)."""
+        layers = getattr(cache, "layers", None)
+        if not layers or len(layers) != self.kv.buf.shape[0]:
+            return False
+        return all(
+            type(layer) is _BufferLayer and layer._k.data_ptr() == self.kv.buf[i, 0].data_ptr()
+            for i, layer in enumerate(layers)
+        )
+
+    @staticmethod
+    def sync(cache: Any, length: int) -> None:
+        """Let the HF cache object see the positions written by captured steps."""
+        for layer in cache.layers:
+            layer.length = length
+            layer.keys = layer._k[:, :, :length]
+            layer.values = layer._v[:, :, :length]
+
+    @torch.inference_mode()
+    def __call__(self, token_id: int, pos: int) -> torch.Tensor:
+        """Logits [1, vocab] after token_id at position pos; K/V land in the buffer."""
+        buf = self.kv.buf
+        if pos >= buf.shape[3]:
+            raise RuntimeError(f"Static KV buffer full: {pos + 1} positions > capacity {buf.shape[3]}")
+        ids = torch.tensor([[token_id]], device=buf.device)
+        p = torch.tensor([pos], device=buf.device)
+        graph = self._graph(self._window(pos))
+        if graph is not None:
+            try:
+                return graph(ids, p, buf)
+            except Exception as e:
+                self.error = f"{type(e).__name__}: {e}"
+                self.graphs.clear()
+        return self.eager(ids, p, buf)
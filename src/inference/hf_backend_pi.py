@@ -1,8 +1,17 @@
 # src/inference/hf_backend_pi.py
 #Pi-optimized backend with lower RAM usage and manual generation loop
-from typing import List, Optional, Protocol, Any
+from typing import Callable, List, Optional, Protocol, Any, Iterator, Sequence, Union
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
+
+from inference.decode_loop import decode_loop, static_past
+from inference.sampler import Sampler, sample_logits
+from inference.speculative import SpeculativeDecoder
+from inference.stopping import StopCriteria, stream_text
+from inference.snapshot import load_pretrained
+from kv_cache.offload_cache import MmapKVBuffer
+from kv_cache.static_cache import StaticKVBuffer
+from utils.cpu_tuning import load_and_apply
+from utils.tracing import PhaseTracer, span_fn
 
 
 class KVCacheLike(Protocol):
@@ -24,9 +33,27 @@ class HFBackendPi:
     """
     Pi-optimized HuggingFace backend with:
     - CPU-only execution
-    - optional float16 weights (smaller RAM)
+    - optional float16 weights (smaller RAM) or dynamic INT8 weights
+      (dtype="int8": 4x smaller projections / LM head, int8 matmuls);
+      pre-quantized directories from scripts/quantize_model.py load
+      as int8 directly
+    - snapshot files (scripts/build_snapshot.py): tokenizer + weights in
+      one memory-mapped file for a fast cold start
     - manual token-by-token generation loop
       (needed to integrate quantized KV-cache).
+    - optional static KV buffer (static_cache=True): one preallocated
+      buffer written in place, so decode does no growing allocations.
+    - optional KV offload (kv_offload_mb > 0): the same buffer in a
+      memory-mapped file, with only the recently used layers resident.
+    - optional prompt-lookup speculation (prompt_lookup=True): n-grams
+      of the prompt and reply propose spec_k tokens that the model checks
+      in one forward pass; no draft model, no extra RAM.
+    - per-host CPU profile (cpu_profile, written by autotune.py): torch
+      thread counts, CPU affinity and prefill chunk size tuned for this
+      board and model, applied at startup.
+    - optional per-phase timers (tracer: a PhaseTracer): prefill, forward,
+      kv_store / kv_get, sample, stop and detokenize, with Chrome trace
+      export; no tracer = no timers.
 
     Works with distilgpt2 and other GPT-2 style causal LMs.
     """
@@ -35,27 +62,44 @@ class HFBackendPi:
         self,
         model_name: str = "distilgpt2",
         max_ctx: int = 512,
-        dtype: str = "float32",  # "float32" (default) or "float16" for smaller RAM
+        dtype: str = "float32",  # "float32" (default), "float16" or "int8" for smaller RAM
+        static_cache: bool = False,
+        kv_offload_mb: int = 0,   # > 0: KV in a memory-mapped file, this much resident
+        kv_offload_dir: str = "data/kv_offload",
+        prompt_lookup: bool = False,
+        spec_k: int = 4,
+        cpu_profile: Optional[str] = None,   # e.g. cpu_tuning.DEFAULT_PROFILE_PATH; None = torch defaults
+        prefill_chunk: Optional[int] = None,   # prompt tokens per forward (None = profile, 0 = all)
+        tracer: Optional[PhaseTracer] = None,
     ) -> None:
         self.model_name = model_name
         self.max_ctx = max_ctx
+        self.static_cache = static_cache
+        self.kv_offload_mb = kv_offload_mb
+        self.kv_offload_dir = kv_offload_dir
+        self.static_kv: Optional[Union[StaticKVBuffer, MmapKVBuffer]] = None
 
         # On Raspberry Pi: always CPU
         self.device = "cpu"
 
-        # Tokenizer
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-
-        # Model
-        self.model = AutoModelForCausalLM.from_pretrained(model_name)
+        # Threads / affinity before the model loads (and torch starts its pools)
+        self.cpu_profile = load_and_apply(cpu_profile, model_name, dtype) if cpu_profile else None
+        if prefill_chunk is None:
+            prefill_chunk = self.cpu_profile.prefill_chunk if self.cpu_profile else 0
+        self.prefill_chunk = prefill_chunk
+        self.tracer = tracer
 
-        if dtype == "float16":
-            # Halves model weight memory, but may be slower on CPU.
-            self.model = self.model.to(dtype=torch.float16)
+        # Tokenizer + model (float16 halves weight memory but may be slower
+        # on CPU; int8 is smaller still and uses int8 matmul kernels)
+        self.tokenizer, self.model, self.load_times = load_pretrained(model_name, dtype)
 
         self.model.to(self.device)
         self.model.eval()
 
+        self.speculator: Optional[SpeculativeDecoder] = None
+        if prompt_lookup:
+            self.speculator = SpeculativeDecoder(self.model, None, k=spec_k)
+
         # No gradients anywhere
         torch.set_grad_enabled(False)
 
@@ -83,111 +127,137 @@ class HFBackendPi:
         """
         logits: [vocab_size]
         returns: int token id
-        """
-        if temperature <= 0:
-            # Greedy
-            return int(torch.argmax(logits).item())
-
-        # Temperature scaling
-        logits = logits / temperature
 
-        # Convert to probabilities
-        probs = torch.softmax(logits, dim=-1)
-
-        # Top-p (nucleus) sampling
-        sorted_probs, sorted_indices = torch.sort(probs, descending=True)
-        cumulative = torch.cumsum(sorted_probs, dim=-1)
-
-        # Keep smallest prefix with cumulative probability >= top_p
-        mask = cumulative <= top_p
-        # Always keep at least one token
-        mask[..., 0] = True
-
-        filtered_probs = sorted_probs * mask
-        filtered_probs = filtered_probs / filtered_probs.sum()  # renormalize
+        Greedy for temperature <= 0, else nucleus sampling over a top-k
+        prefilter (no full sort of the vocabulary, see sampler.py).
+        """
+        return sample_logits(logits, temperature, top_p)
 
-        # Sample from the filtered distribution
-        next_idx = torch.multinomial(filtered_probs, num_samples=1).item()
-        next_token_id = sorted_indices[next_idx].item()
-        return int(next_token_id)
+    # ------------------------------------------------------------------
+    # Static KV buffer
+    # ------------------------------------------------------------------
+    def _static_past(self, max_new_tokens: int) -> Any:
+        """
+        Fresh cache object over the preallocated buffer; the buffer is
+        (re)allocated only when a call needs more positions than it holds.
+        """
+        return static_past(self, max_new_tokens)
 
     # ------------------------------------------------------------------
     # Custom generation loop with optional quantized KV-cache
     # ------------------------------------------------------------------
     def generate(
         self,
-        prompt: str,
+        prompt: Union[str, Sequence[int]],
         max_new_tokens: int = 64,
         temperature: float = 0.8,
         top_p: float = 0.95,
         kv_cache: Optional[KVCacheLike] = None,
+        should_stop: Optional[Callable[[], bool]] = None,
+        sampler: Optional[Sampler] = None,
+        stop: Optional[StopCriteria] = None,
     ) -> str:
         """
         Manual token-by-token generation, exposing past_key_values.
+        prompt may be text or token ids (e.g. from build_prompt_ids).
 
         If kv_cache is provided, we:
           - store past_key_values after each step (you can quantize there)
           - fetch them from kv_cache before each forward pass
+        stop (optional StopCriteria) ends the reply on EOS / stop strings /
+        time limit; the returned text is cut before the stop string.
         """
+        generated: List[int] = list(
+            self._iter_tokens(
+                prompt, max_new_tokens, temperature, top_p, kv_cache, should_stop, sampler, stop
+            )
+        )
+        if stop is not None:
+            generated = generated[: stop.keep]
+        with span_fn(self.tracer)("detokenize"):
+            return self.decode(generated)
 
-        # Tokenize prompt with context truncation
-        enc = self.tokenizer(
-            prompt,
-            return_tensors="pt",
-            truncation=True,
-            max_length=self.max_ctx,
+    def generate_stream(
+        self,
+        prompt: Union[str, Sequence[int]],
+        max_new_tokens: int = 64,
+        temperature: float = 0.8,
+        top_p: float = 0.95,
+        kv_cache: Optional[KVCacheLike] = None,
+        should_stop: Optional[Callable[[], bool]] = None,
+        sampler: Optional[Sampler] = None,
+        stop: Optional[StopCriteria] = None,
+    ) -> Iterator[str]:
+        """
+        Same as generate(), but yields text deltas as tokens are sampled,
+        so a slow Pi starts printing after the first token.
+        """
+        loop = self._iter_tokens(
+            prompt, max_new_tokens, temperature, top_p, kv_cache, should_stop, sampler, stop
         )
-        input_ids = enc["input_ids"].to(self.device)
-        attention_mask = enc["attention_mask"].to(self.device)
+        yield from stream_text(loop, self.tokenizer, stop, tracer=self.tracer)
 
-        generated: List[int] = []
+    def _iter_tokens(
+        self,
+        prompt: Union[str, Sequence[int]],
+        max_new_tokens: int,
+        temperature: float,
+        top_p: float,
+        kv_cache: Optional[KVCacheLike],
+        should_stop: Optional[Callable[[], bool]] = None,
+        sampler: Optional[Sampler] = None,
+        stop: Optional[StopCriteria] = None,
+    ) -> Iterator[int]:
+        """
+        Yields each sampled token id; shared by generate() and generate_stream().
+        should_stop is polled after each token; True ends the reply early.
+        sampler (optional) replaces plain temperature/top-p sampling.
+        stop (optional) is fed each id; the id that triggers it is still
+        yielded and the callers cut the reply at stop.keep.
+        """
 
-        # First forward pass: full prompt
-        with torch.inference_mode():
-            outputs = self.model(
-                input_ids=input_ids,
-                attention_mask=attention_mask,
-                use_cache=True,
+        if isinstance(prompt, str):
+            # Tokenize prompt with context truncation
+            enc = self.tokenizer(
+                prompt,
+                return_tensors="pt",
+                truncation=True,
+                max_length=self.max_ctx,
             )
-            logits = outputs.logits[:, -1, :]          # [1, vocab]
-            past_kv = outputs.past_key_values          # tuple of tuples
-
-            if kv_cache is not None:
-                kv_cache.store(past_kv)
-
-        # Generate tokens one by one
-        for _ in range(max_new_tokens):
-            # Optionally retrieve (dequantized) KV-cache
-            if kv_cache is not None:
-                past_kv = kv_cache.get()
-                # If cache is empty for some reason, we could re-run the
-                # full prompt, but for now assume it's present.
-                if past_kv is None:
-                    # Fallback: break or re-run prompt; here we just stop.
-                    break
-
-            # logits is [1, vocab]; select token distribution
-            next_token_id = self._sample_next_token(
-                logits[0], temperature=temperature, top_p=top_p
-            )
-            generated.append(next_token_id)
-
-            # Prepare next input as a single token
-            next_input_ids = torch.tensor(
-                [[next_token_id]], device=self.device
+            input_ids = enc["input_ids"].to(self.device)
+            attention_mask = enc["attention_mask"].to(self.device)
+        else:
+            # Token ids from the caches: no re-tokenization
+            input_ids = torch.tensor([list(prompt)[: self.max_ctx]], device=self.device)
+            attention_mask = None
+
+        # A new prompt starts a new KV sequence
+        if kv_cache is not None and hasattr(kv_cache, "reset"):
+            kv_cache.reset()
+
+        # Only a cache that stores past_key_values owns the KV; text caches
+        # (SlidingWindowCache, PagedCache) just built the prompt
+        owns_kv = hasattr(kv_cache, "store")
+        use_static = (self.static_cache or self.kv_offload_mb > 0) and not owns_kv
+        if self.speculator is not None and not owns_kv and sampler is None and not use_static:
+            # Plain temperature/top-p on a fresh sequence: prompt-lookup speculation
+            yield from self.speculator.iter_ids(
+                input_ids, max_new_tokens, temperature, top_p, should_stop, stop
             )
-
-            # One-step forward with cached KV
-            with torch.inference_mode():
-                outputs = self.model(
-                    input_ids=next_input_ids,
-                    past_key_values=past_kv,
-                    use_cache=True,
-                )
-                logits = outputs.logits[:, -1, :]      # [1, vocab]
-                past_kv = outputs.past_key_values
-
-                if kv_cache is not None:
-                    kv_cache.store(past_kv)
-
-        return self.decode(generated)
+            return
+
+        # Static buffer only when no external KV cache owns past_key_values
+        past_kv = self._static_past(max_new_tokens) if use_static else None
+        yield from decode_loop(
+            self,
+            input_ids,
+            max_new_tokens,
+            temperature,
+            top_p,
+            kv_cache=kv_cache,
+            past_kv=past_kv,
+            attention_mask=attention_mask,
+            should_stop=should_stop,
+            sampler=sampler,
+            stop=stop,
+        )
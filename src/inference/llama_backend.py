@@ -4,9 +4,23 @@ class LlamaBackend:
     def __init__(self, model_path: str, max_ctx: int):
         self.llm = Llama(model_path=model_path, n_ctx=max_ctx, n_gpu_layers=0)
 
-    def generate(self, prompt: str, max_tokens: int = 128):
-        out = self.llm(prompt, max_tokens=max_tokens, stream=False)
+    def generate(self, prompt: str, max_tokens: int = 128, stop=None):
+        # llama.cpp stops on EOS itself; stop strings are cut from the text
+        out = self.llm(prompt, max_tokens=max_tokens, stop=stop or [], stream=False)
         return out["choices"][0]["text"]
 
+    def generate_stream(self, prompt: str, max_tokens: int = 128, stop=None):
+        # llama.cpp detokenizes incrementally itself; yield each text chunk
+        for chunk in self.llm(prompt, max_tokens=max_tokens, stop=stop or [], stream=True):
+            text = chunk["choices"][0]["text"]
+            if text:
+                yield text
+
+    def encode(self, text: str):
+        return self.llm.tokenize(text.encode(), add_bos=False)
+
+    def decode(self, token_ids):
+        return self.llm.detokenize(token_ids).decode("utf-8", errors="ignore")
+
     def tokenize_len(self, text: str) -> int:
         return len(self.llm.tokenize(text.encode()))
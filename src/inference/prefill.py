@@ -0,0 +1,40 @@
+# src/inference/prefill.py
+
+from typing import Any, Callable, Optional, Tuple
+
+import torch
+
+
+def prefill(
+    model: Any,
+    input_ids: torch.Tensor,
+    past_kv: Optional[Any] = None,
+    attention_mask: Optional[torch.Tensor] = None,
+    positions: Optional[Callable[[int, int], Optional[torch.Tensor]]] = None,
+    start_pos: int = 0,
+    chunk: int = 0,
+) -> Tuple[torch.Tensor, Any]:
+    """
+    Run the prompt through the model on top of past_kv.
+    Returns (logits of the last position [1, vocab], past_key_values).
+
+    chunk > 0 feeds the prompt chunk tokens at a time: the attention
+    scores and MLP activations then only exist for one chunk, which keeps
+    the prefill peak small and its working set cache-sized (the best
+    chunk depends on the CPU, see autotune.py). chunk = 0 is one forward.
+    positions(start, n) gives explicit position ids (or None).
+    """
+    n = input_ids.shape[1]
+    step = chunk if 0 < chunk < n else n
+    with torch.inference_mode():
+        for start in range(0, n, step):
+            end = min(start + step, n)
+            outputs = model(
+                input_ids=input_ids[:, start:end],
+                attention_mask=None if attention_mask is None else attention_mask[:, :end],
+                past_key_values=past_kv,
+                position_ids=None if positions is None else positions(start_pos + start, end - start),
+                use_cache=True,
+            )
+            past_kv = outputs.past_key_values
+    return outputs.logits[:, -1, :], past_kv
@@ -0,0 +1,169 @@
+# src/inference/sampler.py
+
+from typing import List, Optional, Sequence, Tuple
+
+import torch
+
+# Candidates kept by the partial selection before nucleus / min-p filtering
+PREFILTER_K = 256
+
+
+def _candidates(
+    logits: torch.Tensor,
+    temperature: float,
+    top_p: float,
+    top_k: int,
+    min_p: float,
+    prefilter_k: int,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    (probabilities, token ids) of the tokens that survive top-k / min-p /
+    top-p filtering, best first; probabilities are not renormalised.
+
+    Instead of softmax + a full descending sort + cumsum over the whole
+    vocabulary, only the best prefilter_k (or top_k) logits are selected
+    with torch.topk; their probabilities come from one logsumexp over the
+    full row. If those candidates do not reach top_p, or the last one still
+    passes min_p (flat distribution), the selection is widened 4x at a
+    time, up to the whole vocabulary, so the result is the same
+    distribution as the full sort. With no filter at all every token is a
+    candidate: plain softmax, in vocabulary order, no selection.
+    """
+    logits = logits.float() / temperature
+    vocab = logits.shape[-1]
+    if top_k <= 0 and top_p >= 1.0 and min_p <= 0.0:
+        return torch.softmax(logits, dim=-1), torch.arange(vocab, device=logits.device)
+    k = min(top_k if top_k > 0 else prefilter_k, vocab)
+    lse = torch.logsumexp(logits, dim=-1)
+
+    while True:
+        vals, idx = torch.topk(logits, k)             # sorted, descending
+        probs = torch.exp(vals - lse)
+        cumsum = torch.cumsum(probs, dim=-1)
+        if top_k > 0 or k == vocab:
+            break
+        short_of_top_p = top_p < 1.0 and float(cumsum[-1]) <= top_p
+        tail_passes_min_p = min_p > 0.0 and float(probs[-1]) >= min_p * float(probs[0])
+        if not (short_of_top_p or tail_passes_min_p):
+            break
+        k = min(4 * k, vocab)   # the filters may reach past the candidates
+
+    keep = torch.ones_like(probs, dtype=torch.bool)
+    if min_p > 0.0:
+        keep &= probs >= min_p * probs[0]
+    if top_p < 1.0:
+        keep &= cumsum <= top_p
+    keep[0] = True   # always keep the top token
+    return probs * keep, idx
+
+
+def sample_logits(
+    logits: torch.Tensor,
+    temperature: float,
+    top_p: float = 1.0,
+    top_k: int = 0,
+    min_p: float = 0.0,
+    prefilter_k: int = PREFILTER_K,
+) -> int:
+    """Sample one token id from logits [vocab] (greedy if temperature <= 0)."""
+    if temperature <= 0.0:
+        return int(torch.argmax(logits))
+    probs, idx = _candidates(logits, temperature, top_p, top_k, min_p, prefilter_k)
+    choice = torch.multinomial(probs, 1)              # multinomial renormalises
+    return int(idx[choice])
+
+
+def filtered_probs(
+    logits: torch.Tensor,
+    temperature: float,
+    top_p: float = 1.0,
+    top_k: int = 0,
+    min_p: float = 0.0,
+    prefilter_k: int = PREFILTER_K,
+) -> torch.Tensor:
+    """
+    The full [vocab] distribution sample_logits() draws from (one-hot on
+    the argmax when temperature <= 0), e.g. for speculative decoding.
+    """
+    out = torch.zeros(logits.shape[-1], dtype=torch.float32, device=logits.device)
+    if temperature <= 0.0:
+        out[torch.argmax(logits)] = 1.0
+        return out
+    probs, idx = _candidates(logits, temperature, top_p, top_k, min_p, prefilter_k)
+    out[idx] = probs / probs.sum()
+    return out
+
+
+class Sampler:
+    """
+    Logits processors + sampling for one sequence.
+
+    repetition_penalty > 1 divides positive (multiplies negative) logits of
+    tokens already seen; frequency_penalty subtracts penalty x count. Seen
+    tokens are tracked in a count vector that is updated once per token
+    (observe()), plus the index of distinct seen ids, so a step only
+    touches those entries instead of rebuilding the penalty over the whole
+    vocabulary.
+    """
+
+    def __init__(
+        self,
+        temperature: float = 0.8,
+        top_p: float = 0.95,
+        top_k: int = 0,
+        min_p: float = 0.0,
+        repetition_penalty: float = 1.0,
+        frequency_penalty: float = 0.0,
+    ) -> None:
+        self.temperature = temperature
+        self.top_p = top_p
+        self.top_k = top_k
+        self.min_p = min_p
+        self.repetition_penalty = repetition_penalty
+        self.frequency_penalty = frequency_penalty
+
+        self.counts: Optional[torch.Tensor] = None   # [vocab] int32
+        self._seen: List[int] = []
+        self._seen_index: Optional[torch.Tensor] = None
+
+    def reset(self, vocab_size: int, prompt_ids: Sequence[int] = ()) -> None:
+        """Start a new sequence; prompt tokens count as seen for the penalty."""
+        ids = torch.as_tensor(list(prompt_ids), dtype=torch.long)
+        self.counts = torch.bincount(ids, minlength=vocab_size).to(torch.int32)
+        self._seen = ids.unique().tolist()
+        self._seen_index = None
+
+    def observe(self, token_id: int) -> None:
+        if self.counts is None:
+            return
+        if self.counts[token_id] == 0:
+            self._seen.append(token_id)
+            self._seen_index = None
+        self.counts[token_id] += 1
+
+    def _penalize(self, logits: torch.Tensor) -> torch.Tensor:
+        if not self._seen or (self.repetition_penalty == 1.0 and self.frequency_penalty == 0.0):
+            return logits
+        if self._seen_index is None:
+            self._seen_index = torch.tensor(self._seen, device=logits.device)
+        seen = logits.index_select(-1, self._seen_index).float()
+        if self.repetition_penalty != 1.0:
+            p = self.repetition_penalty
+            seen = torch.where(seen > 0, seen / p, seen * p)
+        if self.frequency_penalty != 0.0:
+            seen = seen - self.frequency_penalty * self.counts.index_select(0, self._seen_index)
+        return logits.float().index_copy(-1, self._seen_index, seen)
+
+    def __call__(self, logits: torch.Tensor) -> int:
+        """logits: [vocab]; returns the sampled id and records it as seen."""
+        if self.counts is None:
+            self.reset(logits.shape[-1])
+        token_id = sample_logits(
+            self._penalize(logits),
+            self.temperature,
+            top_p=self.top_p,
+            top_k=self.top_k,
+            min_p=self.min_p,
+        )
+        self.observe(token_id)
+        return token_id
@@ -0,0 +1,143 @@
+# src/inference/session_store.py
+
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+import torch
+
+from inference.chat_session import ChatSession
+from kv_cache.quantized_cache import QuantizedKVCache
+
+
+class SessionStore:
+    """
+    Many open conversations, only the recently used ones in RAM.
+
+    Every session is a ChatSession whose KV lives in an append-only
+    QuantizedKVCache. When the KV of all in-memory sessions exceeds
+    budget_bytes, the least recently used ones are spilled: their compact
+    quantized tensors (no float working copy, no spare capacity) are
+    written to one file per session in spill_dir and dropped from RAM.
+    The next message to a spilled session memory-maps the file back in,
+    so resuming costs a file read instead of re-prefilling the history.
+
+    Turn text and token ids stay in RAM; they are small next to the KV.
+    Beyond max_sessions conversations (hot + cold, 0 = no limit) the least
+    recently used one is forgotten and its spill file deleted; cold
+    sessions are always older than hot ones, so they go first.
+    """
+
+    def __init__(
+        self,
+        backend: Any,
+        make_history: Callable[[], Any],
+        budget_bytes: int,
+        spill_dir: str = "data/kv_spill",
+        kv_kwargs: Optional[Dict[str, Any]] = None,
+        max_sessions: int = 0,
+    ) -> None:
+        self.backend = backend
+        self.make_history = make_history
+        self.budget_bytes = budget_bytes
+        self.spill_dir = spill_dir
+        self.max_sessions = max_sessions
+        self.kv_kwargs = dict(kv_kwargs or {})
+        self.kv_kwargs["append_only"] = True
+
+        self.hot: "OrderedDict[str, ChatSession]" = OrderedDict()   # LRU order, newest last
+        self.cold: "OrderedDict[str, ChatSession]" = OrderedDict()  # KV on disk, spill order
+        self.stats = {"hits": 0, "faults": 0, "spills": 0, "created": 0, "dropped": 0}
+        os.makedirs(spill_dir, exist_ok=True)
+        # Spill files of an earlier process belong to sessions nobody can resume
+        for name in os.listdir(spill_dir):
+            if name.endswith(".kv"):
+                os.remove(os.path.join(spill_dir, name))
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self.hot or session_id in self.cold
+
+    def __len__(self) -> int:
+        return len(self.hot) + len(self.cold)
+
+    def _path(self, session_id: str) -> str:
+        # Session ids come from clients: never use them as file names directly
+        name = hashlib.sha1(session_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.spill_dir, f"{name}.kv")
+
+    def resident_bytes(self) -> int:
+        return sum(s.kv_cache.resident_nbytes() for s in self.hot.values())
+
+    # --- spill / fault ---------------------------------------------------------
+
+    def _spill(self, session_id: str) -> None:
+        session = self.hot.pop(session_id)
+        if session.kv_cache.seq_length() > 0:
+            torch.save(session.kv_cache.state_dict(), self._path(session_id))
+        session.kv_cache.reset()
+        self.cold[session_id] = session
+        self.stats["spills"] += 1
+
+    def _fault(self, session_id: str) -> ChatSession:
+        session = self.cold.pop(session_id)
+        path = self._path(session_id)
+        if os.path.exists(path):
+            # mmap: only the pages we copy into the fresh buffers are read
+            state = torch.load(path, mmap=True, weights_only=True)
+            session.kv_cache.load_state_dict(state)
+            del state
+            os.remove(path)
+        self.stats["faults"] += 1
+        return session
+
+    def _enforce_budget(self, keep: Optional[str] = None) -> None:
+        """Spill least recently used sessions (never `keep`) until under budget."""
+        while self.resident_bytes() > self.budget_bytes:
+            victim = next((sid for sid in self.hot if sid != keep), None)
+            if victim is None:
+                break
+            self._spill(victim)
+
+    def _enforce_max_sessions(self, keep: str) -> None:
+        """Forget least recently used sessions (never `keep`) beyond max_sessions."""
+        while self.max_sessions > 0 and len(self) > self.max_sessions:
+            victim = next(iter(self.cold), None) or next((sid for sid in self.hot if sid != keep), None)
+            if victim is None:
+                break
+            self.drop(victim)
+            self.stats["dropped"] += 1
+
+    # --- public API ------------------------------------------------------------
+
+    def get(self, session_id: str) -> ChatSession:
+        """The session with its KV in RAM (created, or faulted in from disk)."""
+        if session_id in self.hot:
+            self.stats["hits"] += 1
+            session = self.hot[session_id]
+        elif session_id in self.cold:
+            session = self._fault(session_id)
+        else:
+            session = ChatSession(
+                self.backend, self.make_history(), kv_cache=QuantizedKVCache(**self.kv_kwargs)
+            )
+            self.stats["created"] += 1
+        self.hot[session_id] = session
+        self.hot.move_to_end(session_id)
+        self._enforce_max_sessions(keep=session_id)
+        self._enforce_budget(keep=session_id)
+        return session
+
+    def reply(self, session_id: str, user_text: str, **kwargs: Any) -> str:
+        reply = self.get(session_id).reply(user_text, **kwargs)
+        # The reply grew this session's KV
+        self._enforce_budget(keep=session_id)
+        return reply
+
+    def drop(self, session_id: str) -> None:
+        """Forget a conversation and delete its spill file."""
+        self.hot.pop(session_id, None)
+        self.cold.pop(session_id, None)
+        path = self._path(session_id)
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,136 @@
+# src/inference/snapshot.py
+
+import json
+import os
+import time
+from typing import Any, Dict, Tuple
+
+import torch
+
+from inference.weight_quant import empty_model, load_model, quantize_int8
+
+# Bump when the layout of the snapshot dict changes
+SNAPSHOT_VERSION = 1
+
+# Snapshot files are named *.snapshot; other single files (.gguf, .pt) are not snapshots
+SNAPSHOT_SUFFIX = ".snapshot"
+
+
+def is_snapshot(model_name: str) -> bool:
+    """A *.snapshot file; HF models are directories or hub ids."""
+    return model_name.endswith(SNAPSHOT_SUFFIX) and os.path.isfile(model_name)
+
+
+def save_snapshot(model_name: str, path: str, dtype: str = "float32") -> str:
+    """
+    Write tokenizer files, config and weights of model_name into one file.
+    Loading it needs no from_pretrained() resolution, no random init and
+    no copy of the weights: see load_snapshot().
+    """
+    import tempfile
+
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    if not path.endswith(SNAPSHOT_SUFFIX):
+        raise ValueError(f"Snapshot path must end in {SNAPSHOT_SUFFIX}: {path}")
+    model = AutoModelForCausalLM.from_pretrained(model_name).eval()
+    if dtype == "float16":
+        model = model.to(dtype=torch.float16)
+    elif dtype != "float32":
+        raise ValueError(f"Snapshots hold float32 or float16 weights, not {dtype}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        AutoTokenizer.from_pretrained(model_name).save_pretrained(tmp)
+        tokenizer_files = {}
+        for name in os.listdir(tmp):
+            with open(os.path.join(tmp, name), encoding="utf-8") as f:
+                tokenizer_files[name] = f.read()
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    torch.save(
+        {
+            "version": SNAPSHOT_VERSION,
+            "config": json.dumps(model.config.to_dict()),
+            "tokenizer": tokenizer_files,
+            "state_dict": model.state_dict(),
+        },
+        path,
+    )
+    return path
+
+
+def _tokenizer_from_files(files: Dict[str, str]) -> Any:
+    from tokenizers import Tokenizer
+    from transformers import PreTrainedTokenizerFast
+
+    kwargs = json.loads(files.get("tokenizer_config.json", "{}"))
+    special = {
+        k: v for k, v in kwargs.items()
+        if k.endswith("_token") and isinstance(v, (str, type(None)))
+    }
+    return PreTrainedTokenizerFast(
+        tokenizer_object=Tokenizer.from_str(files["tokenizer.json"]),
+        model_max_length=kwargs.get("model_max_length", int(1e30)),
+        **special,
+    )
+
+
+def load_snapshot(path: str) -> Tuple[Any, Any, Dict[str, float]]:
+    """
+    (tokenizer, model, timings) from a snapshot file. The file is
+    memory-mapped and the parameters are views into it, so pages are read
+    on first use instead of up front; the parameters are created on the
+    meta device (no init of throwaway fp32 weights).
+    """
+    timings: Dict[str, float] = {}
+    t0 = time.perf_counter()
+    snap = torch.load(path, mmap=True, weights_only=True)
+    if snap.get("version") != SNAPSHOT_VERSION:
+        raise RuntimeError(f"{path}: unsupported snapshot version {snap.get('version')}")
+    timings["snapshot_open_s"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    tokenizer = _tokenizer_from_files(snap["tokenizer"])
+    timings["tokenizer_s"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    import transformers
+    from transformers.models.auto.configuration_auto import CONFIG_MAPPING
+
+    cfg = json.loads(snap["config"])
+    config = CONFIG_MAPPING[cfg["model_type"]].from_dict(cfg)
+    model_cls = getattr(transformers, config.architectures[0])
+    model = empty_model(lambda: model_cls(config))
+    model.load_state_dict(snap["state_dict"], assign=True, strict=False)
+    model.tie_weights()
+    for name, p in list(model.named_parameters()) + list(model.named_buffers()):
+        if p.device.type == "meta":
+            raise RuntimeError(f"{path}: no weights for {name}")
+    timings["model_s"] = time.perf_counter() - t0
+    return tokenizer, model.eval(), timings
+
+
+def load_pretrained(model_name: str, dtype: str = "float32") -> Tuple[Any, Any, Dict[str, float]]:
+    """
+    (tokenizer, model, timings) for the HF backends: a snapshot file, a
+    pre-quantized int8 directory, or any from_pretrained() name.
+    """
+    if is_snapshot(model_name):
+        tokenizer, model, timings = load_snapshot(model_name)
+        if dtype == "int8":
+            quantize_int8(model)
+        elif dtype == "float16" and next(model.parameters()).dtype != torch.float16:
+            model = model.to(dtype=torch.float16)
+        return tokenizer, model, timings
+
+    # Timings include the (lazy) transformers imports each step triggers
+    timings = {}
+    t0 = time.perf_counter()
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    timings["tokenizer_s"] = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    model = load_model(model_name, dtype)
+    timings["model_s"] = time.perf_counter() - t0
+    return tokenizer, model, timings
@@ -0,0 +1,248 @@
+# src/inference/speculative.py
+
+import copy
+import time
+from typing import Any, Callable, Dict, Generator, List, Optional, Tuple
+
+import torch
+from torch import nn
+
+from inference.sampler import filtered_probs
+from inference.stopping import StopCriteria
+from kv_cache.hf_compat import DynamicCache, crop_back
+
+
+def truncated_draft(model: Any, num_layers: int) -> Any:
+    """
+    Draft model made of the target's own first num_layers blocks, plus its
+    embeddings, final norm and LM head. No weights are copied, so the
+    draft costs no extra RAM. GPT-2 style models only (model.transformer.h).
+    """
+    inner = getattr(model, "transformer", None)
+    if inner is None or not hasattr(inner, "h"):
+        raise ValueError("Truncated draft needs a GPT-2 style model (model.transformer.h)")
+    if not 0 < num_layers < len(inner.h):
+        raise ValueError(f"draft_layers must be between 1 and {len(inner.h) - 1}")
+
+    cfg = copy.deepcopy(model.config)
+    cfg.n_layer = num_layers
+
+    # Shallow copies with their own submodule tables: the target is untouched
+    draft_inner = copy.copy(inner)
+    draft_inner._modules = dict(inner._modules)
+    draft_inner.h = nn.ModuleList(list(inner.h)[:num_layers])
+    draft_inner.config = cfg
+
+    draft = copy.copy(model)
+    draft._modules = dict(model._modules)
+    draft.transformer = draft_inner
+    draft.config = cfg
+    return draft
+
+
+class NgramIndex:
+    """
+    Prompt-lookup proposer: maps every n-gram (min_n..max_n tokens) of the
+    sequence seen so far to the position right after its most recent
+    occurrence. propose() looks up the current suffix, longest n first, and
+    returns the tokens that followed it last time, so spans the reply
+    copies from the prompt or earlier turns come out as drafts.
+    """
+
+    def __init__(self, max_n: int = 3, min_n: int = 1) -> None:
+        if not 0 < min_n <= max_n:
+            raise ValueError("Need 0 < min_n <= max_n")
+        self.max_n = max_n
+        self.min_n = min_n
+        self.tokens: List[int] = []
+        self.table: Dict[Tuple[int, ...], int] = {}
+
+    def extend(self, ids: List[int]) -> None:
+        for token_id in ids:
+            end = len(self.tokens)
+            # n-grams ending just before this token now have a continuation
+            for n in range(self.min_n, min(self.max_n, end) + 1):
+                self.table[tuple(self.tokens[end - n:end])] = end
+            self.tokens.append(token_id)
+
+    def propose(self, k: int) -> List[int]:
+        if k <= 0:
+            return []
+        for n in range(min(self.max_n, len(self.tokens)), self.min_n - 1, -1):
+            start = self.table.get(tuple(self.tokens[-n:]))
+            if start is not None:
+                return self.tokens[start:start + k]
+        return []
+
+
+class SpeculativeDecoder:
+    """
+    Draft-and-verify decoding.
+
+    Each round the draft model proposes k tokens one by one; the target
+    model then scores the pending token plus all k proposals in a single
+    forward pass. Proposal i is accepted with probability
+    min(1, p(d_i) / q(d_i)) (p = target, q = draft distribution after the
+    same temperature / top-p filtering); at the first rejection a token is
+    drawn from the residual max(0, p - q) instead, and if all k pass a bonus
+    token is drawn from the target. The output therefore follows the
+    target's distribution exactly; with temperature <= 0 both
+    distributions are one-hot and this reduces to "accept while the draft
+    matches the target's argmax". Rejected positions are cropped from both
+    KV caches.
+
+    With draft=None the proposals come from an NgramIndex over the prompt
+    and the generated tokens instead (prompt lookup): no second model and
+    no extra memory. Such drafts are deterministic (q is one-hot), so
+    acceptance is p(d_i) and the residual is p with d_i removed.
+
+    The target cache always covers every token except the last one, which
+    is fed at the start of the next verify pass.
+    """
+
+    def __init__(
+        self, target: Any, draft: Optional[Any] = None, k: int = 4, ngram_max: int = 3, ngram_min: int = 1
+    ) -> None:
+        if DynamicCache is None:
+            raise RuntimeError("Speculative decoding needs a transformers version with DynamicCache")
+        self.target = target
+        self.draft = draft
+        self.k = k
+        self.ngram_max = ngram_max
+        self.ngram_min = ngram_min
+        self.stats: Dict[str, float] = {}
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.stats = {
+            "rounds": 0,
+            "proposed": 0,
+            "accepted": 0,
+            "target_forwards": 0,
+            "tokens": 0,
+            "seconds": 0.0,
+        }
+
+    @property
+    def acceptance_rate(self) -> float:
+        return self.stats["accepted"] / max(self.stats["proposed"], 1)
+
+    @property
+    def tokens_per_s(self) -> float:
+        return self.stats["tokens"] / max(self.stats["seconds"], 1e-9)
+
+    @staticmethod
+    def _forward(model: Any, ids: List[int], past: Any) -> Tuple[torch.Tensor, Any]:
+        device = next(model.parameters()).device
+        out = model(input_ids=torch.tensor([ids], device=device), past_key_values=past, use_cache=True)
+        return out.logits[0], out.past_key_values
+
+    @torch.inference_mode()
+    def iter_ids(
+        self,
+        input_ids: torch.Tensor,
+        max_new_tokens: int = 64,
+        temperature: float = 0.8,
+        top_p: float = 0.95,
+        should_stop: Optional[Callable[[], bool]] = None,
+        stop: Optional[StopCriteria] = None,
+    ) -> Generator[int, None, Any]:
+        """Same contract as HFBackend.iter_ids: yields ids, returns the target past."""
+        t0 = time.time()
+        if stop is not None:
+            stop.reset()
+        seq: List[int] = input_ids[0].tolist()
+        n_prompt = len(seq)
+
+        def probs(logits: torch.Tensor) -> torch.Tensor:
+            return filtered_probs(logits, temperature, top_p)
+
+        # Target holds all but the last token; the draft catches up lazily
+        t_past: Any = DynamicCache()
+        if len(seq) > 1:
+            _, t_past = self._forward(self.target, seq[:-1], t_past)
+            self.stats["target_forwards"] += 1
+        d_past: Any = DynamicCache()
+        d_len = 0
+        index: Optional[NgramIndex] = None
+        if self.draft is None:
+            index = NgramIndex(self.ngram_max, self.ngram_min)
+            index.extend(seq)
+
+        generated = 0
+        try:
+            while generated < max_new_tokens:
+                base = len(seq)
+                k = min(self.k, max_new_tokens - generated - 1)
+
+                # 1) Draft model (or the n-gram index) proposes up to k tokens
+                drafts: List[int] = []
+                q: List[torch.Tensor] = []
+                if index is not None:
+                    drafts = index.propose(k)
+                else:
+                    feed = seq[d_len:]
+                    for _ in range(k):
+                        logits, d_past = self._forward(self.draft, feed, d_past)
+                        qi = probs(logits[-1])
+                        d = int(torch.multinomial(qi, 1))
+                        drafts.append(d)
+                        q.append(qi)
+                        feed = [d]
+                    d_len = base + max(k - 1, 0) if k else d_len
+
+                # 2) Target scores the pending token + all proposals at once
+                logits, t_past = self._forward(self.target, [seq[-1]] + drafts, t_past)
+                self.stats["target_forwards"] += 1
+
+                # 3) Accept / reject left to right
+                out: List[int] = []
+                for i, d in enumerate(drafts):
+                    pi = probs(logits[i])
+                    ratio = pi[d] / q[i][d] if q else pi[d]
+                    if float(torch.rand(())) < float(ratio):
+                        out.append(d)
+                        continue
+                    if q:
+                        residual = (pi - q[i]).clamp_min_(0)
+                    else:
+                        residual = pi.clone()
+                        residual[d] = 0.0
+                    dist = residual if float(residual.sum()) > 0 else pi
+                    out.append(int(torch.multinomial(dist, 1)))
+                    break
+                else:
+                    out.append(int(torch.multinomial(probs(logits[len(drafts)]), 1)))   # bonus token
+                accepted = len(out) - 1
+
+                self.stats["rounds"] += 1
+                self.stats["proposed"] += len(drafts)
+                self.stats["accepted"] += accepted
+
+                # 4) Roll back rejected positions: target keeps all but the new last token
+                crop_back(t_past, t_past.get_seq_length() - (base + accepted))
+                if d_len > base + accepted:
+                    crop_back(d_past, d_past.get_seq_length() - (base + accepted))
+                    d_len = base + accepted
+
+                if index is not None:
+                    index.extend(out)
+
+                halted = False
+                for token_id in out:
+                    seq.append(token_id)
+                    generated += 1
+                    self.stats["tokens"] += 1
+                    done = stop is not None and stop.add(token_id)
+                    yield token_id
+                    if done or (should_stop is not None and should_stop()):
+                        halted = True
+                        break
+                if halted:
+                    break
+        finally:
+            # Also when the caller closes the generator early (stop string, disconnect)
+            self.stats["seconds"] += time.time() - t0
+        # Drop anything past the last kept token (early stop inside a round)
+        crop_back(t_past, t_past.get_seq_length() - (n_prompt + generated - 1))
+        return t_past
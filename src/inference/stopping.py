@@ -0,0 +1,176 @@
+# src/inference/stopping.py
+
+import time
+from bisect import bisect_right
+from typing import Any, Dict, Generator, Iterable, List, Optional
+
+from inference.detokenizer import IncrementalDetokenizer
+from utils.tracing import PhaseTracer, span_fn
+
+# Role markers the model tends to continue with after its own reply
+DEFAULT_STOP_STRINGS = ["\nUser:", "\nAssistant:"]
+
+
+class StopCriteria:
+    """
+    Decides, token by token, when a reply is finished:
+      - an EOS id was sampled (the EOS token is not kept)
+      - a stop string appeared in the reply text (cut right before it)
+      - max_time_s seconds passed since reset()
+
+    Stop strings are matched on token ids: each id's text is decoded once
+    and cached, and only the last len(stop string) characters are
+    searched, so a match spanning several BPE tokens ("\\n" + "User" + ":")
+    is found as soon as its last token arrives, at constant cost per token.
+
+    The decode loops call reset() before the first token and add() for
+    every sampled id. keep is the number of generated tokens that belong
+    to the reply; safe is how many of them can be shown already, i.e.
+    everything before a tail that could still grow into a stop string.
+    """
+
+    def __init__(
+        self,
+        tokenizer: Any = None,
+        eos_ids: Iterable[int] = (),
+        stop_strings: Iterable[str] = (),
+        max_time_s: float = 0.0,
+    ) -> None:
+        self.tokenizer = tokenizer
+        self.eos_ids = {int(i) for i in eos_ids}
+        self.stop_strings = [s for s in stop_strings if s]
+        if self.stop_strings and tokenizer is None:
+            raise ValueError("Stop strings need a tokenizer")
+        self.max_time_s = max_time_s
+        self.max_stop_len = max((len(s) for s in self.stop_strings), default=0)
+        self._pieces: Dict[int, str] = {}
+
+        self.reason: Optional[str] = None
+        self.ids: List[int] = []
+        self.text = ""
+        self._ends: List[int] = []   # text length after each token
+        self._keep = 0
+        self._t0 = time.time()
+
+    @classmethod
+    def for_backend(
+        cls,
+        backend: Any,
+        stop_strings: Iterable[str] = (),
+        max_time_s: float = 0.0,
+        use_eos: bool = True,
+    ) -> "StopCriteria":
+        """EOS ids from the model's generation config (or tokenizer) plus stop strings."""
+        tokenizer = backend.tokenizer
+        eos = getattr(getattr(backend.model, "generation_config", None), "eos_token_id", None)
+        if eos is None:
+            eos = tokenizer.eos_token_id
+        eos_ids = [] if eos is None or not use_eos else (eos if isinstance(eos, list) else [eos])
+        return cls(tokenizer, eos_ids, stop_strings, max_time_s)
+
+    def reset(self) -> None:
+        self.reason = None
+        self.ids = []
+        self.text = ""
+        self._ends = []
+        self._keep = 0
+        self._t0 = time.time()
+
+    def _piece(self, token_id: int) -> str:
+        piece = self._pieces.get(token_id)
+        if piece is None:
+            piece = self.tokenizer.decode([token_id], skip_special_tokens=True)
+            self._pieces[token_id] = piece
+        return piece
+
+    def add(self, token_id: int) -> bool:
+        """Record one sampled id; True when generation should end now."""
+        if self.reason is not None:
+            return True
+        self.ids.append(token_id)
+
+        if token_id in self.eos_ids:
+            return self._stop("eos", len(self.ids) - 1)
+
+        if self.stop_strings:
+            start = max(0, len(self.text) - self.max_stop_len + 1)
+            self.text += self._piece(token_id)
+            self._ends.append(len(self.text))
+            hits = [i for i in (self.text.find(s, start) for s in self.stop_strings) if i >= 0]
+            if hits:
+                # Keep the tokens that end before the match
+                return self._stop("stop_string", bisect_right(self._ends, min(hits)))
+
+        if self.max_time_s > 0 and time.time() - self._t0 >= self.max_time_s:
+            return self._stop("max_time", len(self.ids))
+        return False
+
+    def _stop(self, reason: str, keep: int) -> bool:
+        self.reason = reason
+        self._keep = keep
+        return True
+
+    @property
+    def keep(self) -> int:
+        return self._keep if self.reason is not None else len(self.ids)
+
+    @property
+    def safe(self) -> int:
+        if self.reason is not None:
+            return self._keep
+        if not self.stop_strings:
+            return len(self.ids)
+        # Longest tail of the text that is the start of some stop string
+        text = self.text
+        for n in range(min(self.max_stop_len - 1, len(text)), 0, -1):
+            tail = text[-n:]
+            if any(s.startswith(tail) for s in self.stop_strings):
+                return bisect_right(self._ends, len(text) - n)
+        return len(self.ids)
+
+
+def stream_text(
+    loop: Generator[int, None, Any],
+    tokenizer: Any,
+    stop: Optional[StopCriteria] = None,
+    generated: Optional[List[int]] = None,
+    tracer: Optional[PhaseTracer] = None,
+) -> Generator[str, None, Any]:
+    """
+    Text deltas of a decode loop (iter_ids-style generator). With stop, text
+    that may still turn into a stop string is held back until it can't,
+    and the reply is cut at stop.keep. Fills generated with the kept ids;
+    returns the loop's own return value (e.g. past_key_values).
+    With tracer, the incremental detokenization is timed as "detokenize".
+    """
+    ids: List[int] = [] if generated is None else generated
+    detok = IncrementalDetokenizer(tokenizer)
+    span = span_fn(tracer)
+    shown = 0
+    while True:
+        try:
+            ids.append(next(loop))
+        except StopIteration as done:
+            result = done.value
+            break
+        upto = stop.safe if stop is not None else len(ids)
+        while shown < upto:
+            with span("detokenize"):
+                delta = detok.add(ids[shown])
+            shown += 1
+            if delta:
+                yield delta
+
+    if stop is not None:
+        del ids[stop.keep:]
+    while shown < len(ids):
+        with span("detokenize"):
+            delta = detok.add(ids[shown])
+        shown += 1
+        if delta:
+            yield delta
+    with span("detokenize"):
+        tail = detok.flush()
+    if tail:
+        yield tail
+    return result
@@ -1,6 +1,17 @@
-from typing import List, Optional, Any
+from typing import Any, Callable, Generator, Iterator, List, Optional, Sequence, Tuple, Union
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
+
+from inference.decode_loop import decode_loop, static_past
+from inference.graph_decode import CapturedDecodeStep
+from inference.sampler import Sampler, sample_logits
+from inference.speculative import SpeculativeDecoder, truncated_draft
+from inference.stopping import StopCriteria, stream_text
+from inference.snapshot import load_pretrained
+from inference.weight_quant import load_model
+from kv_cache.offload_cache import MmapKVBuffer
+from kv_cache.static_cache import StaticKVBuffer
+from utils.cpu_tuning import load_and_apply
+from utils.tracing import PhaseTracer, span_fn
 
 
 class HFBackend:
@@ -8,6 +19,42 @@ class HFBackend:
     Pi-friendly HuggingFace backend with optional QuantizedKVCache support.
     CPU-only execution.
     Manual token loop exposes past_key_values for compression.
+
+    static_cache=True preallocates one KV buffer (max_ctx + max_new_tokens
+    positions) and writes each decode step into it in place, instead of
+    letting past_key_values grow by concatenation.
+
+    kv_offload_mb > 0 puts that buffer in a memory-mapped file instead and
+    keeps only about kv_offload_mb of it resident (MmapKVBuffer).
+
+    graph_decode=True (implies static_cache) runs each single-token step
+    through a torch.jit-captured, fixed-shape GPT-2 forward that writes
+    straight into the static buffer (see graph_decode.py). If capture
+    fails, decode falls back to eager; graph_error says why.
+
+    Speculative decoding: draft_model (a smaller model with the same
+    tokenizer) or draft_layers (the first N blocks of this model) proposes
+    spec_k tokens per target forward; see SpeculativeDecoder.
+    prompt_lookup=True drafts from n-grams of the prompt and reply instead,
+    with no draft model at all.
+
+    dtype="int8" quantizes the projection and LM head weights to INT8
+    (dynamic quantization, see weight_quant.py); a directory written by
+    scripts/quantize_model.py loads as int8 without the fp32 weights.
+    model_name may also be a snapshot file (scripts/build_snapshot.py),
+    which loads memory-mapped in a fraction of the from_pretrained time.
+    load_times holds the tokenizer / model load breakdown.
+
+    cpu_profile: profile file written by autotune.py; the entry for this
+    host and model (thread counts, CPU affinity, prefill chunk) is
+    applied before the model loads (None, the default, or "" = torch
+    defaults; app_cli and app_web pass data/cpu_profiles.json).
+    prefill_chunk overrides the profile's chunk (0 = whole prompt).
+
+    tracer: optional PhaseTracer (utils/tracing.py); the decode loop then
+    times prefill / forward / kv_store / kv_get / sample / stop and the
+    text paths time detokenize. None (the default) adds no timers.
+    Speculative rounds are not split into phases.
     """
 
     def __init__(
@@ -15,19 +62,53 @@ class HFBackend:
         model_name: str = "distilgpt2",
         max_ctx: int = 512,
         device: Optional[str] = None,
+        static_cache: bool = False,
+        kv_offload_mb: int = 0,
+        kv_offload_dir: str = "data/kv_offload",
+        draft_model: Optional[str] = None,
+        draft_layers: int = 0,
+        spec_k: int = 4,
+        prompt_lookup: bool = False,
+        dtype: str = "float32",
+        graph_decode: bool = False,
+        cpu_profile: Optional[str] = None,
+        prefill_chunk: Optional[int] = None,
+        tracer: Optional[PhaseTracer] = None,
     ) -> None:
         self.model_name = model_name
         self.max_ctx = max_ctx
+        self.static_cache = static_cache
+        self.kv_offload_mb = kv_offload_mb
+        self.kv_offload_dir = kv_offload_dir
+        self.static_kv: Optional[Union[StaticKVBuffer, MmapKVBuffer]] = None
+        self.graph_decode = graph_decode and kv_offload_mb <= 0
+        self.graph_step: Optional[CapturedDecodeStep] = None
+        self.graph_error: Optional[str] = None
 
         # Always CPU on Pi; allow override for laptop.
         self.device = device or "cpu"
 
+        self.cpu_profile = load_and_apply(cpu_profile, model_name, dtype) if cpu_profile else None
+        if prefill_chunk is None:
+            prefill_chunk = self.cpu_profile.prefill_chunk if self.cpu_profile else 0
+        self.prefill_chunk = prefill_chunk
+        self.tracer = tracer
 
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModelForCausalLM.from_pretrained(model_name)
+        self.tokenizer, self.model, self.load_times = load_pretrained(model_name, dtype)
         self.model.to(self.device)
         self.model.eval()
 
+        self.speculator: Optional[SpeculativeDecoder] = None
+        if draft_model:
+            draft = load_model(draft_model, dtype).to(self.device)
+            self.speculator = SpeculativeDecoder(self.model, draft, k=spec_k)
+        elif draft_layers > 0:
+            self.speculator = SpeculativeDecoder(
+                self.model, truncated_draft(self.model, draft_layers), k=spec_k
+            )
+        elif prompt_lookup:
+            self.speculator = SpeculativeDecoder(self.model, None, k=spec_k)
+
         torch.set_grad_enabled(False)
 
     # --- token utilities -------------------------------------------------------
@@ -45,91 +126,219 @@ class HFBackend:
 
     @staticmethod
     def _sample_next(logits: torch.Tensor, temperature: float, top_p: float) -> int:
-        if temperature <= 0.0:
-            return int(torch.argmax(logits).item())
-
-        logits = logits / temperature
-        probs = torch.softmax(logits, dim=-1)
-
-        sorted_probs, sorted_idx = torch.sort(probs, descending=True)
-        cumsum = torch.cumsum(sorted_probs, dim=-1)
-
-        mask = cumsum <= top_p
-        mask[..., 0] = True  # always keep top
-
-        filtered = sorted_probs * mask
-        filtered = filtered / filtered.sum()
-
-        choice = torch.multinomial(filtered, 1).item()
-        return int(sorted_idx[choice].item())
+        # top-k prefilter + nucleus, no full-vocabulary sort (see sampler.py)
+        return sample_logits(logits, temperature, top_p)
+
+    def _prompt_tensors(
+        self, prompt: Union[str, Sequence[int]]
+    ) -> Tuple[torch.Tensor, Optional[torch.Tensor]]:
+        """Text is tokenized here; token ids (from the caches) are used as-is."""
+        if isinstance(prompt, str):
+            enc = self.tokenizer(
+                prompt,
+                return_tensors="pt",
+                truncation=True,
+                max_length=self.max_ctx
+            )
+            return enc["input_ids"].to(self.device), enc["attention_mask"].to(self.device)
+
+        # Same truncation side as the tokenizer path
+        ids = list(prompt)[: self.max_ctx]
+        return torch.tensor([ids], device=self.device), None
+
+    # --- static KV buffer ------------------------------------------------------
+
+    def _static_past(self, max_new_tokens: int) -> Any:
+        return static_past(self, max_new_tokens)
+
+    def _graph_step(self, kv_cache: Optional[Any], past_kv: Any) -> Optional[CapturedDecodeStep]:
+        """Captured decode step for past_kv, or None to decode eagerly."""
+        if not self.graph_decode or self.graph_error is not None or hasattr(kv_cache, "get"):
+            return None
+        if self.graph_step is None or self.graph_step.kv is not self.static_kv:
+            self.graph_step = None
+            try:
+                self.graph_step = CapturedDecodeStep(self.model, self.static_kv)
+            except ValueError as e:   # not a GPT-2 style model
+                self.graph_error = str(e)
+                return None
+        if not self.graph_step.captured:
+            self.graph_error = self.graph_step.error
+            self.graph_step = None
+            return None
+        return self.graph_step if self.graph_step.owns(past_kv) else None
 
     # --- NEW: custom generation with quantized KV-cache ------------------------
 
+    def prepare(
+        self,
+        prompt: Union[str, Sequence[int]],
+        max_new_tokens: int,
+        kv_cache: Optional[Any],
+    ) -> Tuple[torch.Tensor, Optional[torch.Tensor], Optional[Any]]:
+        """
+        (input_ids, attention_mask, past_kv) for iter_ids() on a fresh
+        sequence: the prompt tensors, kv_cache reset, and the static KV
+        buffer when this backend uses one. generate() and
+        generate_stream() start with it; benchmarks that drive iter_ids()
+        themselves call it too.
+        """
+        input_ids, attention_mask = self._prompt_tensors(prompt)
+
+        # A new prompt starts a new KV sequence
+        if hasattr(kv_cache, "reset"):
+            kv_cache.reset()
+
+        # Static buffer only when no external KV cache owns past_key_values
+        past_kv = None
+        if (self.static_cache or self.graph_decode or self.kv_offload_mb > 0) and not hasattr(kv_cache, "store"):
+            past_kv = self._static_past(max_new_tokens)
+        return input_ids, attention_mask, past_kv
+
     def generate(
         self,
-        prompt: str,
+        prompt: Union[str, Sequence[int]],
         max_new_tokens: int = 64,
         temperature: float = 0.8,
         top_p: float = 0.95,
         kv_cache: Optional[Any] = None,   # <-- REQUIRED PARAM
+        should_stop: Optional[Callable[[], bool]] = None,
+        sampler: Optional[Sampler] = None,
+        stop: Optional[StopCriteria] = None,
     ) -> str:
-
-        # Tokenize prompt
-        enc = self.tokenizer(
-            prompt,
-            return_tensors="pt",
-            truncation=True,
-            max_length=self.max_ctx
+        input_ids, attention_mask, past_kv = self.prepare(prompt, max_new_tokens, kv_cache)
+
+        generated_ids, _ = self.generate_ids(
+            input_ids,
+            max_new_tokens=max_new_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            kv_cache=kv_cache,
+            past_kv=past_kv,
+            attention_mask=attention_mask,
+            should_stop=should_stop,
+            sampler=sampler,
+            stop=stop,
         )
-        input_ids = enc["input_ids"].to(self.device)
-        attention_mask = enc["attention_mask"].to(self.device)
-
-        # 1) Initial forward pass
-        with torch.inference_mode():
-            outputs = self.model(
-                input_ids=input_ids,
-                attention_mask=attention_mask,
-                use_cache=True,
-            )
-            logits = outputs.logits[:, -1, :]
-            past_kv = outputs.past_key_values
-
-            if hasattr(kv_cache, "store"):
-                kv_cache.store(past_kv)
-
-
-        generated_ids = []
-
-        # 2) Token-by-token loop
-        for _ in range(max_new_tokens):
+        if stop is not None:
+            generated_ids = generated_ids[: stop.keep]
+        with span_fn(self.tracer)("detokenize"):
+            return self.decode(generated_ids)
 
-            # Retrieve quantized KV if used
-            if hasattr(kv_cache, "get"):
-                past_kv = kv_cache.get()
-
-                if past_kv is None:
-                    break
-
-            # next token
-            next_id = self._sample_next(
-                logits[0], temperature=temperature, top_p=top_p
-            )
-            generated_ids.append(next_id)
+    def generate_stream(
+        self,
+        prompt: Union[str, Sequence[int]],
+        max_new_tokens: int = 64,
+        temperature: float = 0.8,
+        top_p: float = 0.95,
+        kv_cache: Optional[Any] = None,
+        should_stop: Optional[Callable[[], bool]] = None,
+        sampler: Optional[Sampler] = None,
+        stop: Optional[StopCriteria] = None,
+    ) -> Iterator[str]:
+        """
+        Like generate(), but yields text deltas as soon as each token is
+        sampled (text that may start a stop string is held back).
+        """
+        input_ids, attention_mask, past_kv = self.prepare(prompt, max_new_tokens, kv_cache)
+
+        loop = self.iter_ids(
+            input_ids,
+            max_new_tokens=max_new_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            kv_cache=kv_cache,
+            past_kv=past_kv,
+            attention_mask=attention_mask,
+            should_stop=should_stop,
+            sampler=sampler,
+            stop=stop,
+        )
+        yield from stream_text(loop, self.tokenizer, stop, tracer=self.tracer)
 
-            # feed next token
-            next_input = torch.tensor([[next_id]], device=self.device)
+    def generate_ids(self, input_ids: torch.Tensor, **kwargs: Any) -> Tuple[List[int], Any]:
+        """
+        Runs iter_ids() to the end.
+        Returns (generated token ids, final past_key_values).
+        """
+        return self.drain(self.iter_ids(input_ids, **kwargs))
 
-            with torch.inference_mode():
-                outputs = self.model(
-                    input_ids=next_input,
-                    past_key_values=past_kv,
-                    use_cache=True,
+    @staticmethod
+    def drain(loop: Generator[int, None, Any]) -> Tuple[List[int], Any]:
+        """Collect all ids from an iter_ids() generator plus its final past_key_values."""
+        ids: List[int] = []
+        while True:
+            try:
+                ids.append(next(loop))
+            except StopIteration as done:
+                return ids, done.value
+
+    def iter_ids(
+        self,
+        input_ids: torch.Tensor,
+        max_new_tokens: int = 64,
+        temperature: float = 0.8,
+        top_p: float = 0.95,
+        kv_cache: Optional[Any] = None,
+        past_kv: Optional[Any] = None,
+        attention_mask: Optional[torch.Tensor] = None,
+        position_offset: Optional[int] = None,
+        should_stop: Optional[Callable[[], bool]] = None,
+        sampler: Optional[Sampler] = None,
+        stop: Optional[StopCriteria] = None,
+        seen_ids: Optional[Sequence[int]] = None,
+    ) -> Generator[int, None, Any]:
+        """
+        Core decode loop on token ids. input_ids are run on top of past_kv
+        (None = fresh sequence). position_offset gives the absolute position
+        of input_ids[0] when it differs from the cached length (e.g. after
+        the oldest turns were trimmed from the front of the KV).
+        should_stop is polled after each token; True ends the reply early
+        (e.g. the memory governor under pressure).
+        sampler: optional Sampler (top-k / min-p / repetition penalty);
+        without one, temperature + top_p sampling is used.
+        stop: optional StopCriteria (EOS, stop strings, time limit), fed
+        every sampled id; the id that triggers it is still yielded, and the
+        caller cuts the reply at stop.keep.
+        seen_ids: ids already in past_kv before input_ids (earlier turns
+        of a ChatSession); the sampler's repetition / frequency penalties
+        count them along with input_ids.
+
+        Yields each token id right after it is sampled; the generator's
+        return value is the final past_key_values.
+        """
+
+        # Text caches (SlidingWindowCache, PagedCache) only build the prompt;
+        # a KV cache that stores past_key_values rules speculation out
+        if (
+            self.speculator is not None
+            and not hasattr(kv_cache, "store")
+            and past_kv is None
+            and position_offset is None
+            and sampler is None
+        ):
+            # Fresh sequence with plain temperature/top-p: draft-and-verify
+            return (
+                yield from self.speculator.iter_ids(
+                    input_ids, max_new_tokens, temperature, top_p, should_stop, stop
                 )
-                logits = outputs.logits[:, -1, :]
-                past_kv = outputs.past_key_values
-
-                if hasattr(kv_cache, "store"):
-                    kv_cache.store(past_kv)
-
+            )
 
-        return self.decode(generated_ids)
+        return (
+            yield from decode_loop(
+                self,
+                input_ids,
+                max_new_tokens,
+                temperature,
+                top_p,
+                kv_cache=kv_cache,
+                past_kv=past_kv,
+                attention_mask=attention_mask,
+                position_offset=position_offset,
+                should_stop=should_stop,
+                sampler=sampler,
+                stop=stop,
+                seen_ids=seen_ids,
+                graph_step=self._graph_step if self.graph_decode else None,
+            )
+        )
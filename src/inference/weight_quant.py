@@ -0,0 +1,200 @@
+# src/inference/weight_quant.py
+
+import os
+import warnings
+from typing import Any, Callable
+
+import torch
+from torch import nn
+
+try:
+    from transformers.pytorch_utils import Conv1D
+except ImportError:   # very old transformers
+    from transformers.modeling_utils import Conv1D
+
+# File inside a pre-quantized model directory (next to tokenizer + config)
+QUANT_FILE = "int8_dynamic.pt"
+
+
+def _rebuild_known_buffers(module: nn.Module, config: Any) -> bool:
+    """Non-persistent buffers that transformers' _init_weights does not recreate."""
+    if type(module).__name__ == "GPT2Attention" and "bias" in module._non_persistent_buffers_set:
+        # transformers 4.x: causal mask + masked_bias (the 5.x attention has no buffers)
+        n = config.max_position_embeddings
+        module.bias.copy_(torch.tril(torch.ones((n, n), dtype=torch.bool)).view(1, 1, n, n))
+        if "masked_bias" in module._non_persistent_buffers_set:
+            module.masked_bias.fill_(-1e4)
+        return True
+    return False
+
+
+def empty_model(build: Callable[[], nn.Module]) -> nn.Module:
+    """
+    build() on the meta device, to be filled from a state dict with
+    load_state_dict(assign=True). Buffers that no state dict holds
+    (persistent=False: rotary tables, GPT-2 attn.bias / masked_bias) are
+    moved to the CPU and recomputed; parameters stay on meta.
+    """
+    with torch.device("meta"):
+        model = build()
+    config = getattr(model, "config", None)
+    init_weights = getattr(model, "_init_weights", None)
+    for name, module in model.named_modules():
+        local = [b for b in module._non_persistent_buffers_set if module._buffers.get(b) is not None]
+        if not local:
+            continue
+        module.to_empty(device="cpu", recurse=False)
+        if _rebuild_known_buffers(module, config):
+            continue
+        for b in local:
+            if not module._buffers[b].is_floating_point():
+                raise RuntimeError(f"Cannot rebuild non-persistent buffer {name}.{b}")
+            module._buffers[b].fill_(float("nan"))
+        if init_weights is not None:
+            init_weights(module)   # transformers 5.x recreates e.g. rotary tables here
+        for b in local:
+            if bool(torch.isnan(module._buffers[b]).any()):
+                raise RuntimeError(f"Cannot rebuild non-persistent buffer {name}.{b}")
+    return model
+
+
+def _dynamic_linear() -> Any:
+    try:
+        from torch.ao.nn.quantized.dynamic import Linear as DynamicLinear
+    except ImportError as e:
+        raise RuntimeError("This torch build has no dynamic quantization (torch.ao)") from e
+    return DynamicLinear
+
+
+def is_quantized_dir(model_name: str) -> bool:
+    return os.path.isfile(os.path.join(model_name, QUANT_FILE))
+
+
+def _linear_like(conv: Conv1D) -> nn.Linear:
+    """Conv1D stores its weight as [in, out]; Linear wants [out, in]."""
+    w = conv.weight
+    linear = nn.Linear(w.shape[0], w.shape[1], device=w.device, dtype=w.dtype)
+    if w.device.type != "meta":
+        linear.weight.data = w.data.t().contiguous()
+        linear.bias.data = conv.bias.data
+    return linear
+
+
+def _to_linear(model: nn.Module) -> None:
+    """Swap every GPT-2 Conv1D for an equivalent nn.Linear, in place."""
+    for module in list(model.modules()):
+        for child_name, child in list(module.named_children()):
+            if isinstance(child, Conv1D):
+                setattr(module, child_name, _linear_like(child))
+
+
+def _untie_lm_head(model: nn.Module) -> None:
+    """
+    The LM head shares its weight with the token embedding; give it its
+    own Linear so it can be quantized while the embedding stays float.
+    """
+    head = model.get_output_embeddings()
+    if head is None:
+        return
+    w = head.weight
+    new_head = nn.Linear(w.shape[1], w.shape[0], bias=head.bias is not None, device=w.device, dtype=w.dtype)
+    if w.device.type != "meta":
+        new_head.weight.data = w.data.clone()
+        if head.bias is not None:
+            new_head.bias.data = head.bias.data
+    model.set_output_embeddings(new_head)
+    model.config.tie_word_embeddings = False
+
+
+def _dynamic_modules(model: nn.Module) -> None:
+    """Empty int8 dynamic Linear modules in place of every nn.Linear (for loading)."""
+    DynamicLinear = _dynamic_linear()
+    for module in list(model.modules()):
+        for child_name, child in list(module.named_children()):
+            if type(child) is nn.Linear:
+                setattr(
+                    module,
+                    child_name,
+                    DynamicLinear(
+                        child.in_features, child.out_features, bias_=child.bias is not None, dtype=torch.qint8
+                    ),
+                )
+
+
+def quantize_int8(model: nn.Module) -> nn.Module:
+    """
+    Dynamic INT8 quantization of a causal LM, in place: weights of all
+    Conv1D / Linear projections and of the (untied) LM head are stored as
+    int8 with one scale per output channel; activations are quantized on
+    the fly per matmul. Embeddings and LayerNorms stay float.
+    """
+    from torch.ao.quantization import per_channel_dynamic_qconfig, quantize_dynamic
+
+    _to_linear(model)
+    _untie_lm_head(model)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")   # torch.ao deprecation notices
+        quantize_dynamic(model, {nn.Linear: per_channel_dynamic_qconfig}, dtype=torch.qint8, inplace=True)
+    return model
+
+
+def save_int8(model_name: str, out_dir: str) -> str:
+    """Quantize model_name and write it, with its tokenizer and config, to out_dir."""
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    model = AutoModelForCausalLM.from_pretrained(model_name, low_cpu_mem_usage=True).eval()
+    quantize_int8(model)
+    os.makedirs(out_dir, exist_ok=True)
+    model.config.save_pretrained(out_dir)
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(out_dir)
+    path = os.path.join(out_dir, QUANT_FILE)
+    torch.save(model.state_dict(), path)
+    return path
+
+
+def load_int8(model_dir: str) -> nn.Module:
+    """
+    Load a directory written by save_int8(). The parameters are created
+    on the meta device and filled straight from the file, so the fp32
+    weights are never materialized. The file is read with
+    torch.load(weights_only=True): tensors only, no pickled code runs.
+    """
+    from transformers import AutoConfig, AutoModelForCausalLM
+
+    config = AutoConfig.from_pretrained(model_dir)
+    config.tie_word_embeddings = False
+    model = empty_model(lambda: AutoModelForCausalLM.from_config(config))
+    _to_linear(model)
+    _untie_lm_head(model)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        _dynamic_modules(model)
+        state = torch.load(os.path.join(model_dir, QUANT_FILE), weights_only=True)
+        model.load_state_dict(state, assign=True)
+
+    for name, t in list(model.named_parameters()) + list(model.named_buffers()):
+        if t.device.type == "meta":
+            raise RuntimeError(f"{name} was not restored from {model_dir}")
+    return model.eval()
+
+
+def load_model(model_name: str, dtype: str = "float32") -> nn.Module:
+    """
+    Causal LM for the HF backends. dtype: "float32", "float16" (halves
+    weight memory, often slower on ARM CPUs) or "int8" (dynamic INT8).
+    A directory written by save_int8() always loads as int8.
+    """
+    from transformers import AutoModelForCausalLM
+
+    if is_quantized_dir(model_name):
+        return load_int8(model_name)
+    if dtype not in ("float32", "float16", "int8"):
+        raise ValueError(f"Unknown dtype: {dtype}")
+    # Weights are loaded straight into the model (safetensors are mmapped),
+    # not into a randomly initialized copy first
+    model = AutoModelForCausalLM.from_pretrained(model_name, low_cpu_mem_usage=True)
+    if dtype == "float16":
+        model = model.to(dtype=torch.float16)
+    elif dtype == "int8":
+        quantize_int8(model)
+    return model.eval()
@@ -0,0 +1,58 @@
+# src/kv_cache/hf_compat.py
+
+from typing import Any, List, Sequence, Tuple
+
+import torch
+
+try:
+    from transformers import DynamicCache
+except ImportError:  # very old transformers: tuples are the native format
+    DynamicCache = None
+
+try:
+    from transformers.cache_utils import DynamicLayer
+except ImportError:  # older transformers without per-layer cache objects
+    DynamicLayer = object
+
+KVLayers = List[Tuple[torch.Tensor, torch.Tensor]]
+
+
+def to_layers(past_key_values: Any) -> KVLayers:
+    """
+    Normalise whatever the model returned as past_key_values into a plain
+    list of (key, value) tensors, one entry per layer.
+
+    Older transformers return a tuple of (k, v) tuples; newer ones return a
+    DynamicCache whose layers expose .keys / .values (iterating it yields
+    3-tuples, so the old `k, v = layer` unpacking no longer works).
+    """
+    layers = getattr(past_key_values, "layers", None)
+    if layers is not None:
+        return [(layer.keys, layer.values) for layer in layers]
+    if hasattr(past_key_values, "to_legacy_cache"):
+        past_key_values = past_key_values.to_legacy_cache()
+    return [(layer[0], layer[1]) for layer in past_key_values]
+
+
+def to_model_cache(layers: Sequence[Tuple[torch.Tensor, torch.Tensor]]) -> Any:
+    """
+    Wrap per-layer (key, value) tensors into the cache object the installed
+    transformers version accepts as past_key_values.
+    """
+    if DynamicCache is None:
+        return tuple(tuple(layer) for layer in layers)
+
+    legacy = tuple((k, v) for k, v in layers)
+    if DynamicLayer is object and hasattr(DynamicCache, "from_legacy_cache"):
+        return DynamicCache.from_legacy_cache(legacy)
+    return DynamicCache(legacy)
+
+
+def crop_back(past_key_values: Any, n: int) -> None:
+    """
+    Drop the last n positions of a cache object. Uses the negative
+    "remove n tokens" form of crop(), which DynamicCache and the static
+    layers here all accept (the positive max-length form is deprecated).
+    """
+    if n > 0:
+        past_key_values.crop(-n)
@@ -0,0 +1,125 @@
+# src/kv_cache/offload_cache.py
+
+import mmap
+import os
+import tempfile
+from typing import Any, List
+
+import torch
+
+from kv_cache.hf_compat import DynamicCache, DynamicLayer
+from kv_cache.static_cache import _BufferLayer
+
+
+class _OffloadLayer(_BufferLayer):
+    """_BufferLayer that tells its MmapKVBuffer when the layer is used."""
+
+    def __init__(self, owner: "MmapKVBuffer", index: int) -> None:
+        super().__init__(owner.buf[index, 0].unsqueeze(0), owner.buf[index, 1].unsqueeze(0))
+        self.owner = owner
+        self.index = index
+
+    def update(self, key_states: torch.Tensor, value_states: torch.Tensor, *args, **kwargs):
+        out = super().update(key_states, value_states, *args, **kwargs)
+        self.owner.touch(self.index, self.length)
+        return out
+
+
+class MmapKVBuffer:
+    """
+    File-backed KV storage for contexts that do not fit in RAM.
+
+    Same layout and in-place writes as StaticKVBuffer, but the
+    [layers, 2, heads, max_ctx, head_dim] tensor lives in a shared mmap of
+    a (sparse, already unlinked) file in offload_dir. Only the layers used
+    most recently stay resident: after each layer's update, layers beyond
+    resident_bytes are released with madvise(MADV_DONTNEED). Their data
+    stays in the file / page cache and is paged back in when attention for
+    that layer reads it on the next step. Slower, but the kernel can drop
+    those pages instead of OOM-killing the process.
+    """
+
+    def __init__(
+        self,
+        num_layers: int,
+        num_heads: int,
+        head_dim: int,
+        max_ctx: int,
+        resident_bytes: int,
+        dtype: torch.dtype = torch.float32,
+        offload_dir: str = "data/kv_offload",
+    ) -> None:
+        if DynamicCache is None or DynamicLayer is object:
+            raise RuntimeError("Offloaded KV mode needs a transformers version with cache layers")
+        self.max_ctx = max_ctx
+        self.resident_bytes = resident_bytes
+        self.num_layers = num_layers
+
+        elem = torch.empty((), dtype=dtype).element_size()
+        self.layer_stride = 2 * num_heads * max_ctx * head_dim * elem
+        # Bytes one layer occupies per cached position
+        self.bytes_per_position = 2 * num_heads * head_dim * elem
+
+        os.makedirs(offload_dir, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix="kv-", suffix=".bin", dir=offload_dir)
+        try:
+            os.ftruncate(fd, num_layers * self.layer_stride)   # sparse: no disk used yet
+            self._mm = mmap.mmap(fd, num_layers * self.layer_stride, flags=mmap.MAP_SHARED)
+        finally:
+            os.close(fd)
+            os.unlink(path)   # space is freed once the mapping goes away
+
+        self.buf = torch.frombuffer(self._mm, dtype=dtype).view(
+            num_layers, 2, num_heads, max_ctx, head_dim
+        )
+        self._recent: List[int] = []   # layer indices, most recently used last
+        self.released = 0              # layers paged out so far
+
+    @classmethod
+    def for_model(
+        cls, model: Any, max_ctx: int, resident_bytes: int, offload_dir: str = "data/kv_offload"
+    ) -> "MmapKVBuffer":
+        cfg = model.config
+        param = next(model.parameters())
+        return cls(
+            num_layers=cfg.num_hidden_layers,
+            num_heads=cfg.num_attention_heads,
+            head_dim=cfg.hidden_size // cfg.num_attention_heads,
+            max_ctx=max_ctx,
+            resident_bytes=resident_bytes,
+            dtype=param.dtype,
+            offload_dir=offload_dir,
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return self.num_layers * self.layer_stride
+
+    def touch(self, index: int, length: int) -> None:
+        """Mark layer `index` as used; page out layers that exceed the budget."""
+        if index in self._recent:
+            self._recent.remove(index)
+        self._recent.append(index)
+
+        # Resident size of one layer grows with the number of cached positions
+        allowed = max(self.resident_bytes // max(length * self.bytes_per_position, 1), 1)
+        while len(self._recent) > allowed:
+            self._release(self._recent.pop(0))
+
+    def _release(self, index: int) -> None:
+        if not hasattr(self._mm, "madvise"):
+            return   # no madvise (non-Linux / old Python): leave paging to the OS
+        # madvise needs page-aligned ranges; partial edge pages stay resident
+        page = mmap.PAGESIZE
+        start = -(-(index * self.layer_stride) // page) * page
+        end = (index + 1) * self.layer_stride // page * page
+        if end > start:
+            self._mm.madvise(mmap.MADV_DONTNEED, start, end - start)
+            self.released += 1
+
+    def new_cache(self) -> Any:
+        """Empty HF cache object backed by the mapped file (previous contents are overwritten)."""
+        self._recent = []
+        cache = DynamicCache()
+        cache.layers = [_OffloadLayer(self, i) for i in range(self.num_layers)]
+        return cache
@@ -1,48 +1,45 @@
 # src/kv_cache/paged_cache.py
 
-from typing import List, Tuple, Protocol
+from typing import List, Optional, Sequence
 
+from kv_cache.paged_kv import KVBlockPool
+from kv_cache.turn_history import BackendLike, TurnHistory
 
-class BackendLike(Protocol):
-    def token_count(self, text: str) -> int:
-        ...
 
-
-class PagedCache:
+class PagedCache(TurnHistory):
     """
     Paged / rotating cache.
     Keeps a fixed number of most recent turns (max_turns).
     Has an optional token budget as a safety cap.
+
+    kv_pool: optional KVBlockPool; a ChatSession over this cache then keeps
+    the turns' KV in fixed-size blocks from that pool instead of growing
+    tensors, and evicted turns hand their blocks straight back.
     """
 
-    def __init__(self, max_turns: int = 6, max_tokens: int | None = None) -> None:
+    def __init__(
+        self,
+        max_turns: int = 6,
+        max_tokens: int | None = None,
+        kv_pool: Optional[KVBlockPool] = None,
+    ) -> None:
+        super().__init__()
         self.max_turns = max_turns
         self.max_tokens = max_tokens
-        self.turns: List[Tuple[str, str]] = []
+        self.kv_pool = kv_pool
 
-    def add_turn(self, user: str, assistant: str) -> None:
-        self.turns.append((user, assistant))
+    def add_turn(
+        self, user: str, assistant: str, reply_ids: Optional[Sequence[int]] = None
+    ) -> None:
+        super().add_turn(user, assistant, reply_ids)
         if len(self.turns) > self.max_turns:
-            self.turns = self.turns[-self.max_turns :]
-
-    def _render_prompt(self, new_user: str) -> str:
-        lines: List[str] = []
-        for u, a in self.turns:
-            lines.append(f"User: {u}")
-            lines.append(f"Assistant: {a}")
-        lines.append(f"User: {new_user}")
-        lines.append("Assistant:")
-        return "\n".join(lines)
-
-    def build_prompt(self, backend: BackendLike, new_user: str) -> str:
-        prompt = self._render_prompt(new_user)
-
-        if self.max_tokens is None:
-            return prompt
+            self.keep_last(self.max_turns)
 
+    def build_prompt_ids(self, backend: BackendLike, new_user: str) -> List[int]:
+        new_ids = self.new_turn_ids(backend, new_user)
         # If token budget given, drop turns until we fit
-        while backend.token_count(prompt) > self.max_tokens and self.turns:
-            self.turns.pop(0)
-            prompt = self._render_prompt(new_user)
+        return self._fit(backend, new_ids, max_tokens=self.max_tokens)
 
-        return prompt
+    def build_prompt(self, backend: BackendLike, new_user: str) -> str:
+        """Text form of build_prompt_ids (prefer the ids: no re-tokenization)."""
+        return backend.decode(self.build_prompt_ids(backend, new_user))
@@ -0,0 +1,280 @@
+# src/kv_cache/paged_kv.py
+
+from typing import Any, List, Optional, Tuple
+
+import torch
+
+from kv_cache.hf_compat import DynamicCache, DynamicLayer
+
+
+class KVBlockPool:
+    """
+    Fixed pool of fixed-size KV blocks, allocated once at startup.
+
+    Storage is one [layers, 2, heads, num_blocks, block_size, head_dim]
+    tensor; a block holds block_size positions for every layer. Sequences
+    own blocks through a block table (PagedSequence). Blocks come from a
+    free list and are reference-counted, so forked sequences share their
+    common prefix, and a block goes back to the free list as soon as its
+    last owner lets go. RSS stays flat no matter how many turns or
+    sessions there are.
+    """
+
+    def __init__(
+        self,
+        num_layers: int,
+        num_heads: int,
+        head_dim: int,
+        num_blocks: int,
+        block_size: int = 16,
+        dtype: torch.dtype = torch.float32,
+        device: str = "cpu",
+    ) -> None:
+        if DynamicCache is None or DynamicLayer is object:
+            raise RuntimeError("Paged KV mode needs a transformers version with cache layers")
+        self.num_layers = num_layers
+        self.num_blocks = num_blocks
+        self.block_size = block_size
+        self.blocks = torch.zeros(
+            (num_layers, 2, num_heads, num_blocks, block_size, head_dim),
+            dtype=dtype,
+            device=device,
+        )
+        # Pop from the end -> low block ids are handed out first
+        self.free_list: List[int] = list(range(num_blocks - 1, -1, -1))
+        self.ref_counts: List[int] = [0] * num_blocks
+
+    @classmethod
+    def for_model(cls, model: Any, num_blocks: int, block_size: int = 16) -> "KVBlockPool":
+        cfg = model.config
+        param = next(model.parameters())
+        return cls(
+            num_layers=cfg.num_hidden_layers,
+            num_heads=cfg.num_attention_heads,
+            head_dim=cfg.hidden_size // cfg.num_attention_heads,
+            num_blocks=num_blocks,
+            block_size=block_size,
+            dtype=param.dtype,
+            device=param.device,
+        )
+
+    @property
+    def num_free(self) -> int:
+        return len(self.free_list)
+
+    @property
+    def nbytes(self) -> int:
+        return self.blocks.numel() * self.blocks.element_size()
+
+    def allocate(self) -> int:
+        if not self.free_list:
+            raise RuntimeError(
+                f"KV block pool exhausted ({self.num_blocks} blocks of {self.block_size})"
+            )
+        block = self.free_list.pop()
+        self.ref_counts[block] = 1
+        return block
+
+    def incref(self, block: int) -> None:
+        self.ref_counts[block] += 1
+
+    def decref(self, block: int) -> None:
+        self.ref_counts[block] -= 1
+        if self.ref_counts[block] == 0:
+            self.free_list.append(block)
+
+    def new_sequence(self) -> "PagedSequence":
+        return PagedSequence(self)
+
+
+class PagedSequence:
+    """
+    Block table of one sequence in a KVBlockPool.
+
+    Live positions are slots [start, start + length) of the concatenated
+    blocks; trim_front() advances start and frees blocks that fall
+    entirely before it. Writing into a block shared with another sequence
+    (see fork()) copies it first (copy-on-write).
+    """
+
+    def __init__(self, pool: KVBlockPool) -> None:
+        self.pool = pool
+        self.block_ids: List[int] = []
+        self.start = 0
+        self.lengths: List[int] = [0] * pool.num_layers   # live positions per layer
+        self._index: Optional[torch.Tensor] = None
+
+    @property
+    def length(self) -> int:
+        return self.lengths[0]
+
+    def blocks_needed(self, n: int) -> int:
+        """Blocks that appending n positions would allocate (new and copied-on-write)."""
+        bs = self.pool.block_size
+        begin = self.start + min(self.lengths)
+        end = self.start + max(self.lengths) + n
+        shared = sum(
+            1
+            for b in self.block_ids[begin // bs : -(-end // bs)]
+            if self.pool.ref_counts[b] > 1
+        )
+        return max(-(-end // bs) - len(self.block_ids), 0) + shared
+
+    def _ensure(self, begin: int, end: int) -> None:
+        """Make slots [begin, end) writable: copy shared blocks, allocate missing ones."""
+        pool = self.pool
+        bs = pool.block_size
+        for i in range(begin // bs, min(-(-end // bs), len(self.block_ids))):
+            old = self.block_ids[i]
+            if pool.ref_counts[old] > 1:
+                new = pool.allocate()
+                pool.blocks[:, :, :, new] = pool.blocks[:, :, :, old]
+                pool.decref(old)
+                self.block_ids[i] = new
+                self._index = None
+        while len(self.block_ids) * bs < end:
+            self.block_ids.append(pool.allocate())
+            self._index = None
+
+    def write(self, layer: int, k: torch.Tensor, v: torch.Tensor) -> None:
+        """Append k/v [1, H, n, D] to this layer."""
+        bs = self.pool.block_size
+        n = k.shape[2]
+        at = self.start + self.lengths[layer]
+        self._ensure(at, at + n)
+
+        blocks = self.pool.blocks[layer]
+        i = 0
+        while i < n:
+            slot = at + i
+            b, off = self.block_ids[slot // bs], slot % bs
+            m = min(bs - off, n - i)
+            blocks[0, :, b, off : off + m] = k[0, :, i : i + m]
+            blocks[1, :, b, off : off + m] = v[0, :, i : i + m]
+            i += m
+        self.lengths[layer] += n
+
+    def gather(self, layer: int, out: Optional[torch.Tensor] = None) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        [1, H, length, D] K/V of this layer's live positions, gathered into
+        out ([2, H, >= len(block_ids), block_size, D]) or a new tensor.
+        """
+        if self._index is None:
+            self._index = torch.tensor(self.block_ids, device=self.pool.blocks.device)
+        blocks = self.pool.blocks[layer]
+        if out is not None:
+            out = out[:, :, : len(self.block_ids)]
+        kv = torch.index_select(blocks, 2, self._index, out=out)
+        h, d = blocks.shape[1], blocks.shape[-1]
+        s, e = self.start, self.start + self.lengths[layer]
+        k = kv[0].reshape(h, -1, d)[:, s:e]
+        v = kv[1].reshape(h, -1, d)[:, s:e]
+        return k.unsqueeze(0), v.unsqueeze(0)
+
+    def trim_front(self, n: int) -> None:
+        n = min(n, self.length)
+        self.start += n
+        self.lengths = [max(x - n, 0) for x in self.lengths]
+
+        bs = self.pool.block_size
+        dead = self.start // bs
+        if dead:
+            for b in self.block_ids[:dead]:
+                self.pool.decref(b)
+            del self.block_ids[:dead]
+            self.start -= dead * bs
+            self._index = None
+
+    def trim_back(self, n: int) -> None:
+        """Drop the newest n positions and return blocks no longer needed."""
+        self.lengths = [max(x - n, 0) for x in self.lengths]
+        keep = -(-(self.start + max(self.lengths)) // self.pool.block_size)
+        if keep < len(self.block_ids):
+            for b in self.block_ids[keep:]:
+                self.pool.decref(b)
+            del self.block_ids[keep:]
+            self._index = None
+
+    def fork(self) -> "PagedSequence":
+        """New sequence sharing all current blocks (copy-on-write on append)."""
+        other = PagedSequence(self.pool)
+        for b in self.block_ids:
+            self.pool.incref(b)
+        other.block_ids = list(self.block_ids)
+        other.start = self.start
+        other.lengths = list(self.lengths)
+        return other
+
+    def release(self) -> None:
+        """Return every block to the pool."""
+        for b in self.block_ids:
+            self.pool.decref(b)
+        self.block_ids = []
+        self.start = 0
+        self.lengths = [0] * self.pool.num_layers
+        self._index = None
+
+    def as_cache(self) -> Any:
+        """
+        HF cache object that reads and writes this sequence's blocks. Its
+        gather scratch is freed with it, so make one per reply.
+        """
+        cache = DynamicCache()
+        scratch = _GatherScratch(self.pool)
+        cache.layers = [_PagedLayer(self, i, scratch) for i in range(self.pool.num_layers)]
+        return cache
+
+
+class _GatherScratch:
+    """
+    One layer's gathered K/V, [2, H, blocks, block_size, D], shared by all
+    layers of one as_cache() object: a layer's attention is done with it
+    before the next layer gathers. Grows with the sequence.
+    """
+
+    def __init__(self, pool: KVBlockPool) -> None:
+        self.pool = pool
+        self.buf: Optional[torch.Tensor] = None
+
+    def take(self, n_blocks: int) -> torch.Tensor:
+        cap = 0 if self.buf is None else self.buf.shape[2]
+        if n_blocks > cap:
+            shape = list(self.pool.blocks.shape[1:])
+            shape[2] = min(max(n_blocks, 2 * cap), self.pool.num_blocks)
+            self.buf = None
+            self.buf = self.pool.blocks.new_empty(shape)
+        return self.buf
+
+
+class _PagedLayer(DynamicLayer):
+    """One layer of a HF cache backed by a PagedSequence."""
+
+    def __init__(self, seq: PagedSequence, layer: int, scratch: _GatherScratch) -> None:
+        super().__init__()
+        self.seq = seq
+        self.layer = layer
+        self.scratch = scratch
+
+    def lazy_initialization(self, key_states: torch.Tensor, value_states: torch.Tensor) -> None:
+        blocks = self.seq.pool.blocks
+        self.dtype, self.device = blocks.dtype, blocks.device
+        self.is_initialized = True
+
+    def update(self, key_states: torch.Tensor, value_states: torch.Tensor, *args, **kwargs):
+        if not self.is_initialized:
+            self.lazy_initialization(key_states, value_states)
+        self.seq.write(self.layer, key_states, value_states)
+        # No paged attention kernel here: attention reads the blocks gathered
+        # into the shared scratch; nothing is kept in self.keys / self.values
+        return self.seq.gather(self.layer, self.scratch.take(len(self.seq.block_ids)))
+
+    def get_seq_length(self) -> int:
+        return self.seq.lengths[self.layer]
+
+    def get_max_length(self) -> int:
+        return -1
+
+    def reset(self) -> None:
+        self.seq.release()
+        self.keys = self.values = None
+        self.is_initialized = False
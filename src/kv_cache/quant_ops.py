@@ -0,0 +1,46 @@
+# src/kv_cache/quant_ops.py
+
+from typing import Tuple
+
+import torch
+
+
+def pack_int4(q: torch.Tensor) -> torch.Tensor:
+    """
+    Pack uint8 values in [0, 15] two per byte along the last dim.
+    The last dim must be even; the result has half its size.
+    """
+    return q[..., 0::2] | (q[..., 1::2] << 4)
+
+
+def unpack_int4(p: torch.Tensor) -> torch.Tensor:
+    """Inverse of pack_int4."""
+    lo = p & 0x0F
+    hi = p >> 4
+    return torch.stack((lo, hi), dim=-1).flatten(-2)
+
+
+def quantize_asym(
+    x: torch.Tensor, dim: int, bits: int
+) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """
+    Asymmetric min/max quantization of x, reducing over `dim`.
+
+    Returns (q, scale, zero) where q is uint8 in [0, 2**bits - 1] and
+    x ~= q * scale + zero. scale/zero are float16 (what gets stored) and
+    q is computed against the rounded values so storage is self-consistent.
+    """
+    qmax = (1 << bits) - 1
+    x = x.float()
+    mn = x.amin(dim=dim, keepdim=True)
+    mx = x.amax(dim=dim, keepdim=True)
+    scale = ((mx - mn) / qmax).clamp_min(1e-6).half()
+    zero = mn.half()
+    q = ((x - zero.float()) / scale.float()).round_().clamp_(0, qmax).to(torch.uint8)
+    return q, scale, zero
+
+
+def dequantize_asym(
+    q: torch.Tensor, scale: torch.Tensor, zero: torch.Tensor
+) -> torch.Tensor:
+    return q.float() * scale.float() + zero.float()
@@ -1,16 +1,390 @@
+import weakref
+
 import torch
-from typing import Any, List, Tuple, Optional
+from typing import Any, Dict, List, Tuple, Optional
+
+from kv_cache.hf_compat import DynamicCache, DynamicLayer, to_layers
+from kv_cache.quant_ops import pack_int4, quantize_asym, unpack_int4
+
+
+class _BlockBuffer:
+    """
+    Quantized K or V stream of one layer.
+
+    Positions are quantized `block` at a time and never re-quantized; the
+    positions of a block that is still filling up wait in a float tail of
+    at most block - 1 rows. There is no float copy of the quantized part:
+    read_into() dequantizes into a buffer owned by the caller.
+
+    Subclasses name their code tensors in `fields` and define _alloc,
+    _rows, _encode and _decode_into.
+    """
+
+    fields: Tuple[str, ...] = ()
+
+    def __init__(self, block: int) -> None:
+        self.block = block
+        self.clear()
+
+    def clear(self) -> None:
+        for name in self.fields:
+            setattr(self, name, None)
+        self.tail: Optional[torch.Tensor] = None   # float [B, H, block, D]
+        self.shape: Optional[Tuple[int, int, int]] = None   # (B, H, D)
+        self.dtype = torch.float32
+        self.device = torch.device("cpu")
+        self.length = 0     # positions appended
+        self.q_length = 0   # positions quantized, a multiple of block
+
+    def _alloc(self, cap: int) -> Dict[str, torch.Tensor]:
+        raise NotImplementedError
+
+    def _rows(self, name: str, positions: int) -> int:
+        """Rows of code tensor `name` (dim 2) that cover `positions`."""
+        raise NotImplementedError
+
+    def _encode(self, x: torch.Tensor, s: int) -> None:
+        raise NotImplementedError
+
+    def _decode_into(self, out: torch.Tensor) -> None:
+        raise NotImplementedError
+
+    def _reserve(self, needed: int) -> None:
+        cap = 0 if self.q is None else self.q.shape[2]
+        if needed <= cap:
+            return
+
+        # Grow geometrically so appends are amortised O(new tokens)
+        new_cap = max(needed, 2 * cap, self.block)
+        new_cap = -(-new_cap // self.block) * self.block
+        for name, t in self._alloc(new_cap).items():
+            old = getattr(self, name)
+            if old is not None:
+                r = self._rows(name, self.q_length)
+                t[:, :, :r] = old[:, :, :r]
+            setattr(self, name, t)
+
+    def append(self, t: torch.Tensor) -> None:
+        """t: [B, H, n, D] float tensor holding only the new positions."""
+        b, h, n, d = t.shape
+        if n == 0:
+            return
+        if self.shape is None:
+            self.shape, self.dtype, self.device = (b, h, d), t.dtype, t.device
+
+        held = self.length - self.q_length
+        x = torch.cat((self.tail[:, :, :held], t), dim=2) if held else t
+        full = x.shape[2] // self.block * self.block
+        if full:
+            self._reserve(self.q_length + full)
+            self._encode(x[:, :, :full], self.q_length)
+            self.q_length += full
+        rest = x.shape[2] - full
+        if rest:
+            if self.tail is None:
+                self.tail = t.new_empty((b, h, self.block, d))
+            self.tail[:, :, :rest] = x[:, :, full:]
+        self.length += n
+
+    def read_into(self, out: torch.Tensor) -> torch.Tensor:
+        """Dequantize all positions into out [B, H, >= length, D]; returns the filled view."""
+        if self.q_length:
+            self._decode_into(out[:, :, : self.q_length])
+        if self.length > self.q_length:
+            out[:, :, self.q_length : self.length] = self.tail[:, :, : self.length - self.q_length]
+        return out[:, :, : self.length]
+
+    def view(self) -> torch.Tensor:
+        """New float tensor with all positions (a transient copy)."""
+        b, h, d = self.shape
+        out = torch.empty((b, h, self.length, d), dtype=self.dtype, device=self.device)
+        return self.read_into(out)
+
+    def nbytes(self) -> int:
+        """Bytes of the live codes, scales and float tail."""
+        if self.shape is None:
+            return 0
+        total = 0
+        for name in self.fields:
+            t = getattr(self, name)
+            if t is not None:
+                total += self._rows(name, self.q_length) * t[:, :, :1].numel() * t.element_size()
+        if self.tail is not None:
+            total += (self.length - self.q_length) * self.tail[:, :, :1].numel() * self.tail.element_size()
+        return total
+
+    def resident_nbytes(self) -> int:
+        """Bytes actually allocated, including spare capacity."""
+        tensors = [getattr(self, name) for name in self.fields] + [self.tail]
+        return sum(t.numel() * t.element_size() for t in tensors if t is not None)
+
+    def state(self) -> dict:
+        """Compact copy: quantized positions (no spare capacity) plus the float tail."""
+        if self.shape is None:
+            return {"length": 0}
+        state = {
+            "length": self.length,
+            "q_length": self.q_length,
+            "shape": self.shape,
+            "dtype": str(self.dtype).replace("torch.", ""),
+            "tail": None if self.tail is None else self.tail[:, :, : self.length - self.q_length],
+        }
+        for name in self.fields:
+            t = getattr(self, name)
+            state[name] = None if t is None else t[:, :, : self._rows(name, self.q_length)]
+        return state
+
+    def load_state(self, state: dict) -> None:
+        self.clear()
+        if state["length"] == 0:
+            return
+        self.shape = tuple(state["shape"])
+        self.dtype = getattr(torch, state["dtype"])
+        qn = state["q_length"]
+        if qn:
+            self._reserve(qn)
+            for name in self.fields:
+                getattr(self, name)[:, :, : self._rows(name, qn)] = state[name]
+        self.q_length = self.length = qn
+        if state["tail"] is not None:
+            self.append(state["tail"])
+
+
+class _AppendBuffer(_BlockBuffer):
+    """
+    Symmetric INT8 stream: one scale per (batch, head, block of
+    `block_size` positions).
+    """
+
+    fields = ("q", "scale")
+
+    def _alloc(self, cap: int) -> Dict[str, torch.Tensor]:
+        b, h, d = self.shape
+        return {
+            "q": torch.empty((b, h, cap, d), dtype=torch.int8, device=self.device),
+            "scale": torch.empty((b, h, cap // self.block, 1, 1), dtype=torch.float32, device=self.device),
+        }
+
+    def _rows(self, name: str, positions: int) -> int:
+        return positions if name == "q" else positions // self.block
+
+    def _encode(self, x: torch.Tensor, s: int) -> None:
+        b, h, n, d = x.shape
+        bs = self.block
+        blocks = x.reshape(b, h, n // bs, bs, d).float()
+        scale = blocks.abs().amax(dim=(3, 4), keepdim=True).clamp_min(1e-8) / 127.0
+        q = (blocks / scale).round_().clamp_(-127, 127).to(torch.int8)
+        self.q[:, :, s : s + n] = q.reshape(b, h, n, d)
+        self.scale[:, :, s // bs : (s + n) // bs] = scale
+
+    def _decode_into(self, out: torch.Tensor) -> None:
+        b, h, n, d = out.shape
+        bs = self.block
+        torch.mul(
+            self.q[:, :, :n].view(b, h, n // bs, bs, d),
+            self.scale[:, :, : n // bs],
+            out=out.view(b, h, n // bs, bs, d),
+        )
+
+
+class _GroupBuffer(_BlockBuffer):
+    """
+    Group-wise INT8/INT4 stream.
+
+    per_channel=True (keys): positions are quantized in blocks of
+    `group_size` with one scale/zero per channel; the newest positions wait
+    in the float tail. per_channel=False (values): each position is
+    quantized on arrival with one scale/zero per `group_size` channels.
+    With bits=4 two values are packed into each byte.
+    """
+
+    fields = ("q", "scale", "zero")
+
+    def __init__(self, bits: int, group_size: int, per_channel: bool) -> None:
+        self.bits = bits
+        self.group_size = group_size
+        self.per_channel = per_channel
+        self._chan_group = group_size
+        super().__init__(group_size if per_channel else 1)
+
+    def _alloc(self, cap: int) -> Dict[str, torch.Tensor]:
+        b, h, d = self.shape
+        g = self.group_size
+        if not self.per_channel and d % g != 0:
+            # Channel groups must tile head_dim; fall back to one group per token
+            self._chan_group = d
+        scale_shape = (b, h, cap // g, d) if self.per_channel else (b, h, cap, d // self._chan_group)
+        return {
+            "q": torch.empty((b, h, cap, d * self.bits // 8), dtype=torch.uint8, device=self.device),
+            "scale": torch.empty(scale_shape, dtype=torch.float16, device=self.device),
+            "zero": torch.empty(scale_shape, dtype=torch.float16, device=self.device),
+        }
+
+    def _rows(self, name: str, positions: int) -> int:
+        if name != "q" and self.per_channel:
+            return positions // self.group_size
+        return positions
+
+    def _encode(self, x: torch.Tensor, s: int) -> None:
+        b, h, n, d = x.shape
+        e = s + n
+        if self.per_channel:
+            g = self.group_size
+            q, scale, zero = quantize_asym(x.reshape(b, h, n // g, g, d), dim=3, bits=self.bits)
+            self.scale[:, :, s // g : e // g] = scale.squeeze(3)
+            self.zero[:, :, s // g : e // g] = zero.squeeze(3)
+        else:
+            g = self._chan_group
+            q, scale, zero = quantize_asym(x.reshape(b, h, n, d // g, g), dim=4, bits=self.bits)
+            self.scale[:, :, s:e] = scale.squeeze(4)
+            self.zero[:, :, s:e] = zero.squeeze(4)
+
+        q = q.reshape(b, h, n, d)
+        if self.bits == 4:
+            q = pack_int4(q)
+        self.q[:, :, s:e] = q
+
+    def _decode_into(self, out: torch.Tensor) -> None:
+        # Same arithmetic as quant_ops.dequantize_asym, written into out
+        b, h, n, d = out.shape
+        q = self.q[:, :, :n]
+        if self.bits == 4:
+            q = unpack_int4(q)
+        if self.per_channel:
+            g = self.group_size
+            shape = (b, h, n // g, g, d)
+            scale = self.scale[:, :, : n // g].unsqueeze(3)
+            zero = self.zero[:, :, : n // g].unsqueeze(3)
+        else:
+            g = self._chan_group
+            shape = (b, h, n, d // g, g)
+            scale = self.scale[:, :, :n].unsqueeze(4)
+            zero = self.zero[:, :, :n].unsqueeze(4)
+        out = out.view(shape)
+        torch.mul(q.reshape(shape), scale.float(), out=out)
+        out.add_(zero.float())
+
+
+class _Scratch:
+    """
+    Float K/V of one layer, shared by every layer of one as_cache() object:
+    each layer dequantizes into it right before its attention reads it.
+    """
+
+    def __init__(self) -> None:
+        self.k: Optional[torch.Tensor] = None
+        self.v: Optional[torch.Tensor] = None
+
+    @staticmethod
+    def _fit(buf: Optional[torch.Tensor], src: _BlockBuffer) -> torch.Tensor:
+        b, h, d = src.shape
+        if (
+            buf is not None
+            and buf.shape[2] >= src.length
+            and (buf.shape[0], buf.shape[1], buf.shape[3]) == (b, h, d)
+            and buf.dtype == src.dtype
+        ):
+            return buf
+        cap = max(src.length, 0 if buf is None else 2 * buf.shape[2])
+        return torch.empty((b, h, cap, d), dtype=src.dtype, device=src.device)
+
+    def read(self, kb: _BlockBuffer, vb: _BlockBuffer) -> Tuple[torch.Tensor, torch.Tensor]:
+        self.k = self._fit(self.k, kb)
+        self.v = self._fit(self.v, vb)
+        return kb.read_into(self.k), vb.read_into(self.v)
+
+    def nbytes(self) -> int:
+        return sum(t.numel() * t.element_size() for t in (self.k, self.v) if t is not None)
+
+
+class _QuantizedLayer(DynamicLayer):
+    """
+    One layer of a HF cache backed by an append-only QuantizedKVCache: new
+    K/V go straight into the quantized buffers and attention reads the
+    dequantized scratch. Nothing float is kept in self.keys / self.values.
+    """
+
+    def __init__(self, cache: "QuantizedKVCache", layer: int, scratch: _Scratch) -> None:
+        super().__init__()
+        self.cache = cache
+        self.layer = layer
+        self.scratch = scratch
+
+    def lazy_initialization(self, key_states: torch.Tensor, value_states: torch.Tensor) -> None:
+        self.dtype, self.device = key_states.dtype, key_states.device
+        self.is_initialized = True
+
+    def update(self, key_states: torch.Tensor, value_states: torch.Tensor, *args, **kwargs):
+        if not self.is_initialized:
+            self.lazy_initialization(key_states, value_states)
+        kb, vb = self.cache._layers[self.layer]
+        kb.append(key_states)
+        vb.append(value_states)
+        return self.scratch.read(kb, vb)
+
+    def get_seq_length(self) -> int:
+        return self.cache._layers[self.layer][0].length
+
+    def get_max_length(self) -> int:
+        return -1
+
+    def reset(self) -> None:
+        for buf in self.cache._layers[self.layer]:
+            buf.clear()
+        self.is_initialized = False
+
 
 class QuantizedKVCache:
     """
     INT8 quantized KV-cache.
     Stores quantized past_key_values and dequantizes before reuse.
+
+    scheme="tensor" (default) uses symmetric INT8:
+      - append_only=False re-quantizes every layer with one scale per
+        tensor on each store().
+      - append_only=True quantizes only new positions, in blocks of
+        `block_size` tokens with one scale per block; the newest
+        positions of an incomplete block wait in float. Per-token cost no
+        longer grows with the context length.
+
+    scheme="group" is always append-only and uses asymmetric INT8 or INT4
+    (bits=4, packed two per byte): keys get per-channel scales over blocks
+    of `group_size` tokens, values get per-token scales over groups of
+    `group_size` channels. An outlier channel then only affects its own
+    group instead of the whole layer.
+
+    Append-only caches hold no float copy of the quantized part. Decode
+    with as_cache(): the model writes new K/V straight into the buffers
+    and each layer's attention reads a dequantized scratch that all layers
+    share, so the float working set is one layer, not the whole KV.
+    get() / store() still work but build a transient float copy.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        append_only: bool = False,
+        block_size: int = 16,
+        scheme: str = "tensor",
+        bits: int = 8,
+        group_size: int = 32,
+    ) -> None:
+        if scheme not in ("tensor", "group"):
+            raise ValueError(f"Unknown quantization scheme: {scheme}")
+        if bits not in (4, 8):
+            raise ValueError(f"Unsupported bit width: {bits}")
+        if scheme == "tensor" and bits != 8:
+            raise ValueError("scheme='tensor' only supports bits=8")
+
+        self.scheme = scheme
+        self.bits = bits
+        self.group_size = group_size
+        self.append_only = append_only or scheme == "group"
+        self.block_size = block_size
         self.store_q: Optional[
             List[List[Tuple[torch.Tensor, float]]]
         ] = None  # layers -> [(q_tensor, scale), ...]
+        self._layers: Optional[List[Tuple[Any, Any]]] = None
+        self._scratch: Any = None   # weakref to the _Scratch of the live as_cache()
 
     @staticmethod
     def quantize_tensor(t: torch.Tensor) -> Tuple[torch.Tensor, float]:
@@ -25,16 +399,99 @@ class QuantizedKVCache:
     def dequantize_tensor(q: torch.Tensor, scale: float) -> torch.Tensor:
         return q.float() * scale
 
+    def reset(self) -> None:
+        """Forget everything stored; called before a fresh prefill."""
+        self.store_q = None
+        self._layers = None
+
+    def trim_front(self, n: int) -> None:
+        """
+        Drop the oldest n positions, e.g. when a conversation budget evicts
+        old turns. The kept part is re-quantized once from its float view.
+        """
+        layers = self.get()
+        self.reset()
+        if layers is not None and n < layers[0][0].shape[2]:
+            self.store([(k[:, :, n:], v[:, :, n:]) for k, v in layers])
+
+    def trim_back(self, n: int) -> None:
+        """Drop the newest n positions (e.g. the tokens of a stop string)."""
+        layers = self.get()
+        self.reset()
+        if layers is not None and n < layers[0][0].shape[2]:
+            end = layers[0][0].shape[2] - n
+            self.store([(k[:, :, :end], v[:, :, :end]) for k, v in layers])
+
+    def seq_length(self) -> int:
+        if self.append_only:
+            return 0 if self._layers is None else self._layers[0][0].length
+        if self.store_q is None:
+            return 0
+        return self.store_q[0][0][0].shape[2]
+
     def store(self, past_key_values: Any) -> None:
+        if self._owns(past_key_values):
+            return   # as_cache() layers already wrote the new positions
+        if self.append_only:
+            self._store_append(past_key_values)
+            return
+
         layers_q = []
-        for layer in past_key_values:
-            k, v = layer
+        for k, v in to_layers(past_key_values):
             qk, sk = self.quantize_tensor(k.cpu())
             qv, sv = self.quantize_tensor(v.cpu())
             layers_q.append([(qk, sk), (qv, sv)])
         self.store_q = layers_q
 
+    def _owns(self, past_key_values: Any) -> bool:
+        layers = getattr(past_key_values, "layers", None)
+        return bool(layers) and getattr(layers[0], "cache", None) is self
+
+    def as_cache(self, num_layers: int) -> Any:
+        """
+        HF cache object that appends into this (append-only) cache; pass it
+        as past_key_values. Its dequantized scratch is freed with it.
+        """
+        if not self.append_only:
+            raise RuntimeError("as_cache() needs an append-only QuantizedKVCache")
+        if self._layers is None:
+            self._layers = [self._new_layer() for _ in range(num_layers)]
+        scratch = _Scratch()
+        self._scratch = weakref.ref(scratch)
+        cache = DynamicCache()
+        cache.layers = [_QuantizedLayer(self, i, scratch) for i in range(len(self._layers))]
+        return cache
+
+    def _new_layer(self) -> Tuple[Any, Any]:
+        if self.scheme == "group":
+            return (
+                _GroupBuffer(self.bits, self.group_size, per_channel=True),
+                _GroupBuffer(self.bits, self.group_size, per_channel=False),
+            )
+        return _AppendBuffer(self.block_size), _AppendBuffer(self.block_size)
+
+    # Buffers are created under inference_mode by the backends, so every
+    # in-place update must happen under it too.
+    @torch.inference_mode()
+    def _store_append(self, past_key_values: Any) -> None:
+        layers = to_layers(past_key_values)
+
+        # A shorter sequence than what we hold means a new conversation
+        if self._layers is not None and layers[0][0].shape[2] < self.seq_length():
+            self.reset()
+        if self._layers is None:
+            self._layers = [self._new_layer() for _ in layers]
+
+        for (k, v), (kb, vb) in zip(layers, self._layers):
+            start = kb.length
+            if k.shape[2] > start:
+                kb.append(k[:, :, start:])
+                vb.append(v[:, :, start:])
+
     def get(self) -> Optional[Any]:
+        if self.append_only:
+            return self._get_append()
+
         if self.store_q is None:
             return None
 
@@ -45,3 +502,68 @@ class QuantizedKVCache:
             v = self.dequantize_tensor(qv, sv)
             restored.append((k, v))
         return tuple(restored)
+
+    @torch.inference_mode()
+    def _get_append(self) -> Optional[Any]:
+        if self._layers is None:
+            return None
+        return tuple((kb.view(), vb.view()) for kb, vb in self._layers)
+
+    # --- spill / restore (append-only mode) -------------------------------------
+
+    def state_dict(self) -> dict:
+        """
+        Compact tensors of the quantized KV (codes, scales and float tail,
+        no spare capacity), e.g. for torch.save(); restored with
+        load_state_dict().
+        """
+        if not self.append_only:
+            raise RuntimeError("state_dict() needs an append-only QuantizedKVCache")
+        layers = [] if self._layers is None else self._layers
+        return {
+            "scheme": self.scheme,
+            "bits": self.bits,
+            "layers": [(kb.state(), vb.state()) for kb, vb in layers],
+        }
+
+    @torch.inference_mode()
+    def load_state_dict(self, state: dict) -> None:
+        if not self.append_only:
+            raise RuntimeError("load_state_dict() needs an append-only QuantizedKVCache")
+        if (state["scheme"], state["bits"]) != (self.scheme, self.bits):
+            raise ValueError(
+                f"KV state is {state['scheme']}/{state['bits']}-bit, "
+                f"cache is {self.scheme}/{self.bits}-bit"
+            )
+        self.reset()
+        if not state["layers"]:
+            return
+        self._layers = []
+        for ks, vs in state["layers"]:
+            kb, vb = self._new_layer()
+            kb.load_state(ks)
+            vb.load_state(vs)
+            self._layers.append((kb, vb))
+
+    def resident_nbytes(self) -> int:
+        """
+        RAM held right now: allocated buffers including spare capacity,
+        plus the one-layer scratch of an as_cache() still in use.
+        """
+        if not self.append_only:
+            return self.nbytes()
+        scratch = self._scratch() if self._scratch is not None else None
+        total = 0 if scratch is None else scratch.nbytes()
+        if self._layers is None:
+            return total
+        return total + sum(kb.resident_nbytes() + vb.resident_nbytes() for kb, vb in self._layers)
+
+    def nbytes(self) -> int:
+        """Bytes held by the quantized representation (codes, scales, float tail)."""
+        if self.append_only:
+            if self._layers is None:
+                return 0
+            return sum(kb.nbytes() + vb.nbytes() for kb, vb in self._layers)
+        if self.store_q is None:
+            return 0
+        return sum(q.numel() + 4 for layer in self.store_q for q, _ in layer)
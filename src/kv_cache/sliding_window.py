@@ -1,62 +1,31 @@
 # src/kv_cache/sliding_window.py
 
-from typing import List, Tuple, Protocol
+from typing import List
 
+from kv_cache.turn_history import BackendLike, TurnHistory
 
-class BackendLike(Protocol):
-    def encode(self, text: str) -> List[int]:
-        ...
 
-    def decode(self, token_ids: List[int]) -> str:
-        ...
-
-    def token_count(self, text: str) -> int:
-        ...
-
-
-class SlidingWindowCache:
+class SlidingWindowCache(TurnHistory):
     """
     Sliding-window conversation cache.
     Keeps only the most recent tokens (max_tokens).
     """
 
     def __init__(self, max_tokens: int = 512) -> None:
+        super().__init__()
         self.max_tokens = max_tokens
-        # list of (user, assistant) turns
-        self.turns: List[Tuple[str, str]] = []
-
-    def add_turn(self, user: str, assistant: str) -> None:
-        self.turns.append((user, assistant))
-
-    def _render_prompt(self, new_user: str) -> str:
-        lines: List[str] = []
-        for u, a in self.turns:
-            lines.append(f"User: {u}")
-            lines.append(f"Assistant: {a}")
-        lines.append(f"User: {new_user}")
-        lines.append("Assistant:")
-        return "\n".join(lines)
 
-    def build_prompt(self, backend: BackendLike, new_user: str) -> str:
+    def build_prompt_ids(self, backend: BackendLike, new_user: str) -> List[int]:
         """
-        Returns a prompt string with prior context plus new_user.
-        Drops oldest turns until token budget fits.
+        Returns prompt token ids with prior context plus new_user.
+        Drops oldest turns until token budget fits; a single huge user
+        message is hard-truncated to its last max_tokens tokens.
         """
+        new_ids = self.new_turn_ids(backend, new_user)
         if self.max_tokens <= 0:
-            return f"User: {new_user}\nAssistant:"
-
-        # Start from full history
-        prompt = self._render_prompt(new_user)
-
-        # While too long, drop oldest turn
-        while backend.token_count(prompt) > self.max_tokens and self.turns:
-            self.turns.pop(0)
-            prompt = self._render_prompt(new_user)
+            return new_ids
+        return self._fit(backend, new_ids, max_tokens=self.max_tokens, truncate=True)
 
-        # If still too long (single huge user message), hard truncate by tokens
-        if backend.token_count(prompt) > self.max_tokens:
-            token_ids = backend.encode(prompt)
-            token_ids = token_ids[-self.max_tokens :]
-            prompt = backend.decode(token_ids)
-
-        return prompt
+    def build_prompt(self, backend: BackendLike, new_user: str) -> str:
+        """Text form of build_prompt_ids (prefer the ids: no re-tokenization)."""
+        return backend.decode(self.build_prompt_ids(backend, new_user))
@@ -0,0 +1,113 @@
+# src/kv_cache/static_cache.py
+
+from typing import Any
+
+import torch
+
+from kv_cache.hf_compat import DynamicCache, DynamicLayer
+
+
+class _BufferLayer(DynamicLayer):
+    """
+    One layer of a HF cache whose keys/values live in a slice of a
+    preallocated buffer. update() copies the new positions in place and
+    returns views, so the decode step never concatenates or reallocates.
+    """
+
+    def __init__(self, k_buf: torch.Tensor, v_buf: torch.Tensor) -> None:
+        super().__init__()
+        self._k = k_buf   # [1, H, cap, D]
+        self._v = v_buf
+        self.length = 0
+
+    def lazy_initialization(self, key_states: torch.Tensor, value_states: torch.Tensor) -> None:
+        self.dtype, self.device = self._k.dtype, self._k.device
+        self.is_initialized = True
+
+    def update(self, key_states: torch.Tensor, value_states: torch.Tensor, *args, **kwargs):
+        if not self.is_initialized:
+            self.lazy_initialization(key_states, value_states)
+
+        end = self.length + key_states.shape[-2]
+        if end > self._k.shape[2]:
+            raise RuntimeError(
+                f"Static KV buffer full: {end} positions > capacity {self._k.shape[2]}"
+            )
+        self._k[:, :, self.length : end] = key_states
+        self._v[:, :, self.length : end] = value_states
+        self.length = end
+
+        self.keys = self._k[:, :, :end]
+        self.values = self._v[:, :, :end]
+        return self.keys, self.values
+
+    def get_seq_length(self) -> int:
+        return self.length
+
+    def get_max_length(self) -> int:
+        return self._k.shape[2]
+
+    def reset(self) -> None:
+        self.length = 0
+        self.keys = self.values = None
+        self.is_initialized = False
+
+    def crop(self, tokens_to_remove: int) -> None:
+        # Only the negative "remove N tokens" form is needed here
+        if tokens_to_remove < 0:
+            self.length = max(self.length + tokens_to_remove, 0)
+            self.keys = self._k[:, :, : self.length]
+            self.values = self._v[:, :, : self.length]
+
+
+class StaticKVBuffer:
+    """
+    Preallocated KV storage for the manual decode loop.
+
+    One [layers, 2, heads, max_ctx, head_dim] tensor is allocated (and
+    touched) up front, so the KV memory is fixed and known before the
+    first token. new_cache() hands the model a cache object that writes
+    each new position into this buffer in place.
+    """
+
+    def __init__(
+        self,
+        num_layers: int,
+        num_heads: int,
+        head_dim: int,
+        max_ctx: int,
+        dtype: torch.dtype = torch.float32,
+        device: str = "cpu",
+    ) -> None:
+        if DynamicCache is None or DynamicLayer is object:
+            raise RuntimeError("Static KV mode needs a transformers version with cache layers")
+        self.max_ctx = max_ctx
+        self.buf = torch.zeros(
+            (num_layers, 2, num_heads, max_ctx, head_dim), dtype=dtype, device=device
+        )
+
+    @classmethod
+    def for_model(cls, model: Any, max_ctx: int) -> "StaticKVBuffer":
+        cfg = model.config
+        param = next(model.parameters())
+        return cls(
+            num_layers=cfg.num_hidden_layers,
+            num_heads=cfg.num_attention_heads,
+            head_dim=cfg.hidden_size // cfg.num_attention_heads,
+            max_ctx=max_ctx,
+            dtype=param.dtype,
+            device=param.device,
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return self.buf.numel() * self.buf.element_size()
+
+    def new_cache(self) -> Any:
+        """Empty HF cache object backed by this buffer (previous contents are overwritten)."""
+        cache = DynamicCache()
+        cache.layers = [
+            _BufferLayer(self.buf[i, 0].unsqueeze(0), self.buf[i, 1].unsqueeze(0))
+            for i in range(self.buf.shape[0])
+        ]
+        return cache
@@ -0,0 +1,113 @@
+# src/kv_cache/turn_history.py
+
+import copy
+from typing import List, Optional, Protocol, Sequence, Tuple
+
+
+class BackendLike(Protocol):
+    def encode(self, text: str) -> List[int]:
+        ...
+
+    def decode(self, token_ids: List[int]) -> str:
+        ...
+
+
+class TurnHistory:
+    """
+    Conversation turns kept as text plus their token ids.
+
+    Each turn is tokenized once (on add, or lazily on first use) as
+    "User: {user}\\nAssistant:" followed by the reply tokens, so building a
+    prompt only sums cached lengths and concatenates ids; the prompt is
+    never re-rendered or re-tokenized.
+    """
+
+    def __init__(self) -> None:
+        # list of (user, assistant) turns and their token ids (None = not yet encoded)
+        self.turns: List[Tuple[str, str]] = []
+        self.turn_ids: List[Optional[List[int]]] = []
+        self._reply_ids: List[Optional[List[int]]] = []
+        self._sep: Optional[List[int]] = None
+
+    def add_turn(
+        self, user: str, assistant: str, reply_ids: Optional[Sequence[int]] = None
+    ) -> None:
+        """reply_ids: the generated token ids, if known, to skip re-encoding the reply."""
+        self.turns.append((user, assistant))
+        self.turn_ids.append(None)
+        self._reply_ids.append(list(reply_ids) if reply_ids is not None else None)
+
+    def keep_last(self, n: int) -> None:
+        """Keep only the n most recent turns."""
+        cut = max(len(self.turns) - n, 0)
+        del self.turns[:cut]
+        del self.turn_ids[:cut]
+        del self._reply_ids[:cut]
+
+    def copy(self) -> "TurnHistory":
+        """Same turns in a new history object (other attributes, e.g. a kv_pool, are shared)."""
+        other = copy.copy(self)
+        other.turns = list(self.turns)
+        other.turn_ids = list(self.turn_ids)
+        other._reply_ids = list(self._reply_ids)
+        return other
+
+    # --- token helpers ---------------------------------------------------------
+
+    @staticmethod
+    def new_turn_ids(backend: BackendLike, new_user: str) -> List[int]:
+        return backend.encode(f"User: {new_user}\nAssistant:")
+
+    def _ids(self, backend: BackendLike, i: int) -> List[int]:
+        ids = self.turn_ids[i]
+        if ids is None:
+            u, a = self.turns[i]
+            reply = self._reply_ids[i]
+            if reply is None:
+                reply = backend.encode(a)
+            ids = backend.encode(f"User: {u}\nAssistant:") + reply
+            self.turn_ids[i] = ids
+            self._reply_ids[i] = None
+        return ids
+
+    def _fit(
+        self,
+        backend: BackendLike,
+        new_ids: List[int],
+        max_tokens: Optional[int] = None,
+        max_turns: Optional[int] = None,
+        truncate: bool = False,
+    ) -> List[int]:
+        """
+        Drop the oldest turns that do not fit and return the prompt ids.
+
+        The cut point is found in one pass from the newest turn backwards
+        using the cached per-turn lengths. With truncate=True a prompt that
+        still exceeds max_tokens (one huge message) keeps its last tokens.
+        """
+        if self._sep is None:
+            self._sep = backend.encode("\n")
+        sep = self._sep
+
+        budget = None if max_tokens is None else max_tokens - len(new_ids)
+        oldest = 0 if max_turns is None else max(len(self.turns) - max_turns, 0)
+
+        start = len(self.turns)
+        used = 0
+        while start > oldest:
+            n = len(self._ids(backend, start - 1)) + len(sep)
+            if budget is not None and used + n > budget:
+                break
+            used += n
+            start -= 1
+        self.keep_last(len(self.turns) - start)
+
+        ids: List[int] = []
+        for i in range(len(self.turns)):
+            ids += self._ids(backend, i)
+            ids += sep
+        ids += new_ids
+
+        if truncate and max_tokens is not None and len(ids) > max_tokens:
+            ids = ids[-max_tokens:]
+        return ids
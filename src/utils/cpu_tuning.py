@@ -0,0 +1,92 @@
+# src/utils/cpu_tuning.py
+
+import json
+import os
+import platform
+import socket
+from typing import Any, Dict, List, Optional
+
+import torch
+
+from config import CpuProfile
+
+# Default profile file, shared by app_cli, app_web (settings) and autotune
+DEFAULT_PROFILE_PATH = "data/cpu_profiles.json"
+
+
+def host_key() -> str:
+    """Profiles are per machine: hostname, architecture and core count."""
+    return f"{socket.gethostname()}/{platform.machine()}/{os.cpu_count()}cpu"
+
+
+def model_key(model_name: str, dtype: str = "float32") -> str:
+    # Base name, so "models/distilgpt2" and "distilgpt2" share a profile
+    return f"{os.path.basename(os.path.normpath(model_name))}:{dtype}"
+
+
+def allowed_cpus() -> List[int]:
+    """CPUs this process may run on (all of them where affinity is unsupported)."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _read(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def load_profile(path: str, model_name: str, dtype: str = "float32") -> Optional[CpuProfile]:
+    """Saved profile for this host and model, or None."""
+    if not path:
+        return None
+    entry = _read(path).get(host_key(), {}).get(model_key(model_name, dtype))
+    return CpuProfile(**entry) if entry is not None else None
+
+
+def save_profile(path: str, model_name: str, profile: CpuProfile, dtype: str = "float32") -> None:
+    """Store profile under this host and model; other entries are kept."""
+    data = _read(path)
+    dump = getattr(profile, "model_dump", None) or profile.dict   # pydantic 2 / 1
+    data.setdefault(host_key(), {})[model_key(model_name, dtype)] = dump()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+def apply_profile(profile: CpuProfile) -> List[str]:
+    """
+    Set torch thread counts and the process CPU affinity from profile.
+    Returns what could not be applied: interop threads can only be set
+    before torch's first parallel region, and affinity is Linux-only.
+    """
+    skipped = []
+    if profile.affinity:
+        cpus = [c for c in profile.affinity if c in allowed_cpus()]
+        if hasattr(os, "sched_setaffinity") and cpus:
+            os.sched_setaffinity(0, cpus)
+        else:
+            skipped.append("affinity")
+    if profile.num_threads > 0:
+        torch.set_num_threads(profile.num_threads)
+    if profile.interop_threads > 0 and torch.get_num_interop_threads() != profile.interop_threads:
+        try:
+            torch.set_num_interop_threads(profile.interop_threads)
+        except RuntimeError:
+            skipped.append("interop_threads")
+    return skipped
+
+
+def load_and_apply(path: str, model_name: str, dtype: str = "float32") -> Optional[CpuProfile]:
+    """Backend startup: apply the saved profile for this host/model, if any."""
+    profile = load_profile(path, model_name, dtype)
+    if profile is not None:
+        skipped = apply_profile(profile)
+        if skipped:
+            print(f"[cpu profile] could not apply: {', '.join(skipped)}")
+    return profile
@@ -1,18 +1,219 @@
 # src/utils/logger.py
 
+import atexit
+import glob
+import gzip
+import json
 import os
+import queue
+import shutil
+import signal
+import sys
+import threading
 import time
-import json
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, TextIO
+
+COMPRESSORS = ("none", "gzip", "zstd")
+
+_CLOSE = object()   # queue sentinel: flush and stop the writer
 
 
 class JsonlLogger:
-    def __init__(self, log_dir: str = "data/logs") -> None:
+    """
+    JSONL log off the hot path: log() only puts the record on a queue; a
+    background thread writes batches (one write + flush per batch, no
+    open/close per record) to data/logs/<name>-<time>.jsonl.
+
+    Segments rotate at max_mb or after max_age_s; closed segments are
+    compressed (gzip, or zstd with the zstandard package) and the oldest
+    are deleted once closed segments exceed max_total_mb, so the logs
+    cannot fill the SD card. Only segments this logger closed, and
+    compressed <name>-*.jsonl.gz / .zst ones left by earlier runs, count;
+    plain .jsonl files (live segments of other processes, kept logs) are
+    never deleted. If the writer falls behind by
+    queue_size records, new records are dropped (counted in .dropped)
+    rather than blocking a reply.
+
+    close() flushes what is queued; it runs at interpreter exit, and
+    flush_on_sigterm() turns SIGTERM into a normal exit.
+    """
+
+    def __init__(
+        self,
+        log_dir: str = "data/logs",
+        name: str = "cli",
+        max_mb: float = 8,
+        max_age_s: float = 0,
+        compress: str = "gzip",
+        max_total_mb: float = 256,
+        flush_interval_s: float = 1.0,
+        queue_size: int = 10000,
+    ) -> None:
+        if compress not in COMPRESSORS:
+            raise ValueError(f"compress must be one of {COMPRESSORS}, got {compress!r}")
+        if compress == "zstd":
+            try:
+                import zstandard  # noqa: F401
+            except ImportError as e:
+                raise RuntimeError("compress='zstd' needs the zstandard package (pip install zstandard)") from e
         os.makedirs(log_dir, exist_ok=True)
-        ts = time.strftime("%Y%m%d-%H%M%S")
-        self.path = os.path.join(log_dir, f"cli-{ts}.jsonl")
+        self.log_dir = log_dir
+        self.name = name
+        self.max_bytes = int(max_mb * 1024**2)
+        self.max_age_s = max_age_s
+        self.compress = compress
+        self.max_total_bytes = int(max_total_mb * 1024**2)
+        self.flush_interval_s = flush_interval_s
+        self.dropped = 0
+        self._segments: List[str] = []   # closed by this logger, oldest first
+
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        self._file: Optional[TextIO] = None
+        self._opened_at = 0.0
+        self._closed = False
+        self.path = self._new_path()
+        self._enforce_budget()
+        self._thread = threading.Thread(target=self._run, name=f"log-writer-{name}", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # --- caller side --------------------------------------------------------------
 
     def log(self, record: Dict[str, Any]) -> None:
         record["_ts"] = time.time()
-        with open(self.path, "a", encoding="utf-8") as f:
-            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        if self._closed:
+            return
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Wait until everything logged so far is written."""
+        done = threading.Event()
+        if self._closed:
+            return
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:   # writer stuck; do not raise into the caller
+            return
+        done.wait(timeout)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_CLOSE)
+        self._thread.join(timeout=10)
+
+    # --- writer thread --------------------------------------------------------------
+
+    def _new_path(self) -> str:
+        ts = time.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(self.log_dir, f"{self.name}-{ts}.jsonl")
+        n = 1
+        while glob.glob(path + "*"):   # same second, or a compressed segment of that name
+            path = os.path.join(self.log_dir, f"{self.name}-{ts}-{n}.jsonl")
+            n += 1
+        return path
+
+    def _run(self) -> None:
+        while True:
+            try:
+                batch: List[Any] = [self._queue.get(timeout=self.flush_interval_s)]
+            except queue.Empty:
+                self._maybe_rotate()
+                continue
+            while True:   # drain what is already queued into the same write
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = []
+            waiters, stop = [], False
+            for item in batch:
+                if item is _CLOSE:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    lines.append(json.dumps(item, ensure_ascii=False, default=str) + "\n")
+            try:
+                if lines:
+                    self._write("".join(lines))
+            except OSError as e:
+                print(f"[logger] could not write {self.path}: {e}", file=sys.stderr)
+            for w in waiters:
+                w.set()
+            if stop:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                return
+
+    def _write(self, text: str) -> None:
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+            self._opened_at = time.time()
+        self._file.write(text)
+        self._file.flush()
+        self._maybe_rotate()
+
+    def _maybe_rotate(self) -> None:
+        if self._file is None:
+            return
+        too_big = self.max_bytes > 0 and self._file.tell() >= self.max_bytes
+        too_old = self.max_age_s > 0 and time.time() - self._opened_at >= self.max_age_s
+        if not (too_big or too_old):
+            return
+        self._file.close()
+        self._file = None
+        closed, self.path = self.path, self._new_path()
+        try:
+            self._segments.append(self._compress(closed))
+            self._enforce_budget()
+        except OSError as e:
+            print(f"[logger] rotation of {closed} failed: {e}", file=sys.stderr)
+
+    def _compress(self, path: str) -> str:
+        """Compress a closed segment; returns the path it ends up at."""
+        if self.compress == "gzip":
+            with open(path, "rb") as src, gzip.open(path + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            out = path + ".gz"
+        elif self.compress == "zstd":
+            import zstandard
+
+            with open(path, "rb") as src, open(path + ".zst", "wb") as dst:
+                zstandard.ZstdCompressor().copy_stream(src, dst)
+            out = path + ".zst"
+        else:
+            return path
+        os.remove(path)
+        return out
+
+    def _enforce_budget(self) -> None:
+        """Delete the oldest closed segments beyond max_total_mb."""
+        if self.max_total_bytes <= 0:
+            return
+        pattern = os.path.join(self.log_dir, f"{self.name}-*.jsonl")
+        segments = set(glob.glob(pattern + ".gz") + glob.glob(pattern + ".zst"))
+        segments.update(p for p in self._segments if os.path.exists(p))
+        ordered = sorted(segments, key=os.path.getmtime)
+        total = sum(os.path.getsize(p) for p in ordered)
+        while ordered and total > self.max_total_bytes:
+            oldest = ordered.pop(0)
+            total -= os.path.getsize(oldest)
+            os.remove(oldest)
+        self._segments = [p for p in self._segments if os.path.exists(p)]
+
+
+def flush_on_sigterm() -> None:
+    """
+    Exit normally on SIGTERM (systemd stop, docker stop) so atexit closes
+    the loggers and queued records reach the disk. Main thread only; an
+    existing handler is left alone.
+    """
+    if threading.current_thread() is threading.main_thread() and signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
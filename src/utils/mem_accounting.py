@@ -0,0 +1,241 @@
+# src/utils/mem_accounting.py
+
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+import psutil
+import torch
+
+_PAGE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+# --- bytes of tensors / weights ------------------------------------------------
+
+def tensor_bytes(t: torch.Tensor) -> int:
+    """Storage of t's elements; quantized tensors include their scales / zero points."""
+    n = t.numel() * t.element_size()
+    if t.is_quantized and t.qscheme() in (torch.per_channel_affine, torch.per_channel_symmetric):
+        scales, zeros = t.q_per_channel_scales(), t.q_per_channel_zero_points()
+        n += scales.numel() * scales.element_size() + zeros.numel() * zeros.element_size()
+    return n
+
+
+def _tensors(value: Any) -> Iterable[torch.Tensor]:
+    # state_dict values: tensors, or tuples for packed int8 Linear params
+    if isinstance(value, torch.Tensor):
+        yield value
+    elif isinstance(value, (tuple, list)):
+        for v in value:
+            yield from _tensors(v)
+
+
+def weight_bytes(model: Any) -> Dict[str, Any]:
+    """
+    Bytes of the model's weights and buffers, by dtype. Tied weights (LM
+    head = token embedding) are counted once; int8 projections count
+    their codes plus per-channel scales.
+    """
+    seen = set()
+    by_dtype: Dict[str, int] = {}
+    sources = list(model.state_dict().values()) + [b for _, b in model.named_buffers()]
+    for value in sources:
+        for t in _tensors(value):
+            key = (t.data_ptr(), t.dtype, tuple(t.shape))
+            if key in seen or t.device.type == "meta":
+                continue
+            seen.add(key)
+            name = str(t.dtype).replace("torch.", "")
+            by_dtype[name] = by_dtype.get(name, 0) + tensor_bytes(t)
+    return {"total": sum(by_dtype.values()), "by_dtype": by_dtype}
+
+
+def tokenizer_bytes(tokenizer: Any) -> Dict[str, Any]:
+    """
+    Footprint estimate of a tokenizer: size of its serialized vocab + merges
+    (the Rust tokenizer holds about this much; Python-side caches are small).
+    """
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is not None:
+        size = len(backend.to_str().encode("utf-8"))
+    else:
+        import pickle
+
+        size = len(pickle.dumps(tokenizer))
+    return {"vocab_size": len(tokenizer), "serialized_bytes": size}
+
+
+# --- KV cache bytes --------------------------------------------------------------
+
+def kv_bytes(kv: Any) -> Dict[str, Any]:
+    """
+    KV memory of any KV holder in this repo, per layer:
+      bytes     - live positions (for quantized: codes + scales + float tail)
+      allocated - RAM reserved for them (preallocated buffers, spare
+                  capacity, block pools, dequantized scratch)
+    kv may be a HF cache / legacy tuple, QuantizedKVCache, PagedSequence,
+    KVBlockPool, StaticKVBuffer or MmapKVBuffer; None counts as empty.
+    """
+    per_layer: List[int] = []
+    allocated = 0
+    kind = type(kv).__name__
+
+    if kv is None:
+        pass
+    elif hasattr(kv, "store_q") and hasattr(kv, "_layers"):                 # QuantizedKVCache
+        if kv.append_only and kv._layers is not None:
+            per_layer = [kb.nbytes() + vb.nbytes() for kb, vb in kv._layers]
+            allocated = kv.resident_nbytes()
+        elif kv.store_q is not None:
+            per_layer = [sum(q.numel() + 4 for q, _ in layer) for layer in kv.store_q]
+            allocated = sum(per_layer)
+    elif hasattr(kv, "block_ids") and hasattr(kv, "pool"):                   # PagedSequence
+        pool = kv.pool
+        per_pos = tensor_bytes(pool.blocks[0, :, :, 0, 0])   # k + v of one position, one layer
+        per_layer = [n * per_pos for n in kv.lengths]
+        allocated = len(kv.block_ids) * pool.block_size * per_pos * pool.num_layers
+    elif hasattr(kv, "blocks") and hasattr(kv, "free_list"):                 # KVBlockPool
+        used = kv.num_blocks - kv.num_free
+        per_layer = [used * tensor_bytes(kv.blocks[i, :, :, 0]) for i in range(kv.num_layers)]
+        allocated = kv.nbytes
+    elif hasattr(kv, "buf") and hasattr(kv, "new_cache"):                    # Static / Mmap buffer
+        per_layer = [tensor_bytes(kv.buf[i]) for i in range(kv.buf.shape[0])]
+        allocated = kv.nbytes
+    elif hasattr(kv, "layers"):                                              # HF cache object
+        for layer in kv.layers:
+            k, v = getattr(layer, "keys", None), getattr(layer, "values", None)
+            per_layer.append(
+                (tensor_bytes(k) if k is not None else 0) + (tensor_bytes(v) if v is not None else 0)
+            )
+            buf = getattr(layer, "_k", None)   # static-buffer layers: whole slice is reserved
+            allocated += 2 * tensor_bytes(buf) if buf is not None else per_layer[-1]
+    elif isinstance(kv, (tuple, list)):                                      # legacy ((k, v), ...)
+        per_layer = [tensor_bytes(k) + tensor_bytes(v) for k, v in kv]
+        allocated = sum(per_layer)
+    else:
+        raise ValueError(f"Don't know how to measure KV of type {kind}")
+
+    return {"kind": kind, "bytes": sum(per_layer), "allocated": allocated, "per_layer": per_layer}
+
+
+# --- RSS ----------------------------------------------------------------------------
+
+def current_rss() -> int:
+    """Resident set size in bytes; /proc/self/statm on Linux (cheap), psutil elsewhere."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE
+    except OSError:
+        return psutil.Process().memory_info().rss
+
+
+def kernel_peak_rss() -> Optional[int]:
+    """The kernel's RSS high-water mark (VmHWM, Linux only), in bytes."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_kernel_peak_rss() -> bool:
+    """Reset VmHWM to the current RSS (Linux >= 4.0); False where not allowed."""
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def trim_heap() -> bool:
+    """
+    Hand freed heap pages back to the OS (glibc malloc_trim). Freed
+    tensors of a few MB usually stay in the heap, so RSS only drops after
+    this; False where glibc is not available.
+    """
+    try:
+        import ctypes
+
+        return bool(ctypes.CDLL("libc.so.6").malloc_trim(0))
+    except (OSError, AttributeError):
+        return False
+
+
+class RssSampler:
+    """
+    Background thread that reads RSS every interval_s and keeps the peak
+    per phase label, so short spikes inside prefill or decode are seen
+    (a once-per-turn reading misses them). The loops release the GIL in
+    every torch op, so the sampler keeps its pace during a forward pass.
+
+      sampler = RssSampler()
+      sampler.start("prefill")
+      ... first token ...
+      sampler.phase("decode")
+      ...
+      sampler.stop()
+      sampler.peaks   # {"prefill": bytes, "decode": bytes}
+
+    Where the kernel allows it, start() also resets VmHWM, and stop()
+    folds it into `peak` (it catches spikes shorter than interval_s).
+    """
+
+    def __init__(self, interval_s: float = 0.005) -> None:
+        self.interval_s = interval_s
+        self.peaks: Dict[str, int] = {}
+        self.samples = 0
+        self.kernel_peak: Optional[int] = None
+        self._label = ""
+        self._hwm_reset = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self) -> None:
+        rss = current_rss()
+        self.samples += 1
+        if rss > self.peaks.get(self._label, 0):
+            self.peaks[self._label] = rss
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            self._sample()
+
+    def start(self, label: str = "run") -> "RssSampler":
+        self.peaks, self.samples, self.kernel_peak = {}, 0, None
+        self._hwm_reset = reset_kernel_peak_rss()
+        self._label = label
+        self._sample()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def phase(self, label: str) -> None:
+        """Attribute the following samples to label."""
+        self._sample()   # close the previous phase with a final reading
+        self._label = label
+        self._sample()
+
+    def stop(self) -> None:
+        self._sample()
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._hwm_reset:
+            self.kernel_peak = kernel_peak_rss()
+
+    @property
+    def peak(self) -> int:
+        sampled = max(self.peaks.values(), default=0)
+        return max(sampled, self.kernel_peak or 0)
+
+    def __enter__(self) -> "RssSampler":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
@@ -0,0 +1,190 @@
+# src/utils/memory_governor.py
+
+from typing import Any, Callable, Dict, Optional
+
+import psutil
+
+from utils.mem_accounting import kv_bytes, trim_heap
+
+OK, SOFT, HARD = 0, 1, 2
+_LEVEL_NAMES = {OK: "ok", SOFT: "soft", HARD: "hard"}
+
+
+class MemoryGovernor:
+    """
+    Reacts to memory pressure before the OOM killer does.
+
+    Pressure is SOFT when process RSS exceeds soft_rss_mb or available
+    system memory drops below min_available_mb, and HARD when RSS exceeds
+    hard_rss_mb or available memory falls under half of min_available_mb.
+
+    check() runs before each turn. Under SOFT pressure it takes the next
+    step down the ladder each turn (wrapping around while pressure lasts);
+    under HARD it takes all of them at once:
+      1. shrink the history token budget (SlidingWindowCache/PagedCache)
+      2. move a ChatSession's float KV into an append-only quantized KV
+         cache (the log record has the float and quantized KV bytes and
+         the RSS right after the move)
+      3. cap max_new_tokens
+    Under HARD pressure new sessions are refused, and should_stop() (polled
+    by the decode loop after each token) ends the current reply early.
+    Once pressure is gone the token cap and history budget are restored.
+
+    Every decision is written to the JSONL logger as {"role": "governor"}.
+    """
+
+    def __init__(
+        self,
+        soft_rss_mb: float,
+        hard_rss_mb: float,
+        min_available_mb: float = 128.0,
+        logger: Optional[Any] = None,
+        min_ctx_tokens: int = 64,
+        min_new_tokens: int = 16,
+        make_kv_cache: Optional[Callable[[], Any]] = None,
+        poll_every: int = 8,
+    ) -> None:
+        self.soft_rss_mb = soft_rss_mb
+        self.hard_rss_mb = hard_rss_mb
+        self.min_available_mb = min_available_mb
+        self.logger = logger
+        self.min_ctx_tokens = min_ctx_tokens
+        self.min_new_tokens = min_new_tokens
+        self.make_kv_cache = make_kv_cache
+        self.poll_every = poll_every
+
+        self.level = OK
+        self.token_cap: Optional[int] = None
+        self._budgets: Dict[int, int] = {}   # id(history) -> original max_tokens
+        self._polls = 0
+        self._next_step = 0
+        self._proc = psutil.Process()
+
+    # --- measuring -------------------------------------------------------------
+
+    def measure(self) -> Dict[str, float]:
+        return {
+            "rss_mb": round(self._proc.memory_info().rss / (1024**2), 2),
+            "available_mb": round(psutil.virtual_memory().available / (1024**2), 2),
+        }
+
+    def pressure(self, m: Dict[str, float]) -> int:
+        if m["rss_mb"] > self.hard_rss_mb or m["available_mb"] < self.min_available_mb / 2:
+            return HARD
+        if m["rss_mb"] > self.soft_rss_mb or m["available_mb"] < self.min_available_mb:
+            return SOFT
+        return OK
+
+    def _log(self, action: str, m: Dict[str, float], **fields: Any) -> None:
+        if self.logger is None:
+            return
+        record = {"role": "governor", "action": action, "level": _LEVEL_NAMES[self.level]}
+        record.update(m)
+        record.update(fields)
+        self.logger.log(record)
+
+    # --- step-down actions -----------------------------------------------------
+
+    def _shrink_history(self, history: Any, m: Dict[str, float]) -> bool:
+        budget = getattr(history, "max_tokens", None)
+        if budget is None or budget <= self.min_ctx_tokens:
+            return False
+        self._budgets.setdefault(id(history), budget)
+        history.max_tokens = max(self.min_ctx_tokens, budget * 3 // 4)
+        self._log("shrink_history", m, old_max_tokens=budget, new_max_tokens=history.max_tokens)
+        return True
+
+    def _quantize_session(self, session: Any, m: Dict[str, float]) -> bool:
+        if session is None or self.make_kv_cache is None:
+            return False
+        float_bytes = kv_bytes(session.past)["allocated"]
+        if not session.use_kv_cache(self.make_kv_cache()):
+            return False
+        trim_heap()
+        # What the step actually freed: float KV before, quantized KV and RSS after
+        after = self.measure()
+        self._log(
+            "quantize_session_kv",
+            m,
+            kv_tokens=session.kv_length(),
+            float_kv_bytes=float_bytes,
+            kv_bytes=session.kv_cache.resident_nbytes(),
+            rss_after_mb=after["rss_mb"],
+            available_after_mb=after["available_mb"],
+        )
+        return True
+
+    def _cap_tokens(self, max_new_tokens: int, m: Dict[str, float]) -> bool:
+        current = self.token_cap if self.token_cap is not None else max_new_tokens
+        if current <= self.min_new_tokens:
+            return False
+        self.token_cap = max(self.min_new_tokens, current // 2)
+        self._log("cap_max_new_tokens", m, old=current, new=self.token_cap)
+        return True
+
+    def _restore(self, history: Any, m: Dict[str, float]) -> None:
+        if self.token_cap is not None:
+            self._log("restore_max_new_tokens", m, old=self.token_cap)
+            self.token_cap = None
+        original = self._budgets.pop(id(history), None) if history is not None else None
+        if original is not None:
+            self._log("restore_history", m, old_max_tokens=history.max_tokens, new_max_tokens=original)
+            history.max_tokens = original
+
+    # --- public API ------------------------------------------------------------
+
+    def check(
+        self, history: Any = None, session: Any = None, max_new_tokens: int = 64
+    ) -> int:
+        """Measure, step down (or recover) as needed; returns the max_new_tokens to use."""
+        m = self.measure()
+        level = self.pressure(m)
+        if level != self.level:
+            self.level = level
+            self._log("level", m)
+
+        if level == OK:
+            # Hysteresis: only recover once well below the soft limit
+            if m["rss_mb"] < 0.8 * self.soft_rss_mb:
+                self._restore(history, m)
+                self._next_step = 0
+        else:
+            steps = [
+                lambda: self._shrink_history(history, m),
+                lambda: self._quantize_session(session, m),
+                lambda: self._cap_tokens(max_new_tokens, m),
+            ]
+            if level == HARD:
+                for step in steps:
+                    step()
+            else:
+                for i in range(len(steps)):
+                    k = (self._next_step + i) % len(steps)
+                    if steps[k]():
+                        self._next_step = k + 1
+                        break
+
+        if self.token_cap is not None:
+            return min(max_new_tokens, self.token_cap)
+        return max_new_tokens
+
+    def should_stop(self) -> bool:
+        """Cheap per-token poll: True under HARD pressure (measured every poll_every calls)."""
+        self._polls += 1
+        if self._polls % self.poll_every:
+            return False
+        m = self.measure()
+        if self.pressure(m) < HARD:
+            return False
+        self.level = HARD
+        self._log("stop_generation", m)
+        return True
+
+    def accept_new_session(self) -> bool:
+        """False under HARD pressure: don't let another conversation in."""
+        m = self.measure()
+        if self.pressure(m) < HARD:
+            return True
+        self.level = HARD
+        self._log("refuse_session", m)
+        return False
@@ -5,14 +5,20 @@ import psutil
 
 _process = psutil.Process()
 _start_time = time.time()
+# cpu_percent(interval=None) reports usage since the previous call, and
+# the first call has no previous one: prime it here
+psutil.cpu_percent(interval=None)
+_process.cpu_percent(interval=None)
 
 
 def snapshot() -> dict:
     mem = _process.memory_info().rss / (1024**2)
-    cpu = psutil.cpu_percent(interval=0.0)
+    cpu = psutil.cpu_percent(interval=None)
+    proc_cpu = _process.cpu_percent(interval=None)
     uptime = time.time() - _start_time
     return {
         "rss_mb": round(mem, 2),
         "cpu_percent": cpu,
+        "proc_cpu_percent": proc_cpu,   # this process, 100 = one full core
         "uptime_s": round(uptime, 2),
     }
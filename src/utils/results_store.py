@@ -0,0 +1,119 @@
+# src/utils/results_store.py
+
+import csv
+import os
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Default store of scripts/sweep.py; the plot scripts read it
+DEFAULT_RESULTS_PATH = "data/sweeps/results.csv"
+
+PI_MACHINES = ("aarch64", "arm")
+
+# Plot order of the cache strategies
+CACHE_TYPES = ["none", "sliding", "paged", "quantized"]
+
+
+def _is_parquet(path: str) -> bool:
+    return path.endswith(".parquet")
+
+
+def _pandas() -> Any:
+    try:
+        import pandas
+    except ImportError as e:
+        raise RuntimeError("Parquet results need pandas + pyarrow (pip install pandas pyarrow); use a .csv path") from e
+    return pandas
+
+
+def _parse(value: str) -> Any:
+    # CSV gives strings back; numbers become int / float again
+    if value == "":
+        return None
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    if value in ("True", "False"):
+        return value == "True"
+    return value
+
+
+def read_results(path: str = DEFAULT_RESULTS_PATH) -> List[Dict[str, Any]]:
+    """All rows of a results store (CSV or Parquet), as dicts; [] if it does not exist."""
+    if not os.path.exists(path):
+        return []
+    if _is_parquet(path):
+        df = _pandas().read_parquet(path)
+        return [{k: (None if v != v else v) for k, v in row.items()} for row in df.to_dict("records")]
+    with open(path, newline="", encoding="utf-8") as f:
+        return [{k: _parse(v) for k, v in row.items()} for row in csv.DictReader(f)]
+
+
+def append_results(path: str, rows: Sequence[Dict[str, Any]]) -> None:
+    """
+    Add rows to the store. CSV is appended in place unless the rows bring
+    new columns (then the file is rewritten with the union); Parquet is
+    always rewritten.
+    """
+    if not rows:
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    existing = read_results(path) if os.path.exists(path) else []
+    columns: List[str] = list(existing[0].keys()) if existing else []
+    for row in rows:
+        columns += [k for k in row if k not in columns]
+
+    if _is_parquet(path):
+        pd = _pandas()
+        pd.DataFrame(existing + list(rows), columns=columns).to_parquet(path + ".tmp", index=False)
+        os.replace(path + ".tmp", path)
+        return
+
+    rewrite = not existing or len(columns) != len(existing[0])
+    with open(path, "w" if rewrite else "a", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        if rewrite:
+            writer.writeheader()
+            writer.writerows(existing)
+        writer.writerows(rows)
+
+
+def select(rows: Iterable[Dict[str, Any]], **equal: Any) -> List[Dict[str, Any]]:
+    """Rows whose columns equal the given values (None = any value)."""
+    return [r for r in rows if all(v is None or r.get(k) == v for k, v in equal.items())]
+
+
+def mean_by(rows: Iterable[Dict[str, Any]], keys: Sequence[str], value: str) -> Dict[Tuple[Any, ...], float]:
+    """Mean of column `value` over repetitions, grouped by `keys`."""
+    groups: Dict[Tuple[Any, ...], List[float]] = {}
+    for r in rows:
+        if r.get(value) is not None:
+            groups.setdefault(tuple(r.get(k) for k in keys), []).append(float(r[value]))
+    return {k: sum(v) / len(v) for k, v in groups.items()}
+
+
+def by_cache(rows: Iterable[Dict[str, Any]], value: str) -> Tuple[List[str], List[float]]:
+    """(cache types, mean of `value`) in CACHE_TYPES order, for bar charts."""
+    means = mean_by(rows, ["cache"], value)
+    caches = [c for c in CACHE_TYPES if (c,) in means] + sorted(k[0] for k in means if k[0] not in CACHE_TYPES)
+    return caches, [means[(c,)] for c in caches]
+
+
+def pick_host(rows: Sequence[Dict[str, Any]], pi: bool, host: Optional[str] = None) -> Optional[str]:
+    """
+    The host to plot: `host` if given, else the most recently measured
+    Raspberry Pi (ARM) host when pi=True, or non-ARM host when pi=False.
+    """
+    if host:
+        return host
+    for r in reversed(rows):
+        if str(r.get("machine", "")).startswith(PI_MACHINES) == pi:
+            return r.get("host")
+    return None
+
+
+def longest(rows: Iterable[Dict[str, Any]], column: str) -> Optional[int]:
+    """Largest value of a length column; None if no row records it (then any length matches)."""
+    values = [r[column] for r in rows if r.get(column) is not None]
+    return max(values) if values else None
@@ -0,0 +1,118 @@
+# src/utils/tracing.py
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional, Tuple
+
+_NULL = nullcontext()
+
+
+def no_span(name: str) -> ContextManager[None]:
+    """Stand-in for PhaseTracer.span when tracing is off: a shared no-op context."""
+    return _NULL
+
+
+def span_fn(tracer: Optional["PhaseTracer"]) -> Callable[[str], ContextManager[None]]:
+    """The decode loops bind this once per call: `with span("forward"): ...`."""
+    return tracer.span if tracer is not None else no_span
+
+
+class PhaseTracer:
+    """
+    Wall-clock timers around the phases of a reply, for finding where the
+    tokens/sec go: prefill, forward (decode step), kv_store / kv_get
+    (quantize / dequantize), sample, stop (EOS / stop-string checks) and
+    detokenize. The decode loops wrap each phase in span(name); with no
+    tracer they use no_span, so the disabled cost is a function call.
+
+    begin() / end() bracket one request: end() returns per-phase totals
+    (for the JSONL record) and, with trace_dir, writes a Chrome trace /
+    Perfetto JSON file for the request. torch_profile=True also runs
+    torch.profiler over the request; the phases then show up as
+    record_function ranges above the aten ops in the exported trace.
+    """
+
+    def __init__(self, trace_dir: Optional[str] = None, torch_profile: bool = False) -> None:
+        self.trace_dir = trace_dir
+        self.torch_profile = torch_profile
+        self.request_id: Optional[str] = None
+        self.totals: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self._events: List[Tuple[str, float, float, int]] = []
+        self._prof: Any = None
+        self._record_function: Any = None
+        self._t0 = time.perf_counter()
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        rf = self._record_function(name) if self._record_function is not None else None
+        if rf is not None:
+            rf.__enter__()
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            d = time.perf_counter() - t
+            if rf is not None:
+                rf.__exit__(None, None, None)
+            self.totals[name] = self.totals.get(name, 0.0) + d
+            self.counts[name] = self.counts.get(name, 0) + 1
+            self._events.append((name, t, d, threading.get_ident()))
+
+    def begin(self, request_id: Optional[str] = None) -> None:
+        """Start a request: clear the timers (and start torch.profiler if enabled)."""
+        self.request_id = request_id or time.strftime("%Y%m%d-%H%M%S")
+        self.totals, self.counts, self._events = {}, {}, []
+        self._t0 = time.perf_counter()
+        if self.torch_profile:
+            from torch.profiler import ProfilerActivity, profile, record_function
+
+            self._prof = profile(activities=[ProfilerActivity.CPU])
+            self._prof.__enter__()
+            self._record_function = record_function
+
+    def end(self) -> Dict[str, Any]:
+        """Finish the request; per-phase totals (+ trace file path, if written)."""
+        wall = time.perf_counter() - self._t0
+        path = None
+        if self._prof is not None:
+            self._prof.__exit__(None, None, None)
+        if self.trace_dir:
+            os.makedirs(self.trace_dir, exist_ok=True)
+            path = os.path.join(self.trace_dir, f"trace-{self.request_id}.json")
+            if self._prof is not None:
+                self._prof.export_chrome_trace(path)
+            else:
+                self.export_chrome(path)
+        self._prof = self._record_function = None
+
+        result: Dict[str, Any] = {
+            "phases_s": {k: round(v, 6) for k, v in self.totals.items()},
+            "phase_counts": dict(self.counts),
+            # Time in none of the phases: caller / streaming / Python glue
+            "untraced_s": round(max(wall - sum(self.totals.values()), 0.0), 6),
+        }
+        if path is not None:
+            result["trace_file"] = path
+        return result
+
+    def export_chrome(self, path: str) -> None:
+        """Chrome trace event format (chrome://tracing, ui.perfetto.dev)."""
+        pid = os.getpid()
+        events = [
+            {
+                "name": name,
+                "cat": "phase",
+                "ph": "X",
+                "ts": round((t - self._t0) * 1e6, 3),
+                "dur": round(d * 1e6, 3),
+                "pid": pid,
+                "tid": tid,
+            }
+            for name, t, d, tid in self._events
+        ]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms", "request_id": self.request_id}, f)
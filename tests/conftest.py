@@ -0,0 +1,26 @@
+# tests/conftest.py
+#
+# Unit tests import the modules the way the apps do ("inference.x", "kv_cache.x", "utils.x");
+# scripts/ is on the path for the tiny random model of bench_suite.py
+
+import os, sys
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "src"))
+sys.path.append(os.path.join(ROOT, "scripts"))
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def tiny_model_dir(tmp_path_factory):
+    """Seeded 2-layer random GPT-2 + BPE tokenizer (bench_suite --model_name tiny-random), no download."""
+    from bench_suite import build_tiny_gpt2
+
+    return build_tiny_gpt2(str(tmp_path_factory.mktemp("tiny-gpt2")), seed=0)
+
+
+@pytest.fixture(scope="session")
+def tiny_backend(tiny_model_dir):
+    from inference.transformers_backend import HFBackend
+
+    return HFBackend(model_name=tiny_model_dir, max_ctx=256)
@@ -4,3 +4,12 @@ set -e
 hello
 /quit
 EOF
+
+# Unit tests (pip install pytest)
+python -m pytest -q tests
+
+# Benchmark harness end to end on a seeded random model (no download)
+out=$(mktemp -d)
+python scripts/bench_suite.py --model_name tiny-random --contexts 64 --runs 1 --warmup 1 \
+    --max_new_tokens 8 --out "$out/bench.json"
+rm -rf "$out"
@@ -0,0 +1,95 @@
+# tests/test_batch_scheduler.py
+
+import asyncio
+
+import pytest
+import torch
+
+from inference.batch_scheduler import BatchScheduler
+from inference.stopping import StopCriteria
+
+PROMPTS = [
+    "User: hello there\nAssistant:",
+    "User: why?\nAssistant:",
+    "User: tell me a long story about a cache that forgot everything\nAssistant:",
+]
+
+
+def greedy(backend, ids, n, stop=None):
+    out, _ = backend.generate_ids(torch.tensor([ids]), max_new_tokens=n, temperature=0.0, stop=stop)
+    return out[: stop.keep] if stop is not None else out
+
+
+def test_batched_greedy_equals_sequential(tiny_backend):
+    prompts = [tiny_backend.encode(p) for p in PROMPTS]
+    lengths = [12, 5, 9]
+    expected = [greedy(tiny_backend, ids, n) for ids, n in zip(prompts, lengths)]
+
+    scheduler = BatchScheduler(tiny_backend, max_batch=3)
+    done = []
+    reqs = []
+    # Staggered arrivals: rows join and leave mid-flight, with left padding
+    for ids, n in zip(prompts, lengths):
+        reqs.append(scheduler.submit(ids, max_new_tokens=n, temperature=0.0, on_done=done.append))
+        scheduler.step()
+        scheduler.step()
+    scheduler.run()
+
+    assert [r.generated for r in reqs] == expected
+    assert sorted(map(id, done)) == sorted(map(id, reqs))
+    assert scheduler.tokens_out == sum(lengths)
+    assert scheduler.past is None and not scheduler.active
+
+
+def test_batched_rows_stop_on_their_own_criteria(tiny_backend):
+    prompts = [tiny_backend.encode(p) for p in PROMPTS[:2]]
+    # The first row's 4th token acts as EOS
+    first = greedy(tiny_backend, prompts[0], 8)
+    eos = first[3]
+
+    def stop():
+        return StopCriteria(tiny_backend.tokenizer, eos_ids=[eos])
+
+    expected = [greedy(tiny_backend, ids, 8, stop()) for ids in prompts]
+
+    scheduler = BatchScheduler(tiny_backend, max_batch=2)
+    reqs = [
+        scheduler.submit(
+            ids,
+            max_new_tokens=8,
+            temperature=0.0,
+            stop=stop(),
+        )
+        for ids in prompts
+    ]
+    scheduler.run()
+    assert [r.generated for r in reqs] == expected
+    assert reqs[0].generated == first[: first.index(eos)]
+
+
+def test_web_worker_batches_sessions(tiny_backend, monkeypatch, tmp_path):
+    pytest.importorskip("fastapi")
+    import app_web
+    from config import settings
+
+    monkeypatch.setattr(settings, "backend", "hf")
+    monkeypatch.setattr(settings, "web_batch", 4)
+    monkeypatch.setattr(settings, "max_new_tokens", 6)
+    monkeypatch.setattr(settings, "log_dir", str(tmp_path))
+
+    async def chat():
+        worker = app_web.InferenceWorker(tiny_backend, queue_size=8, max_sessions=8)
+        task = asyncio.create_task(worker.run_forever())
+        try:
+            jobs = [("a", "hello"), ("b", "how are you"), ("a", "and again")]
+            return worker, await asyncio.gather(*(worker.submit(s, t) for s, t in jobs))
+        finally:
+            task.cancel()
+            worker.logger.close()
+
+    worker, results = asyncio.run(chat())
+    assert worker.batcher is not None and worker.sessions["a"].chat is None
+    assert len(results) == 3 and all("latency_s" in r for r in results)
+    # A session's second message waited for its first reply
+    assert [u for u, _ in worker.sessions["a"].history.turns] == ["hello", "and again"]
+    assert not worker.in_flight and not worker.deferred
@@ -0,0 +1,103 @@
+# tests/test_chat_session.py
+
+import torch
+
+from inference.chat_session import ChatSession
+from inference.stopping import StopCriteria
+from kv_cache.sliding_window import SlidingWindowCache
+
+MESSAGES = ["hello there", "how are you today?", "tell me more", "and then?", "ok bye"]
+
+
+def prefill_from_scratch(session, generated, max_new_tokens, stop=None):
+    """
+    Greedy reply to the kept turns prefilled in one go: same ids, and the
+    same absolute positions as the reused KV (kept turns are contiguous).
+    """
+    flat = [t for ids in session.turn_ids for t in ids]
+    prompt = flat[: len(flat) - len(generated)]
+    held = session.kv_length() - len(session.unfed)
+    start = session.pos - held
+    out, _ = session.backend.generate_ids(
+        torch.tensor([prompt]),
+        max_new_tokens=max_new_tokens,
+        temperature=0.0,
+        position_offset=start if start else None,
+        stop=stop,
+    )
+    return out[: stop.keep] if stop is not None else out, prompt
+
+
+def reply_ids(session, text):
+    """Generated ids of the last turn: its KV ids minus separator and "User: ..." body."""
+    body = session.backend.encode(f"User: {text}\nAssistant:")
+    return session.turn_ids[-1][session.sep_lens[-1] + len(body) :]
+
+
+def test_reused_kv_matches_full_prefill(tiny_backend):
+    session = ChatSession(tiny_backend, SlidingWindowCache(max_tokens=1000))
+    for i, text in enumerate(MESSAGES):
+        session.reply(text, max_new_tokens=6, temperature=0.0)
+        generated = reply_ids(session, text)
+        expected, prompt = prefill_from_scratch(session, generated, 6)
+        assert generated == expected
+        assert session.pos == len(prompt) + len(generated)
+        if i:
+            # Only the new turn was prefilled, not the whole conversation
+            assert session.last_prefill_tokens < len(prompt)
+
+
+def test_trimmed_turns_keep_their_positions(tiny_backend):
+    history = SlidingWindowCache(max_tokens=48)
+    session = ChatSession(tiny_backend, history)
+    trimmed = False
+    for text in MESSAGES:
+        before = len(session.turn_ids)
+        session.reply(text, max_new_tokens=6, temperature=0.0)
+        trimmed |= len(session.turn_ids) <= before
+        generated = reply_ids(session, text)
+        expected, prompt = prefill_from_scratch(session, generated, 6)
+        assert generated == expected
+        assert len(prompt) <= 48
+        # The text history keeps exactly the turns held in the KV
+        assert len(history.turns) == len(session.turn_ids)
+    assert trimmed
+    assert session.pos > session.kv_length()
+
+
+def test_past_max_positions_reprefills_from_zero(tiny_backend):
+    session = ChatSession(tiny_backend, SlidingWindowCache(max_tokens=48))
+    session.max_positions = 64
+    reset = False
+    for text in MESSAGES:
+        pos_before = session.pos
+        session.reply(text, max_new_tokens=6, temperature=0.0)
+        generated = reply_ids(session, text)
+        expected, prompt = prefill_from_scratch(session, generated, 6)
+        assert generated == expected
+        assert session.pos <= 64
+        if session.pos < pos_before:
+            reset = True
+            # Kept turns and the new one went through the model again, from 0
+            assert session.last_prefill_tokens == len(prompt)
+            assert session.pos == len(prompt) + len(generated)
+    assert reset
+
+
+def test_stopped_reply_lines_up_the_kv(tiny_backend):
+    first = ChatSession(tiny_backend, SlidingWindowCache(max_tokens=1000))
+    first.reply(MESSAGES[0], max_new_tokens=6, temperature=0.0)
+    eos = reply_ids(first, MESSAGES[0])[2]   # stop after two tokens
+
+    session = ChatSession(tiny_backend, SlidingWindowCache(max_tokens=1000))
+    stop = StopCriteria(tiny_backend.tokenizer, eos_ids=[eos])
+    for text in MESSAGES[:3]:
+        session.reply(text, max_new_tokens=6, temperature=0.0, stop=stop)
+        generated = reply_ids(session, text)
+        expected, _ = prefill_from_scratch(
+            session, generated, 6, StopCriteria(tiny_backend.tokenizer, eos_ids=[eos])
+        )
+        assert generated == expected
+        assert len(generated) < 6
+        # KV holds the kept ids, or all but the unfed tail
+        assert session.past.get_seq_length() == session.kv_length() - len(session.unfed)
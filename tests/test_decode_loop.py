@@ -0,0 +1,52 @@
+# tests/test_decode_loop.py
+
+import pytest
+
+from inference.hf_backend_pi import HFBackendPi
+from inference.sampler import Sampler
+from kv_cache.quantized_cache import QuantizedKVCache
+
+PROMPT = "User: hello there\nAssistant:"
+
+
+@pytest.fixture(scope="module")
+def pi_backend(tiny_model_dir):
+    return HFBackendPi(model_name=tiny_model_dir, max_ctx=256)
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {},
+        {"kv_cache": "requant"},
+        {"kv_cache": "append_only"},
+        {"sampler": True},
+    ],
+)
+def test_both_backends_decode_the_same(tiny_backend, pi_backend, kwargs):
+    def run(backend):
+        kw = dict(kwargs)
+        if kw.get("kv_cache") == "requant":
+            kw["kv_cache"] = QuantizedKVCache()
+        elif kw.get("kv_cache") == "append_only":
+            kw["kv_cache"] = QuantizedKVCache(append_only=True, block_size=4)
+        if kw.pop("sampler", False):
+            kw["sampler"] = Sampler(temperature=0.0, repetition_penalty=1.3)
+        return backend.generate(PROMPT, max_new_tokens=16, temperature=0.0, **kw)
+
+    assert run(tiny_backend) == run(pi_backend)
+
+
+def test_static_buffer_is_reused_and_grown(pi_backend):
+    plain = pi_backend.generate(PROMPT, max_new_tokens=8, temperature=0.0)
+    pi_backend.static_cache = True
+    try:
+        assert pi_backend.generate(PROMPT, max_new_tokens=8, temperature=0.0) == plain
+        buf = pi_backend.static_kv
+        pi_backend.generate(PROMPT, max_new_tokens=4, temperature=0.0)
+        assert pi_backend.static_kv is buf
+        pi_backend.generate(PROMPT, max_new_tokens=16, temperature=0.0)
+        assert pi_backend.static_kv is not buf
+        assert pi_backend.static_kv.max_ctx == pi_backend.max_ctx + 16
+    finally:
+        pi_backend.static_cache = False
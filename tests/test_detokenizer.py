@@ -0,0 +1,59 @@
+# tests/test_detokenizer.py
+
+from inference.detokenizer import IncrementalDetokenizer
+
+
+class ByteTokenizer:
+    """Each id decodes to a fixed byte string, like byte-level BPE tokens."""
+
+    def __init__(self, pieces):
+        self.pieces = pieces
+        self.longest = 0
+
+    def decode(self, ids, skip_special_tokens=True):
+        self.longest = max(self.longest, len(ids))
+        return b"".join(self.pieces[i] for i in ids).decode("utf-8", errors="replace")
+
+
+def stream(detok, ids):
+    deltas = [detok.add(i) for i in ids]
+    return deltas, detok.flush()
+
+
+def test_multibyte_characters_from_the_model_tokenizer(tiny_backend):
+    text = "héllo wörld € 🙂 ok"
+    ids = tiny_backend.encode(text)
+    detok = IncrementalDetokenizer(tiny_backend.tokenizer)
+    deltas, rest = stream(detok, ids)
+    assert "".join(deltas) + rest == text
+    assert not any("�" in d for d in deltas)
+    # Split characters come out whole, in one delta
+    assert any("€" in d for d in deltas) and any("🙂" in d for d in deltas)
+
+
+def test_tokens_that_merge_across_a_character_boundary():
+    euro = "€".encode()   # 3 bytes
+    tok = ByteTokenizer([b"a" + euro[:1], euro[1:2], euro[2:] + b"b", b" c"])
+    deltas, rest = stream(IncrementalDetokenizer(tok), [0, 1, 2, 3])
+    # "a" waits with the first byte of "€", which needs two more tokens
+    assert deltas == ["", "", "a€b", " c"]
+    assert rest == ""
+
+
+def test_invalid_bytes_are_not_held_forever():
+    tok = ByteTokenizer([b"\xff", b"x"])
+    detok = IncrementalDetokenizer(tok)
+    deltas = [detok.add(0) for _ in range(IncrementalDetokenizer.MAX_PENDING)]
+    assert deltas[:-1] == [""] * (IncrementalDetokenizer.MAX_PENDING - 1)
+    assert deltas[-1] == "�" * IncrementalDetokenizer.MAX_PENDING
+    detok.add(0)
+    assert detok.flush() == "�"
+    assert detok.flush() == ""
+
+
+def test_decode_window_stays_short():
+    tok = ByteTokenizer([b"ab", b" c", "é".encode()])
+    detok = IncrementalDetokenizer(tok)
+    out = "".join(detok.add(i % 3) for i in range(300)) + detok.flush()
+    assert out == ("ab cé" * 100)
+    assert tok.longest <= 3
@@ -0,0 +1,52 @@
+# tests/test_graph_decode.py
+
+import pytest
+import torch
+from transformers import GPT2Config, GPT2LMHeadModel
+
+from inference import graph_decode
+from inference.graph_decode import CapturedDecodeStep
+from inference.transformers_backend import HFBackend
+from kv_cache.static_cache import StaticKVBuffer
+
+
+def greedy(backend, text, n=16):
+    input_ids, mask, past_kv = backend.prepare(text, n, None)
+    ids, _ = backend.generate_ids(input_ids, max_new_tokens=n, temperature=0.0, past_kv=past_kv, attention_mask=mask)
+    return ids
+
+
+def tiny_gpt2(**options):
+    torch.manual_seed(0)
+    config = GPT2Config(vocab_size=64, n_positions=64, n_embd=32, n_layer=2, n_head=2, **options)
+    return GPT2LMHeadModel(config).eval()
+
+
+def test_captured_decode_matches_eager(tiny_model_dir, tiny_backend):
+    backend = HFBackend(model_name=tiny_model_dir, max_ctx=256, graph_decode=True)
+    text = "User: hello there\nAssistant:"
+    assert greedy(backend, text) == greedy(tiny_backend, text)
+    assert backend.graph_error is None and backend.graph_step is not None
+
+
+@pytest.mark.parametrize("option", [
+    {"scale_attn_by_inverse_layer_idx": True},
+    {"reorder_and_upcast_attn": True},
+    {"scale_attn_weights": False},
+])
+def test_unsupported_gpt2_options_are_refused(option):
+    model = tiny_gpt2(**option)
+    with pytest.raises(ValueError):
+        CapturedDecodeStep(model, StaticKVBuffer.for_model(model, 32), min_window=8)
+
+
+def test_mismatch_with_the_model_disables_capture(monkeypatch):
+    model = tiny_gpt2()
+    step = CapturedDecodeStep(model, StaticKVBuffer.for_model(model, 32), min_window=8)
+    assert step.captured
+
+    forward = graph_decode._GPT2Step.forward
+    monkeypatch.setattr(graph_decode._GPT2Step, "forward", lambda self, *a: forward(self, *a) + 1.0)
+    step = CapturedDecodeStep(model, StaticKVBuffer.for_model(model, 32), min_window=8)
+    assert not step.captured
+    assert "does not match the model" in step.error
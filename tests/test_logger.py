@@ -0,0 +1,62 @@
+# tests/test_logger.py
+
+import glob
+import gzip
+import json
+import os
+import queue
+
+from utils.logger import JsonlLogger
+
+
+def read_segments(log_dir, name):
+    records = []
+    for path in sorted(glob.glob(os.path.join(log_dir, f"{name}-*")), key=os.path.getmtime):
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            records += [json.loads(line) for line in f]
+    return records
+
+
+def log_batches(logger, batches, per_batch=20):
+    for b in range(batches):
+        for i in range(per_batch):
+            logger.log({"batch": b, "i": i, "pad": "x" * 100})
+        logger.flush()
+
+
+def test_rotates_and_compresses_without_losing_records(tmp_path):
+    log_dir = str(tmp_path)
+    logger = JsonlLogger(log_dir, name="t", max_mb=0.002, compress="gzip", max_total_mb=0)
+    log_batches(logger, 10)
+    logger.close()
+    assert len(glob.glob(os.path.join(log_dir, "t-*.jsonl.gz"))) >= 5
+    records = read_segments(log_dir, "t")
+    assert [(r["batch"], r["i"]) for r in records] == [(b, i) for b in range(10) for i in range(20)]
+
+
+def test_budget_deletes_oldest_closed_segments_only(tmp_path):
+    log_dir = str(tmp_path)
+    # Plain .jsonl of another process / a kept log: never part of the budget
+    other = os.path.join(log_dir, "t-19990101-000000.jsonl")
+    with open(other, "w", encoding="utf-8") as f:
+        f.write("{}\n" * 10000)
+    logger = JsonlLogger(log_dir, name="t", max_mb=0.002, compress="none", max_total_mb=0.005)
+    log_batches(logger, 20)
+    logger.close()
+    assert os.path.exists(other)
+    closed = [p for p in glob.glob(os.path.join(log_dir, "t-*.jsonl")) if p != other]
+    assert 0 < sum(os.path.getsize(p) for p in closed) <= 0.005 * 1024**2
+    assert read_segments(log_dir, "t")[-1]["batch"] == 19   # the newest records survive
+
+
+def test_full_queue_drops_and_flush_returns(tmp_path):
+    logger = JsonlLogger(str(tmp_path), name="t", flush_interval_s=60)
+    # The writer waits on its queue; give the callers a full one of their own
+    writer_queue, logger._queue = logger._queue, queue.Queue(maxsize=1)
+    logger._queue.put({"i": 0})
+    logger.log({"i": 1})
+    assert logger.dropped == 1
+    logger.flush(timeout=0.01)   # must not raise queue.Full
+    logger._queue = writer_queue
+    logger.close()
@@ -0,0 +1,35 @@
+# tests/test_ngram_index.py
+
+import pytest
+
+from inference.speculative import NgramIndex
+
+
+def test_proposes_what_followed_the_suffix():
+    index = NgramIndex(max_n=3)
+    index.extend([1, 2, 3, 4, 5, 9, 1, 2, 3])
+    assert index.propose(2) == [4, 5]
+
+
+def test_longest_ngram_wins_and_latest_occurrence():
+    index = NgramIndex(max_n=2)
+    # [7] was last followed by 3, but the 2-gram [6, 7] was followed by 4
+    index.extend([6, 7, 4, 8, 7, 3, 6, 7])
+    assert index.propose(1) == [4]
+    index = NgramIndex(max_n=1)
+    index.extend([7, 1, 7, 2, 7])
+    assert index.propose(1) == [2]
+
+
+def test_no_match_or_no_budget():
+    index = NgramIndex(max_n=3, min_n=2)
+    index.extend([1, 2, 3])
+    assert index.propose(4) == []
+    index.extend([1, 2])
+    assert index.propose(0) == []
+    assert index.propose(10) == [3, 1, 2]   # capped by what follows
+
+
+def test_rejects_bad_orders():
+    with pytest.raises(ValueError):
+        NgramIndex(max_n=1, min_n=2)
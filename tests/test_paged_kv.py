@@ -0,0 +1,125 @@
+# tests/test_paged_kv.py
+
+import pytest
+import torch
+
+from kv_cache.paged_kv import KVBlockPool
+
+
+def make_pool(num_blocks=4):
+    return KVBlockPool(num_layers=2, num_heads=2, head_dim=4, num_blocks=num_blocks, block_size=4)
+
+
+def test_allocate_hands_out_low_ids_first():
+    pool = make_pool()
+    assert [pool.allocate() for _ in range(3)] == [0, 1, 2]
+    assert pool.num_free == 1
+    assert pool.ref_counts[:3] == [1, 1, 1]
+
+
+def test_decref_returns_block_to_free_list():
+    pool = make_pool()
+    a, b = pool.allocate(), pool.allocate()
+    pool.decref(a)
+    assert pool.ref_counts[a] == 0
+    assert pool.num_free == 3
+    assert pool.allocate() == a   # freed block is reused first
+    assert pool.ref_counts[b] == 1
+
+
+def test_exhausted_pool_raises():
+    pool = make_pool(num_blocks=2)
+    pool.allocate()
+    pool.allocate()
+    with pytest.raises(RuntimeError):
+        pool.allocate()
+
+
+def test_sequence_frees_blocks_on_trim_and_release():
+    pool = make_pool()
+    seq = pool.new_sequence()
+    assert seq.blocks_needed(9) == 3
+    k = torch.arange(2 * 9 * 4, dtype=torch.float32).reshape(1, 2, 9, 4)
+    for layer in range(2):
+        seq.write(layer, k, -k)
+    assert pool.num_free == 1
+    gk, gv = seq.gather(0)
+    assert torch.equal(gk, k) and torch.equal(gv, -k)
+
+    seq.trim_front(5)   # the first block is now entirely dead
+    assert pool.num_free == 2
+    assert torch.equal(seq.gather(1)[0], k[:, :, 5:])
+
+    seq.release()
+    assert pool.num_free == 4
+    assert pool.ref_counts == [0, 0, 0, 0]
+
+
+def filled_sequence(pool, n):
+    seq = pool.new_sequence()
+    k = torch.randn(1, 2, n, 4)
+    for layer in range(2):
+        seq.write(layer, k, -k)
+    return seq, k
+
+
+def test_shared_block_is_freed_after_its_last_owner():
+    pool = make_pool()
+    seq, k = filled_sequence(pool, 6)   # blocks 0, 1
+    fork = seq.fork()
+    assert pool.ref_counts[:2] == [2, 2]
+    assert pool.num_free == 2
+
+    seq.release()
+    assert pool.ref_counts[:2] == [1, 1]
+    assert pool.num_free == 2   # the fork still owns both blocks
+    assert torch.equal(fork.gather(0)[0], k)
+
+    fork.release()
+    assert pool.num_free == 4
+    assert pool.ref_counts == [0, 0, 0, 0]
+
+
+def test_write_into_shared_block_copies_it():
+    pool = make_pool()
+    seq, k = filled_sequence(pool, 6)
+    fork = seq.fork()
+    assert fork.blocks_needed(1) == 1   # the shared partial block is copied
+
+    new = torch.full((1, 2, 1, 4), 7.0)
+    for layer in range(2):
+        fork.write(layer, new, new)
+    # The full first block stays shared; the partial second one was copied
+    assert fork.block_ids[0] == seq.block_ids[0]
+    assert fork.block_ids[1] != seq.block_ids[1]
+    assert pool.ref_counts[seq.block_ids[0]] == 2
+    assert pool.ref_counts[seq.block_ids[1]] == 1
+
+    assert torch.equal(seq.gather(1)[0], k)
+    assert torch.equal(fork.gather(1)[0], torch.cat([k, new], dim=2))
+    seq.release()
+    fork.release()
+    assert pool.num_free == 4
+
+
+def test_forked_chat_session_shares_and_returns_blocks(tiny_backend):
+    from inference.chat_session import ChatSession
+    from kv_cache.paged_cache import PagedCache
+
+    pool = KVBlockPool.for_model(tiny_backend.model, num_blocks=32, block_size=8)
+    base = ChatSession(tiny_backend, PagedCache(max_tokens=200, kv_pool=pool))
+    base.reply("hello there", max_new_tokens=5, temperature=0.0)
+    used = pool.num_blocks - pool.num_free
+
+    fork = base.fork()
+    assert pool.num_blocks - pool.num_free == used   # nothing copied yet
+    forked = fork.reply("what now?", max_new_tokens=6, temperature=0.0)
+    assert fork.seq.block_ids[0] == base.seq.block_ids[0]
+    # The base KV is untouched by the fork's turn: same reply as the fork got
+    assert base.reply("what now?", max_new_tokens=6, temperature=0.0) == forked
+    assert len(base.history.turns) == len(fork.history.turns) == 2
+
+    base.reset()
+    assert pool.num_free < pool.num_blocks   # the fork still holds the prefix
+    fork.reset()
+    assert pool.num_free == pool.num_blocks
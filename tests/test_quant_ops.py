@@ -0,0 +1,27 @@
+# tests/test_quant_ops.py
+
+import torch
+
+from kv_cache.quant_ops import dequantize_asym, pack_int4, quantize_asym, unpack_int4
+
+
+def test_pack_int4_two_values_per_byte():
+    q = torch.tensor([[1, 2, 15, 0]], dtype=torch.uint8)
+    p = pack_int4(q)
+    assert p.shape == (1, 2)
+    # even index in the low nibble, odd index in the high nibble
+    assert p.tolist() == [[0x21, 0x0F]]
+
+
+def test_pack_unpack_round_trip():
+    q = torch.randint(0, 16, (3, 5, 8), dtype=torch.uint8, generator=torch.Generator().manual_seed(0))
+    assert torch.equal(unpack_int4(pack_int4(q)), q)
+
+
+def test_quantize_asym_error_within_half_a_step():
+    x = torch.randn(4, 16, generator=torch.Generator().manual_seed(0))
+    for bits in (4, 8):
+        q, scale, zero = quantize_asym(x, dim=-1, bits=bits)
+        assert int(q.max()) <= (1 << bits) - 1
+        err = (dequantize_asym(q, scale, zero) - x).abs()
+        assert bool((err <= scale.float() / 2 + 1e-3).all())
@@ -0,0 +1,109 @@
+# tests/test_quantized_cache.py
+
+import pytest
+import torch
+
+from kv_cache.quantized_cache import QuantizedKVCache
+
+
+def make_layers(n, num_layers=2, seed=0, dim=8):
+    g = torch.Generator().manual_seed(seed)
+    return [
+        (torch.randn(1, 2, n, dim, generator=g), torch.randn(1, 2, n, dim, generator=g))
+        for _ in range(num_layers)
+    ]
+
+
+def max_err(a, b):
+    return max((x - y).abs().max().item() for (x, _), (y, _) in zip(a, b))
+
+
+def test_append_only_round_trip_is_within_one_quantization_step():
+    full = make_layers(21)
+    cache = QuantizedKVCache(append_only=True, block_size=4)
+    # Growing past, as the decode loop stores it: prompt, then one token at a time
+    for end in [9] + list(range(10, 22)):
+        cache.store([(k[:, :, :end], v[:, :, :end]) for k, v in full])
+    assert cache.seq_length() == 21
+
+    got = cache.get()
+    for (k, v), (gk, gv) in zip(full, got):
+        assert gk.shape == k.shape
+        # One scale per 4-position block: error is at most half a step
+        for t, g in ((k, gk), (v, gv)):
+            for s in range(0, 20, 4):
+                step = t[:, :, s : s + 4].abs().max() / 127
+                assert (t[:, :, s : s + 4] - g[:, :, s : s + 4]).abs().max() <= step / 2 + 1e-6
+        # The incomplete last block waits in float
+        assert torch.equal(gk[:, :, 20:], k[:, :, 20:])
+
+
+def test_incremental_store_matches_one_shot_store():
+    full = make_layers(13)
+    step = QuantizedKVCache(append_only=True, block_size=4)
+    for end in range(1, 14):
+        step.store([(k[:, :, :end], v[:, :, :end]) for k, v in full])
+    once = QuantizedKVCache(append_only=True, block_size=4)
+    once.store(full)
+    for (a, b), (c, d) in zip(step.get(), once.get()):
+        assert torch.equal(a, c) and torch.equal(b, d)
+
+
+@pytest.mark.parametrize("kwargs", [{"append_only": True, "block_size": 4}, {}])
+def test_trim_keeps_the_right_positions(kwargs):
+    full = make_layers(16)
+    cache = QuantizedKVCache(**kwargs)
+    cache.store(full)
+    before = cache.get()
+
+    cache.trim_front(5)
+    assert cache.seq_length() == 11
+    assert max_err(cache.get(), [(k[:, :, 5:], v[:, :, 5:]) for k, v in before]) < 0.05
+
+    cache.trim_back(3)
+    assert cache.seq_length() == 8
+    assert max_err(cache.get(), [(k[:, :, 5:13], v[:, :, 5:13]) for k, v in before]) < 0.05
+
+    cache.trim_back(8)
+    assert cache.seq_length() == 0 and cache.get() is None
+
+
+def test_shorter_store_starts_a_new_sequence():
+    cache = QuantizedKVCache(append_only=True, block_size=4)
+    cache.store(make_layers(10))
+    cache.store(make_layers(3, seed=1))
+    assert cache.seq_length() == 3
+
+
+def test_group_scheme_int4_round_trip():
+    full = make_layers(64, dim=32)
+    cache = QuantizedKVCache(scheme="group", bits=4, group_size=32)
+    assert cache.append_only
+    cache.store(full)
+    got = cache.get()
+    # 16 levels per group: coarse, but well below the data's spread
+    assert max_err(got, full) < 0.5
+    # Packed codes plus per-group scales: well under 1 byte per value
+    assert cache.nbytes() < 0.75 * sum(k.numel() + v.numel() for k, v in full)
+
+
+def test_state_dict_round_trip():
+    cache = QuantizedKVCache(append_only=True, block_size=4)
+    cache.store(make_layers(11))
+    restored = QuantizedKVCache(append_only=True, block_size=4)
+    restored.load_state_dict(cache.state_dict())
+    for (a, b), (c, d) in zip(cache.get(), restored.get()):
+        assert torch.equal(a, c) and torch.equal(b, d)
+    with pytest.raises(ValueError):
+        QuantizedKVCache(scheme="group", bits=4).load_state_dict(cache.state_dict())
+
+
+def test_model_writes_through_as_cache(tiny_backend):
+    cache = QuantizedKVCache(append_only=True, block_size=4)
+    ids = torch.tensor([tiny_backend.encode("User: hello there\nAssistant:")])
+    out, past = tiny_backend.generate_ids(ids, max_new_tokens=6, temperature=0.0, kv_cache=cache)
+    assert cache.seq_length() == ids.shape[1] + len(out)
+    cache.store(past)   # the as_cache() object: already written, a no-op
+    assert cache.seq_length() == ids.shape[1] + len(out)
+    with pytest.raises(RuntimeError):
+        QuantizedKVCache().as_cache(2)
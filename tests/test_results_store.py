@@ -0,0 +1,52 @@
+# tests/test_results_store.py
+
+import pytest
+
+from utils.results_store import append_results, by_cache, longest, mean_by, pick_host, read_results, select
+
+ROWS = [
+    {"host": "pc", "machine": "x86_64", "cache": "paged", "prompt_len": 16, "new_tokens": 32, "tokens_per_s": 40.5},
+    {"host": "pc", "machine": "x86_64", "cache": "none", "prompt_len": 16, "new_tokens": 32, "tokens_per_s": 42.0},
+    {"host": "pi", "machine": "aarch64", "cache": "none", "prompt_len": 16, "new_tokens": 64, "tokens_per_s": 8.5},
+]
+
+
+def test_csv_round_trip_keeps_types(tmp_path):
+    path = str(tmp_path / "results.csv")
+    append_results(path, ROWS[:2])
+    append_results(path, ROWS[2:])
+    rows = read_results(path)
+    assert rows == ROWS
+    assert isinstance(rows[0]["prompt_len"], int) and isinstance(rows[0]["tokens_per_s"], float)
+
+
+def test_new_columns_rewrite_the_csv(tmp_path):
+    path = str(tmp_path / "results.csv")
+    append_results(path, ROWS[:1])
+    append_results(path, [{**ROWS[1], "rss_peak_mb": 650.0}])
+    rows = read_results(path)
+    assert rows[0]["rss_peak_mb"] is None   # blank for the older row
+    assert rows[1]["rss_peak_mb"] == 650.0
+
+
+def test_parquet_round_trip(tmp_path):
+    pytest.importorskip("pandas")
+    pytest.importorskip("pyarrow")
+    path = str(tmp_path / "results.parquet")
+    append_results(path, ROWS[:2])
+    append_results(path, ROWS[2:])
+    assert read_results(path) == ROWS
+
+
+def test_missing_store_reads_empty(tmp_path):
+    assert read_results(str(tmp_path / "none.csv")) == []
+
+
+def test_selection_helpers():
+    assert pick_host(ROWS, pi=True) == "pi"
+    assert pick_host(ROWS, pi=False) == "pc"
+    pc = select(ROWS, host="pc", new_tokens=None)
+    assert by_cache(pc, "tokens_per_s") == (["none", "paged"], [42.0, 40.5])
+    assert mean_by(ROWS, ["prompt_len"], "tokens_per_s") == {(16,): pytest.approx((40.5 + 42.0 + 8.5) / 3)}
+    assert longest(ROWS, "new_tokens") == 64
+    assert longest([{"new_tokens": None}], "new_tokens") is None
@@ -0,0 +1,71 @@
+# tests/test_sampler.py
+
+import pytest
+import torch
+
+from inference.sampler import PREFILTER_K, Sampler, filtered_probs
+
+VOCAB = 1000
+
+
+def flat_logits(seed=0):
+    # Close to uniform: most of the mass lies outside the best PREFILTER_K tokens
+    return torch.randn(VOCAB, generator=torch.Generator().manual_seed(seed)) * 0.1
+
+
+def reference(logits, temperature, top_p=1.0, top_k=0, min_p=0.0):
+    """Full softmax + full sort, the textbook way."""
+    probs = torch.softmax(logits.float() / temperature, dim=-1)
+    sorted_probs, order = torch.sort(probs, descending=True)
+    keep = torch.ones_like(sorted_probs, dtype=torch.bool)
+    if top_k > 0:
+        keep[top_k:] = False
+    if min_p > 0.0:
+        keep &= sorted_probs >= min_p * sorted_probs[0]
+    if top_p < 1.0:
+        keep &= torch.cumsum(sorted_probs, dim=-1) <= top_p
+    keep[0] = True
+    out = torch.zeros_like(probs)
+    out[order] = sorted_probs * keep
+    return out / out.sum()
+
+
+def test_no_filter_is_the_full_softmax():
+    logits = flat_logits()
+    probs = filtered_probs(logits, 0.8, top_p=1.0, top_k=0)
+    assert int((probs > 0).sum()) == VOCAB > PREFILTER_K
+    assert torch.allclose(probs, torch.softmax(logits / 0.8, dim=-1), atol=1e-7)
+
+
+@pytest.mark.parametrize("top_p,top_k,min_p", [(0.9, 0, 0.0), (0.5, 0, 0.0), (1.0, 40, 0.0), (1.0, 0, 0.5), (0.95, 50, 0.05)])
+def test_filters_match_the_full_sort(top_p, top_k, min_p):
+    for seed in range(3):
+        logits = flat_logits(seed)
+        got = filtered_probs(logits, 0.8, top_p=top_p, top_k=top_k, min_p=min_p)
+        assert torch.allclose(got, reference(logits, 0.8, top_p, top_k, min_p), atol=1e-6)
+
+
+def test_greedy_is_one_hot():
+    logits = flat_logits()
+    probs = filtered_probs(logits, 0.0)
+    assert probs[int(torch.argmax(logits))] == 1.0 and float(probs.sum()) == 1.0
+
+
+def test_counts_follow_prompt_and_sampled_ids():
+    sampler = Sampler(temperature=0.0)
+    sampler.reset(10, [1, 1, 4])
+    sampler.observe(4)
+    sampler.observe(7)
+    assert sampler.counts.tolist() == [0, 2, 0, 0, 2, 0, 0, 1, 0, 0]
+    assert sorted(sampler._seen) == [1, 4, 7]
+
+
+def test_penalties_only_touch_seen_tokens():
+    sampler = Sampler(temperature=0.0, repetition_penalty=2.0, frequency_penalty=0.5)
+    sampler.reset(4, [0, 0, 1])
+    logits = torch.tensor([4.0, -1.0, 3.0, 2.0])
+    out = sampler._penalize(logits)
+    # 4 / 2 - 0.5 * 2 = 1.0 ; -1 * 2 - 0.5 * 1 = -2.5 ; unseen unchanged
+    assert out.tolist() == [1.0, -2.5, 3.0, 2.0]
+    assert sampler(logits) == 2   # greedy picks the best unpenalised token
+    assert sampler.counts[2] == 1
@@ -0,0 +1,70 @@
+# tests/test_session_store.py
+
+import os
+
+import torch
+
+from inference.session_store import SessionStore
+from kv_cache.sliding_window import SlidingWindowCache
+
+
+def make_store(backend, path, budget_bytes, **kwargs):
+    return SessionStore(
+        backend,
+        lambda: SlidingWindowCache(max_tokens=200),
+        budget_bytes=budget_bytes,
+        spill_dir=str(path),
+        kv_kwargs={"block_size": 4},
+        **kwargs,
+    )
+
+
+def say(store, sid, text):
+    return store.reply(sid, text, max_new_tokens=5, temperature=0.0)
+
+
+def test_spilled_session_faults_back_with_the_same_kv(tiny_backend, tmp_path):
+    store = make_store(tiny_backend, tmp_path / "small", budget_bytes=1)
+    twin = make_store(tiny_backend, tmp_path / "big", budget_bytes=1 << 30)
+
+    assert say(store, "a", "hello there") == say(twin, "a", "hello there")
+    before = [t.clone() for layer in store.get("a").kv_cache.get() for t in layer]
+    say(store, "b", "something else")   # over budget: "a" is spilled
+
+    assert "a" in store.cold and "a" not in store.hot
+    assert store.cold["a"].kv_cache.seq_length() == 0   # KV left RAM
+    assert os.path.exists(store._path("a"))
+
+    session = store.get("a")
+    after = [t for layer in session.kv_cache.get() for t in layer]
+    assert all(torch.equal(x, y) for x, y in zip(before, after))
+    assert not os.path.exists(store._path("a"))
+    assert store.stats["faults"] == 1 and store.stats["spills"] >= 1
+
+    # Resuming from the spill file continues exactly like a session that stayed in RAM
+    assert say(store, "a", "and now?") == say(twin, "a", "and now?")
+    assert session.last_prefill_tokens == twin.get("a").last_prefill_tokens
+
+
+def test_max_sessions_forgets_cold_sessions_first(tiny_backend, tmp_path):
+    store = make_store(tiny_backend, tmp_path, budget_bytes=1, max_sessions=2)
+    say(store, "a", "hi")
+    say(store, "b", "hi")   # spills "a"
+    path_a = store._path("a")
+    assert os.path.exists(path_a)
+
+    say(store, "c", "hi")   # three sessions: the cold "a" is dropped
+    assert "a" not in store and len(store) == 2
+    assert not os.path.exists(path_a)
+    assert store.stats["dropped"] == 1
+
+
+def test_spill_files_use_hashed_names_and_start_clean(tiny_backend, tmp_path):
+    (tmp_path / "stale.kv").write_bytes(b"old")
+    store = make_store(tiny_backend, tmp_path, budget_bytes=1)
+    assert not (tmp_path / "stale.kv").exists()
+
+    say(store, "../../etc/x", "hi")
+    say(store, "b", "hi")
+    path = store._path("../../etc/x")
+    assert os.path.dirname(path) == str(tmp_path) and os.path.exists(path)
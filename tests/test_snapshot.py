@@ -0,0 +1,28 @@
+# tests/test_snapshot.py
+
+import pytest
+import torch
+
+from inference.snapshot import is_snapshot, load_pretrained, load_snapshot, save_snapshot
+from inference.weight_quant import load_model
+
+
+def test_snapshot_round_trip(tiny_model_dir, tmp_path):
+    path = save_snapshot(tiny_model_dir, str(tmp_path / "tiny.snapshot"))
+    tokenizer, model, timings = load_snapshot(path)
+    ref = load_model(tiny_model_dir)
+    ids = torch.tensor([tokenizer.encode("User: hello there")])
+    with torch.no_grad():
+        assert torch.equal(model(ids).logits, ref(ids).logits)
+    assert set(timings) == {"snapshot_open_s", "tokenizer_s", "model_s"}
+    assert load_pretrained(path)[0].encode("hello") == tokenizer.encode("hello")
+
+
+def test_only_snapshot_files_are_snapshots(tiny_model_dir, tmp_path):
+    other = tmp_path / "model.gguf"
+    other.write_bytes(b"GGUF")
+    assert not is_snapshot(str(other))
+    assert not is_snapshot(tiny_model_dir)
+    assert not is_snapshot(str(tmp_path / "missing.snapshot"))
+    with pytest.raises(ValueError):
+        save_snapshot(tiny_model_dir, str(tmp_path / "model.pt"))
@@ -0,0 +1,37 @@
+# tests/test_speculative.py
+
+import torch
+
+from inference.speculative import SpeculativeDecoder
+
+
+def prompt(backend):
+    # Repetitive, so prompt lookup has n-grams to propose
+    ids = backend.encode("User: hello there\nAssistant: hello there\nUser: hello there\nAssistant:")
+    return torch.tensor([ids])
+
+
+def greedy(backend, input_ids, n):
+    ids, _ = backend.generate_ids(input_ids, max_new_tokens=n, temperature=0.0)
+    return ids
+
+
+def test_greedy_speculation_matches_plain_decoding(tiny_backend):
+    input_ids = prompt(tiny_backend)
+    expected = greedy(tiny_backend, input_ids, 24)
+    for draft in (None, tiny_backend.model):   # prompt lookup, and a draft that always agrees
+        spec = SpeculativeDecoder(tiny_backend.model, draft, k=4)
+        ids, past = tiny_backend.drain(spec.iter_ids(input_ids, max_new_tokens=24, temperature=0.0))
+        assert ids == expected
+        # The target cache holds everything except the last token
+        assert past.get_seq_length() == input_ids.shape[1] + len(ids) - 1
+    assert spec.acceptance_rate == 1.0
+
+
+def test_early_close_keeps_the_timing(tiny_backend):
+    spec = SpeculativeDecoder(tiny_backend.model, None, k=4)
+    loop = spec.iter_ids(prompt(tiny_backend), max_new_tokens=24, temperature=0.0)
+    next(loop)
+    loop.close()   # e.g. a stop string or a client disconnect
+    assert spec.stats["tokens"] >= 1
+    assert spec.stats["seconds"] > 0.0
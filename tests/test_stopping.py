@@ -0,0 +1,59 @@
+# tests/test_stopping.py
+
+from inference.stopping import StopCriteria
+
+
+class PieceTokenizer:
+    """Each id decodes to a fixed piece of text, like BPE tokens."""
+
+    def __init__(self, pieces):
+        self.pieces = pieces
+
+    def decode(self, ids, skip_special_tokens=True):
+        return "".join(self.pieces[i] for i in ids)
+
+
+PIECES = ["Hello", " there", "\n", "User", ":", " hi", "<eos>"]
+EOS = 6
+
+
+def feed(stop, ids):
+    stop.reset()
+    for i, token_id in enumerate(ids):
+        if stop.add(token_id):
+            return i
+    return None
+
+
+def test_stop_string_across_tokens():
+    stop = StopCriteria(PieceTokenizer(PIECES), stop_strings=["\nUser:"])
+    # "\n" + "User" + ":" only matches once ":" arrives
+    assert feed(stop, [0, 1, 2, 3, 4, 5]) == 4
+    assert stop.reason == "stop_string"
+    assert stop.keep == 2   # "Hello there", cut right before "\n"
+
+
+def test_safe_holds_back_a_possible_stop_string():
+    stop = StopCriteria(PieceTokenizer(PIECES), stop_strings=["\nUser:"])
+    stop.reset()
+    for token_id in [0, 1, 2, 3]:
+        assert not stop.add(token_id)
+    assert stop.safe == 2   # "\nUser" may still become "\nUser:"
+    assert stop.keep == 4
+    assert not stop.add(5)  # " hi": no stop string after all
+    assert stop.safe == 5
+
+
+def test_eos_is_not_kept():
+    stop = StopCriteria(PieceTokenizer(PIECES), eos_ids=[EOS])
+    assert feed(stop, [0, 1, EOS, 5]) == 2
+    assert stop.reason == "eos"
+    assert stop.keep == 2
+
+
+def test_reset_starts_a_new_reply():
+    stop = StopCriteria(PieceTokenizer(PIECES), eos_ids=[EOS], stop_strings=["\nUser:"])
+    feed(stop, [2, 3, 4])
+    assert feed(stop, [0, 1]) is None
+    assert stop.reason is None
+    assert stop.keep == 2
@@ -0,0 +1,98 @@
+# tests/test_turn_history.py
+
+from kv_cache.paged_cache import PagedCache
+from kv_cache.sliding_window import SlidingWindowCache
+from kv_cache.turn_history import TurnHistory
+
+
+class CharBackend:
+    """One token per character; counts encode() calls."""
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, text):
+        self.encoded.append(text)
+        return [ord(c) for c in text]
+
+    def decode(self, ids):
+        return "".join(chr(i) for i in ids)
+
+
+def turn(user, assistant):
+    return f"User: {user}\nAssistant:{assistant}"
+
+
+def history_with(turns):
+    h = TurnHistory()
+    for u, a in turns:
+        h.add_turn(u, a)
+    return h
+
+
+TURNS = [("a", " one"), ("bb", " two"), ("ccc", " three")]
+
+
+def test_everything_fits():
+    b = CharBackend()
+    h = history_with(TURNS)
+    new = b.encode("User: hi\nAssistant:")
+    ids = h._fit(b, new, max_tokens=1000)
+    assert b.decode(ids) == "".join(turn(u, a) + "\n" for u, a in TURNS) + "User: hi\nAssistant:"
+    assert len(h.turns) == 3
+
+
+def test_oldest_turns_are_dropped_to_fit():
+    b = CharBackend()
+    h = history_with(TURNS)
+    new = b.encode("User: hi\nAssistant:")
+    # Room for the new turn and the newest old turn (+ its separator) only
+    budget = len(new) + len(turn(*TURNS[2])) + 1
+    ids = h._fit(b, new, max_tokens=budget)
+    assert h.turns == TURNS[2:]
+    assert b.decode(ids) == turn(*TURNS[2]) + "\nUser: hi\nAssistant:"
+
+    # One token short: the newest old turn goes too
+    h = history_with(TURNS)
+    ids = h._fit(b, new, max_tokens=budget - 1)
+    assert h.turns == [] and ids == new
+
+
+def test_max_turns():
+    b = CharBackend()
+    h = history_with(TURNS)
+    h._fit(b, [], max_turns=2)
+    assert h.turns == TURNS[1:]
+
+
+def test_huge_message_keeps_its_tail_when_truncating():
+    b = CharBackend()
+    h = history_with(TURNS)
+    new = b.encode("x" * 50 + "END")
+    assert h._fit(b, new, max_tokens=10, truncate=True) == new[-10:]
+    assert h.turns == []
+    assert len(history_with(TURNS)._fit(b, new, max_tokens=10)) == len(new)   # no truncate
+
+
+def test_turns_are_encoded_once_and_reply_ids_reused():
+    b = CharBackend()
+    h = TurnHistory()
+    h.add_turn("a", " one")
+    h.add_turn("bb", " two", reply_ids=b.encode(" two"))
+    b.encoded.clear()
+    for _ in range(3):
+        h._fit(b, [], max_tokens=1000)
+    # Separator once, then each turn once; the reply with known ids is not re-encoded
+    assert sorted(b.encoded) == sorted(["\n", "User: a\nAssistant:", " one", "User: bb\nAssistant:"])
+
+
+def test_caches_build_on_fit():
+    b = CharBackend()
+    sliding = SlidingWindowCache(max_tokens=40)
+    paged = PagedCache(max_turns=2)
+    for h in (sliding, paged):
+        for u, a in TURNS:
+            h.add_turn(u, a)
+    assert len(sliding.build_prompt_ids(b, "hi")) <= 40
+    assert paged.turns == TURNS[1:]   # max_turns applies on add
+    assert paged.build_prompt(b, "hi").endswith("User: hi\nAssistant:")
@@ -0,0 +1,67 @@
+# tests/test_weight_quant.py
+
+import pytest
+import torch
+from torch import nn
+
+from inference.weight_quant import empty_model, load_int8, load_model, save_int8
+
+
+class GPT2Attention(nn.Module):
+    """Stand-in for the transformers 4.x GPT-2 attention and its non-persistent mask."""
+
+    def __init__(self):
+        super().__init__()
+        self.c_attn = nn.Linear(4, 12)
+        self.register_buffer("bias", torch.tril(torch.ones((8, 8), dtype=torch.bool)).view(1, 1, 8, 8), persistent=False)
+        self.register_buffer("masked_bias", torch.tensor(-1e4), persistent=False)
+
+
+class Model(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.config = type("Config", (), {"max_position_embeddings": 8})()
+        self.attn = GPT2Attention()
+
+
+class Unknown(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.register_buffer("table", torch.arange(4.0), persistent=False)
+
+
+def test_empty_model_keeps_params_on_meta_and_rebuilds_buffers():
+    model = empty_model(Model)
+    assert model.attn.c_attn.weight.device.type == "meta"
+    assert torch.equal(model.attn.bias, Model().attn.bias)
+    assert float(model.attn.masked_bias) == -1e4
+
+
+def test_empty_model_rebuilds_rotary_tables():
+    transformers = pytest.importorskip("transformers")
+    config = transformers.LlamaConfig(
+        vocab_size=64, hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+        num_attention_heads=4, num_key_value_heads=2, max_position_embeddings=64,
+    )
+    torch.manual_seed(0)
+    ref = transformers.LlamaForCausalLM(config).eval()
+    model = empty_model(lambda: transformers.LlamaForCausalLM(config))
+    model.load_state_dict(ref.state_dict(), assign=True)
+    model.tie_weights()
+    ids = torch.tensor([[1, 5, 9, 2, 7]])
+    with torch.no_grad():
+        assert torch.allclose(model.eval()(ids).logits, ref(ids).logits, atol=1e-5)
+
+
+def test_empty_model_refuses_buffers_it_cannot_rebuild():
+    with pytest.raises(RuntimeError):
+        empty_model(Unknown)
+
+
+def test_load_int8_matches_quantizing_in_place(tiny_model_dir, tmp_path):
+    save_int8(tiny_model_dir, str(tmp_path / "int8"))
+    loaded = load_int8(str(tmp_path / "int8"))
+    direct = load_model(tiny_model_dir, "int8")
+    ids = torch.tensor([[1, 5, 9, 2, 7]])
+    with torch.no_grad():
+        assert torch.allclose(loaded(ids).logits, direct(ids).logits, atol=1e-5)